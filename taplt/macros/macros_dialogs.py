@@ -1,8 +1,9 @@
-from PySide6.QtWidgets import QDialog, QVBoxLayout, QLabel, QPushButton, QMessageBox, QTableWidget, QTableWidgetItem
-from PySide6.QtCore import QSize, Qt
+from PySide6.QtWidgets import QDialog, QVBoxLayout, QLabel, QPushButton, QMessageBox, QTableView, QLineEdit
+from PySide6.QtCore import QSize, Qt, QAbstractTableModel, QModelIndex, QTimer
 from PySide6.QtGui import QFont
 
 from pathlib import Path
+from taplt.utils.database import TablePreview
 from taplt.utils.stylesheets import BUTTON_STYLESHEET
 
 
@@ -45,37 +46,107 @@ class ExampleProjectMessageBox(QMessageBox):
         self.setIcon(QMessageBox.Icon.Information)
 
 
+class PreviewTableModel(QAbstractTableModel):
+    """ the rows of a database table, fetched page by page from a cursor while the table is scrolled;
+    sorting and filtering re-run the query in the database"""
+    PAGE_SIZE = 500
+
+    def __init__(self, preview: TablePreview):
+        super(PreviewTableModel, self).__init__()
+        self.preview = preview
+        self.search = ""
+        self.sort_column = None
+        self.descending = False
+        self.rows = list()
+        self.cursor = None
+        self.reset()
+
+    def canFetchMore(self, parent: QModelIndex = QModelIndex()) -> bool:
+        return not parent.isValid() and self.cursor is not None
+
+    def columnCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.preview.columns)
+
+    def data(self, index: QModelIndex, role: int = Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or role != Qt.ItemDataRole.DisplayRole:
+            return None
+        cell = self.rows[index.row()][index.column()]
+        if self.preview.blobs[index.column()]:
+            return "BLOB ({} bytes)".format(cell) if cell is not None else "None"
+        return "BLOB" if isinstance(cell, bytes) else str(cell)
+
+    def fetchMore(self, parent: QModelIndex = QModelIndex()):
+        if not self.canFetchMore(parent):
+            return
+        rows = self.cursor.fetchmany(self.PAGE_SIZE)
+        if len(rows) < self.PAGE_SIZE:
+            self.cursor = None
+        if rows:
+            self.beginInsertRows(QModelIndex(), len(self.rows), len(self.rows) + len(rows) - 1)
+            self.rows.extend(rows)
+            self.endInsertRows()
+
+    def headerData(self, section: int, orientation: Qt.Orientation, role: int = Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
+            return self.preview.columns[section]
+        return super(PreviewTableModel, self).headerData(section, orientation, role)
+
+    def reset(self):
+        """ runs the query again and fetches its first page"""
+        self.beginResetModel()
+        self.rows = list()
+        self.cursor = self.preview.query(self.sort_column, self.descending, self.search)
+        self.endResetModel()
+        self.fetchMore()
+
+    def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.rows)
+
+    def set_search(self, text: str):
+        """ only lists the rows containing the text"""
+        self.search = text
+        self.reset()
+
+    def sort(self, column: int, order: Qt.SortOrder = Qt.SortOrder.AscendingOrder):
+        self.sort_column = column
+        self.descending = order == Qt.SortOrder.DescendingOrder
+        self.reset()
+
+
 class PreviewDatabaseDialog(QDialog):
     """displays the content of the specified database table"""
 
-    def __init__(self, headers: list, content: list):
+    # milliseconds without typing before the search is applied
+    SEARCH_DELAY = 250
+
+    def __init__(self, preview: TablePreview):
         super(PreviewDatabaseDialog, self).__init__()
         self.setLayout(QVBoxLayout())
+        self.setWindowTitle(preview.table_name)
 
-        num_rows = len(content)
-        num_cols = len(headers)
-
-        self.table = QTableWidget()
-        self.table.setRowCount(num_rows)
-        self.table.setColumnCount(num_cols)
-        self.table.setHorizontalHeaderLabels(headers)
-
-        for i in range(num_rows):
-            row = content[i]
-            for j in range(num_cols):
-                cell = row[j]
-                if isinstance(cell, bytes):
-                    cell = "BLOB"
-                else:
-                    cell = str(cell)
-                item = QTableWidgetItem(cell)
-                self.table.setItem(i, j, item)
+        self.search_field = QLineEdit()
+        self.search_field.setPlaceholderText("Search")
+        self.search_timer = QTimer()
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(self.SEARCH_DELAY)
+
+        self.model = PreviewTableModel(preview)
+        self.table = QTableView()
+        self.table.setModel(self.model)
+        # start in the order of insertion, the first column is the uid of every table
+        self.table.horizontalHeader().setSortIndicator(0, Qt.SortOrder.AscendingOrder)
+        self.table.setSortingEnabled(True)
 
         self.button = QPushButton("Close")
         self.button.setStyleSheet(BUTTON_STYLESHEET)
         self.button.setFixedSize(80, 60)
         self.button.pressed.connect(self.close)
 
+        self.search_field.textChanged.connect(self.search_timer.start)
+        self.search_timer.timeout.connect(lambda: self.model.set_search(self.search_field.text()))
+        self.finished.connect(preview.close)
+
+        self.layout().addWidget(self.search_field)
         self.layout().addWidget(self.table)
         self.layout().addWidget(self.button)
         self.layout().setAlignment(self.button, Qt.AlignmentFlag.AlignCenter)
@@ -1,3 +1,5 @@
+from PySide6.QtCore import Qt, QThread, QCoreApplication, QMetaObject
+
 from taplt.utils.database import SQLiteDatabase
 from taplt.ui.main_window import LabelingMainWindow
 
@@ -7,7 +9,14 @@ class MainLogic:
 
         # active elements
         self.main_window = LabelingMainWindow()
+
+        # the database runs in its own thread, so queries and saves do not block the gui
+        self.database_thread = QThread()
         self.database = SQLiteDatabase()
+        self.database.moveToThread(self.database_thread)
+        self.database_thread.start()
+        QCoreApplication.instance().aboutToQuit.connect(self.shutdown)
+
         self.connect_events()
 
         self.main_window.show()
@@ -15,21 +24,33 @@ class MainLogic:
     def connect_events(self):
 
         # main window -> database
+        # all connections to the database are queued, the requests are handled in the order they are emitted
         self.main_window.file_display.hide_button.clicked.connect(self.main_window.hide_toolbar)
         self.main_window.sCreateNewProject.connect(self.database.initialize)
         self.main_window.sOpenProject.connect(self.database.initialize)
         self.main_window.sSaveToDatabase.connect(self.database.save)
         self.main_window.sAddFile.connect(self.database.add_file)
+        self.main_window.sImportFiles.connect(self.database.import_files)
+        self.main_window.sCancelImport.connect(self.database.cancel_import)
         self.main_window.sAddPatient.connect(self.database.add_patient)
-        self.main_window.sRequestUpdate.connect(self.database.update_gui)
+        self.main_window.sRequestFile.connect(self.database.count_file_request, Qt.ConnectionType.DirectConnection)
+        self.main_window.sRequestFile.connect(self.database.load_file)
+        self.main_window.sPrefetch.connect(self.database.prefetch)
         self.main_window.sDeleteFile.connect(self.database.delete_file)
         self.main_window.sUpdateSettings.connect(self.database.update_settings)
-        self.main_window.sDisconnect.connect(self.disconnect)
+        self.main_window.sDisconnect.connect(self.database.close)
 
-        # main window's menubar -> database
+        # main window's menubar -> database; previews use their own read connections and bypass the queue
         self.main_window.menubar.sRequestImport.connect(self.database.send_import_info)
         self.main_window.menubar.sRequestSettings.connect(self.database.open_settings)
-        self.main_window.menubar.sPreviewDatabase.connect(self.database.preview_database)
+        self.main_window.menubar.sPreviewDatabase.connect(self.database.preview_database,
+                                                          Qt.ConnectionType.DirectConnection)
+
+        # the file list and the search read on the read connections as well, directly from the gui thread
+        self.main_window.file_list.set_page_source(self.database.get_file_page, self.database.search_files,
+                                                  self.database.get_previous_files)
+        self.main_window.search = self.database.search
+        self.main_window.file_list.set_thumbnail_source(self.database.thumbnails.pixmap)
 
         # macros -> database
         # self.main_window.macros.sNewProject.connect(self.database.initialize)
@@ -40,9 +61,10 @@ class MainLogic:
         self.database.sOpenSettings.connect(self.main_window.open_settings)
         self.database.sApplySettings.connect(self.main_window.apply_settings)
         self.database.sPreviewDatabase.connect(self.main_window.preview_database)
+        self.database.thumbnails.sThumbnailReady.connect(self.main_window.file_list.refresh_thumbnail)
 
-    def disconnect(self):
-        """disconnects the main window from the database when user closes a project
-        - not really necessary rn, but may prevent errors in the future"""
-        self.database = SQLiteDatabase()
-        self.connect_events()
+    def shutdown(self):
+        """closes the database inside its thread and stops the thread when the application quits"""
+        QMetaObject.invokeMethod(self.database, "close", Qt.ConnectionType.BlockingQueuedConnection)
+        self.database_thread.quit()
+        self.database_thread.wait()
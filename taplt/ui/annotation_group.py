@@ -5,11 +5,19 @@ from dataclasses import dataclass
 
 from taplt.utils.qt import colormap_rgb
 from taplt.ui.shape import Shape
+from taplt.ui.annotation_layer import AnnotationLayer
+from taplt.ui.drawing_overlay import DrawingOverlay
+from taplt.utils.spatial_index import GridIndex
 from taplt.ui.dialogs import NewLabelDialog, DeleteShapeMessageBox
 
 
 class AnnotationGroup(QGraphicsObject):
-    """ A group for managing annotation objects and their signals with a scene """
+    """ A group for managing annotation objects within a scene; the shapes are plain QGraphicsItems
+    which call the shape_* handlers of their group, the group emits the signals for all of them.
+
+    shapes nobody interacts with are taken out of the scene and drawn by an AnnotationLayer in batches; only the
+    shapes which are hovered, selected, edited or drawn are items of the scene. the vertex bounds of all shapes
+    are kept in a spatial index, which answers the hit tests for the shapes of the layer """
     item_highlighted = Signal(Shape)
     item_dehighlighted = Signal(Shape)
     updateShapes = Signal(list)
@@ -26,9 +34,16 @@ class AnnotationGroup(QGraphicsObject):
     def __init__(self):
         QGraphicsObject.__init__(self)
         self.annotations = {}  # type: Dict[int, Shape]
+        self.keys = {}  # type: Dict[int, int]
+        self.index = GridIndex()
+        self.layer = AnnotationLayer()
+        self.layer.setParentItem(self)
+        self.layer.setZValue(-1)
+        self.interactive = {}  # type: Dict[int, Shape]
         self.classes = list()
         self.setAcceptHoverEvents(True)
         self.temp_shape: Shape = None
+        self.overlay: Optional[DrawingOverlay] = None
         self._num_colors = 10  # TODO: This needs to be updated based on what's in the image.
         self.color_map, new_color = colormap_rgb(n=self._num_colors)  # have a buffer for new classes
         self.draw_new_color = new_color
@@ -36,6 +51,12 @@ class AnnotationGroup(QGraphicsObject):
         self.shapeType = Shape.ShapeType.POLYGON
         self.drawing = False
 
+        # database uids of removed shapes and saved shapes still waiting for their uid
+        self.deleted = list()  # type: List[int]
+        self.pending = list()  # type: List[Shape]
+        # ids of pending shapes removed before their uid arrived, their rows are deleted on the next save
+        self.discarded = set()  # type: Set[int]
+
     def boundingRect(self):
         return self.childrenBoundingRect()
 
@@ -56,10 +77,11 @@ class AnnotationGroup(QGraphicsObject):
                                     shape_type=self.shapeType,
                                     mode=Shape.ShapeMode.CREATE,
                                     color=self.draw_new_color)
-            self.add_shapes(self.temp_shape)
-            self.temp_shape.drawingDone.connect(self.set_drawing_to_false)
+            # the shape joins the group once it is finished, until then the overlay takes the input
+            self.overlay = DrawingOverlay(self.temp_shape, QRectF(0, 0, s.width(), s.height()))
+            self.overlay.setParentItem(self)
             self.sToolTip.emit("Press right click to end the annotation.")
-            self.temp_shape.grabMouse()
+            self.overlay.grabMouse()
         else:
             pass
 
@@ -78,22 +100,61 @@ class AnnotationGroup(QGraphicsObject):
         """
         if isinstance(new_shapes, Shape):
             new_shapes = [new_shapes]
+        new_id = max(self.annotations.keys(), default=-1) + 1
+        idle = list()
         for shape in new_shapes:
-            shape.setParentItem(self)
-            new_id = 0 if not self.annotations else max(self.annotations.keys()) + 1
+            shape.group = self
             self.annotations[new_id] = shape
-            shape.selected.connect(self.shape_selected)
-            shape.deleted.connect(lambda: self.remove_shapes(shape))
-            shape.mode_changed.connect(self.shape_mode_changed)
-            shape.drawingDone.connect(self.set_label)
-            shape.sChange.connect(self.sChange.emit)
-            self.update()
+            self.keys[id(shape)] = new_id
+            self.index.insert(new_id, shape.vertices.bounding_rect())
+            new_id += 1
+            if self.is_idle(shape):
+                self.detach(shape)
+                idle.append(shape)
+            else:
+                shape.setParentItem(self)
+                self.interactive[id(shape)] = shape
+        self.layer.add(idle)
+        self.update()
+
+    def assign_uids(self, uids: List[int]):
+        """hands out the database uids to the shapes created since the last save, in the order they were saved;
+        the uids of shapes removed in the meantime are marked as deleted instead"""
+        for shape, uid in zip(self.pending, uids):
+            if id(shape) in self.discarded:
+                self.deleted.append(uid)
+            else:
+                shape.uid = uid
+        self.pending.clear()
+        self.discarded.clear()
 
     def deselect_all(self):
-        """deselects all shapes"""
-        for shape in self.annotations.values():
+        """deselects all shapes, only the interactive ones can be selected"""
+        for shape in list(self.interactive.values()):
             shape.setSelected(False)
 
+    @staticmethod
+    def detach(item: QGraphicsItem):
+        """takes a shape or the overlay out of the scene"""
+        scene = item.scene()
+        if scene is not None:
+            scene.removeItem(item)
+        elif item.parentItem() is not None:
+            item.setParentItem(None)
+
+    @staticmethod
+    def is_idle(shape: Shape) -> bool:
+        """whether nobody interacts with a shape, so the layer can draw it"""
+        return shape.mode == Shape.ShapeMode.FIXED and not shape.isSelected() and not shape.is_highlighted
+
+    def release_idle_shapes(self):
+        """takes the interactive shapes which became idle out of the scene and lets the layer draw them"""
+        idle = [shape for shape in self.interactive.values() if self.is_idle(shape)]
+        for shape in idle:
+            del self.interactive[id(shape)]
+            self.detach(shape)
+        self.layer.add(idle)
+
     def remove_shapes(self, shapes: Union[Shape, List[Shape]]):
         """
         Remove shapes from the group and scene if connected to one.
@@ -109,12 +170,27 @@ class AnnotationGroup(QGraphicsObject):
                 return
             shapes = [shapes]
             self.sChange.emit(1)
-        ids_to_remove = []
-        for shape_id in self.annotations:
-            if self.annotations[shape_id] in shapes:
-                ids_to_remove.append(shape_id)
-                self.annotations[shape_id].deleteLater()
-        [(self.annotations[x].disconnect(self.annotations[x]), self.annotations.pop(x)) for x in ids_to_remove]
+        ids_to_remove = sorted({self.keys[id(shape)] for shape in shapes if id(shape) in self.keys})
+        pending = {id(shape) for shape in self.pending}
+        for shape_id in ids_to_remove:
+            shape = self.annotations[shape_id]
+            if shape.uid is not None:
+                self.deleted.append(shape.uid)
+            elif id(shape) in pending:
+                # saved, but its uid did not arrive yet
+                self.discarded.add(id(shape))
+        if len(ids_to_remove) == len(self.annotations):
+            self.layer.clear()
+            self.index.clear()
+        else:
+            self.layer.remove([self.annotations[shape_id] for shape_id in ids_to_remove])
+        for shape_id in ids_to_remove:
+            shape = self.annotations.pop(shape_id)
+            del self.keys[id(shape)]
+            self.index.remove(shape_id)
+            self.interactive.pop(id(shape), None)
+            shape.group = None
+            self.detach(shape)
         self.updateShapes.emit(list(self.annotations.values()))
 
     def clear(self):
@@ -122,21 +198,91 @@ class AnnotationGroup(QGraphicsObject):
         Clears the group and scene of shapes
         :return:
         """
+        if self.overlay is not None:
+            # a shape which is still being drawn is dropped
+            self.remove_overlay()
+            self.set_drawing_to_false()
         self.remove_shapes(list(self.annotations.values()))
 
-    def shape_selected(self):
-        """gets the index of the selected shape and emits it"""
-        shape = self.sender()
-        for ann_id, ann in self.annotations.items():
-            if ann != shape:
+    def remove_overlay(self):
+        """takes the overlay out of the scene, which also releases the mouse"""
+        if self.overlay is not None:
+            self.detach(self.overlay)
+            self.overlay = None
+
+    def take_changes(self) -> Tuple[List[dict], List[dict], List[int]]:
+        """
+        collects all changes since the last save and marks the shapes as stored
+        :return: the dictionaries of created and modified shapes and the uids of deleted shapes
+        """
+        created, modified = list(), list()
+        for shape in self.annotations.values():
+            if shape.label is None:
+                continue  # still being drawn
+            if shape.state == Shape.ShapeState.CREATED:
+                created.append(shape.to_dict()[0])
+                self.pending.append(shape)
+            elif shape.state == Shape.ShapeState.MODIFIED and shape.uid is not None:
+                modified.append(shape.to_dict()[0])
+            else:
+                continue
+            shape.state = Shape.ShapeState.STORED
+        deleted, self.deleted = self.deleted, list()
+        return created, modified, deleted
+
+    def shape_activated(self, shape: Shape):
+        """puts a shape drawn by the layer back into the scene as an interactive item, e.g. when the mouse enters it"""
+        if self.layer.remove([shape]):
+            self.interactive[id(shape)] = shape
+            shape.setParentItem(self)
+
+    def shape_at(self, pos: QPointF) -> Optional[Shape]:
+        """the shape added last among those containing a position, None if there is none"""
+        for key in sorted(self.index.query_point(pos), reverse=True):
+            shape = self.annotations.get(key)
+            if shape is not None and shape.contains(pos):
+                return shape
+        return None
+
+    def shape_changed(self, shape: Shape, change: int):
+        """a shape was edited by the user"""
+        self.update_index(shape)
+        self.sChange.emit(change)
+
+    def shape_deleted(self, shape: Shape):
+        """the user asked to delete a shape from its context menu"""
+        self.remove_shapes(shape)
+
+    def shape_deselected(self, shape: Shape):
+        self.release_idle_shapes()
+
+    def shape_drawing_done(self, shape: Shape):
+        """the user finished drawing the new shape, which needs a label now"""
+        self.remove_overlay()
+        self.add_shapes(shape)
+        self.set_label()
+        self.set_drawing_to_false()
+
+    def shape_highlighted(self, shape: Shape, highlighted: bool):
+        """the mouse entered or left a shape"""
+        if highlighted:
+            self.item_highlighted.emit(shape)
+        else:
+            self.item_dehighlighted.emit(shape)
+            self.release_idle_shapes()
+
+    def shape_selected(self, shape: Shape):
+        """deselects all other shapes and emits the selected one"""
+        for ann in list(self.interactive.values()):
+            if ann is not shape:
                 ann.setSelected(False)
         self.shapeSelected.emit(shape)
 
-    @Slot(int)
-    def shape_mode_changed(self, mode: Union[int, Shape.ShapeMode]):
-        shape = self.sender()  # type: Shape
+    def shape_mode_changed(self, shape: Shape, mode: Union[int, Shape.ShapeMode]):
         if mode == Shape.ShapeMode.FIXED:
             shape.update_color(self.color_map[shape.group_id])
+            self.update_index(shape)
+            self.release_idle_shapes()
 
     def set_label(self):
         """
@@ -172,12 +318,18 @@ class AnnotationGroup(QGraphicsObject):
         self.shapeType = type_of_shape
         
 
+    def update_index(self, shape: Shape):
+        """stores the current vertex bounds of a shape after they changed, e.g. by drawing or moving it"""
+        if id(shape) in self.keys:
+            self.index.insert(self.keys[id(shape)], shape.vertices.bounding_rect())
+
     def update_annotations(self, current_labels: List[Shape]):
         self.clear()
+        self.deleted.clear()
+        self.pending.clear()
+        self.discarded.clear()
 
-        # for some reason, bugs emerge when you pass the labels as a list
-        for lbl in current_labels:
-            self.add_shapes(lbl)
+        self.add_shapes(current_labels)
         self.updateShapes.emit(current_labels)
 
 
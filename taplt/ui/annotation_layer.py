@@ -0,0 +1,228 @@
+from PySide6.QtWidgets import QGraphicsItem, QStyleOptionGraphicsItem, QWidget, QGraphicsSceneHoverEvent
+from PySide6.QtGui import QBrush, QColor, QPainter, QPainterPath, QPen, QPolygonF
+from PySide6.QtCore import QRectF, Qt
+
+import math
+from typing import Dict, List, Optional, Tuple
+
+from taplt.config import VERTEX_SIZE
+from taplt.ui.shape import Shape
+from taplt.utils.spatial_index import cell_range
+
+
+class LayerCell(object):
+    """the shapes of one label class within a square of the image, with their outlines cached as painter paths"""
+    __slots__ = ('shapes', 'bounds', 'outlines', 'vertices')
+
+    def __init__(self):
+        self.shapes = {}  # type: Dict[int, Shape]
+        self.bounds = QRectF()
+        self.outlines = {}  # type: Dict[int, Tuple[QPainterPath, QPolygonF]]
+        self.vertices = None  # type: Optional[QPainterPath]
+
+    def add(self, shape: Shape, rect: QRectF):
+        self.shapes[id(shape)] = shape
+        self.bounds = self.bounds.united(rect)
+        self.invalidate()
+
+    def invalidate(self):
+        self.outlines.clear()
+        self.vertices = None
+
+    def outline(self, level: int) -> Tuple[QPainterPath, QPolygonF]:
+        """
+        the outlines of the shapes at a level of detail, built once per level
+        :param level: the zoom rounded down to a power of two, see AnnotationLayer.level_for
+        :return: the outlines of the shapes large enough to be seen and the centers of the others
+        """
+        if level not in self.outlines:
+            path, points = QPainterPath(), QPolygonF()
+            min_size = AnnotationLayer.POINT_SIZE / 2 ** level
+            for shape in self.shapes.values():
+                rect = shape.boundingRect()
+                if max(rect.width(), rect.height()) < min_size:
+                    points.append(rect.center())
+                else:
+                    shape.add_outline(path)
+            self.outlines[level] = (path, points)
+        return self.outlines[level]
+
+    def remove(self, shape: Shape):
+        """removes a shape, the bounds are only recomputed once the cell is empty"""
+        del self.shapes[id(shape)]
+        if not self.shapes:
+            self.bounds = QRectF()
+        self.invalidate()
+
+    def vertex_path(self) -> QPainterPath:
+        """the squares marking the vertices of the polygons and traces, which do not depend on the zoom"""
+        if self.vertices is None:
+            self.vertices = QPainterPath()
+            # squares of neighbouring vertices overlap, which would cut holes with the default odd even fill
+            self.vertices.setFillRule(Qt.FillRule.WindingFill)
+            for shape in self.shapes.values():
+                if shape.shape_type in ('polygon', 'trace'):
+                    size = shape.vertex_size / 2
+                    for x, y in shape.vertices.coords.tolist():
+                        self.vertices.addRect(x - size, y - size, 2 * size, 2 * size)
+        return self.vertices
+
+
+class LayerBatch(object):
+    """the cells of all shapes of one label class, which share their pens and brushes"""
+    __slots__ = ('pen', 'vertex_pen', 'vertex_brush', 'point_pen', 'cells')
+
+    def __init__(self, line_color: QColor, brush_color: QColor):
+        self.pen = QPen(line_color, 1)
+        self.vertex_pen = QPen(line_color, 0.5)
+        self.vertex_brush = QBrush(brush_color)
+        self.point_pen = QPen(line_color, AnnotationLayer.POINT_SIZE)
+        self.point_pen.setCosmetic(True)
+        self.cells = {}  # type: Dict[Tuple[int, int], LayerCell]
+
+
+class AnnotationLayer(QGraphicsItem):
+    """ draws the shapes of an AnnotationGroup nobody interacts with, instead of the shapes themselves
+
+    the shapes are batched by label class and by cells of the image, each cell caches the outlines of its shapes as
+    one painter path; paint only draws the cells in view, one pass per class. zoomed out, the vertices are left out
+    and shapes smaller than a few pixels are drawn as points. shapes under the mouse, selected, edited or drawn
+    are handed back to the group, which shows them as interactive items again"""
+
+    # edge length of the cells in image pixels
+    CELL_SIZE = 1024
+    # shapes smaller than this on screen are drawn as points of this size, in pixels
+    POINT_SIZE = 2
+    # vertices smaller than this on screen are not drawn, in pixels
+    MIN_VERTEX_SIZE = 2
+    # coarsest level of detail whose outlines are cached separately, finer levels share the outlines of level 0
+    MIN_LEVEL = -16
+
+    def __init__(self):
+        super(AnnotationLayer, self).__init__()
+        self.setFlag(QGraphicsItem.GraphicsItemFlag.ItemUsesExtendedStyleOption)
+        self.setAcceptHoverEvents(True)
+        self.batches = {}  # type: Dict[int, LayerBatch]
+        self.located = {}  # type: Dict[int, Tuple[int, Tuple[int, int]]]
+        self.bounds = QRectF()
+        # half the size of the largest shape, i.e. how far a shape reaches out of the cell of its center
+        self.reach = 0.0
+
+    def __contains__(self, shape: Shape) -> bool:
+        return id(shape) in self.located
+
+    def add(self, shapes: List[Shape]):
+        """draws the shapes from now on, the caller takes them out of the scene"""
+        changed = QRectF()
+        for shape in shapes:
+            rect = shape.boundingRect()
+            key = shape.line_color.rgba()
+            if key not in self.batches:
+                self.batches[key] = LayerBatch(shape.line_color, shape.brush_color)
+            center = rect.center()
+            cell_key = (int(center.x() // self.CELL_SIZE), int(center.y() // self.CELL_SIZE))
+            cells = self.batches[key].cells
+            if cell_key not in cells:
+                cells[cell_key] = LayerCell()
+            cells[cell_key].add(shape, rect)
+            self.reach = max(self.reach, rect.width() / 2, rect.height() / 2)
+            self.located[id(shape)] = (key, cell_key)
+            changed = changed.united(rect)
+        self.update_bounds(changed)
+
+    def boundingRect(self) -> QRectF:
+        return self.bounds
+
+    def clear(self):
+        self.prepareGeometryChange()
+        self.batches.clear()
+        self.located.clear()
+        self.bounds = QRectF()
+        self.reach = 0.0
+
+    def hoverMoveEvent(self, event: QGraphicsSceneHoverEvent):
+        """hands the shape under the mouse to the group, so it gets highlighted and can be clicked"""
+        group = self.parentItem()
+        if group is not None:
+            group.release_idle_shapes()
+            shape = group.shape_at(event.pos())
+            if shape is not None:
+                group.shape_activated(shape)
+        event.ignore()
+        super(AnnotationLayer, self).hoverMoveEvent(event)
+
+    @classmethod
+    def level_for(cls, level_of_detail: float) -> int:
+        """the zoom rounded down to a power of two, the outlines are cached per level"""
+        if level_of_detail <= 0:
+            return cls.MIN_LEVEL
+        return min(max(int(math.floor(math.log2(level_of_detail))), cls.MIN_LEVEL), 0)
+
+    @staticmethod
+    def margin(rect: QRectF) -> QRectF:
+        """a rect of shapes including their vertices and pens"""
+        return rect.adjusted(-VERTEX_SIZE, -VERTEX_SIZE, VERTEX_SIZE, VERTEX_SIZE) if rect.isValid() else rect
+
+    def paint(self, painter: QPainter, option: QStyleOptionGraphicsItem, widget: QWidget = None):
+        level_of_detail = option.levelOfDetailFromTransform(painter.worldTransform())
+        level = self.level_for(level_of_detail)
+        draw_vertices = VERTEX_SIZE * level_of_detail >= self.MIN_VERTEX_SIZE
+        # the exposed rect covers the whole item when the scene is rendered outside of a view
+        exposed = option.exposedRect & painter.worldTransform().inverted()[0].mapRect(QRectF(painter.viewport()))
+        for batch in self.batches.values():
+            cells = self.visible_cells(batch, exposed)
+            if not cells:
+                continue
+            outlines = [cell.outline(level) for cell in cells]
+            painter.setPen(batch.pen)
+            painter.setBrush(QBrush())
+            for path, _ in outlines:
+                painter.drawPath(path)
+            painter.setPen(batch.point_pen)
+            for _, points in outlines:
+                if not points.isEmpty():
+                    painter.drawPoints(points)
+            if draw_vertices:
+                painter.setPen(batch.vertex_pen)
+                painter.setBrush(batch.vertex_brush)
+                for cell in cells:
+                    painter.drawPath(cell.vertex_path())
+
+    def remove(self, shapes: List[Shape]) -> List[Shape]:
+        """stops drawing the shapes and returns those which were drawn here, the caller puts them into the scene"""
+        removed = list()
+        changed = QRectF()
+        for shape in shapes:
+            location = self.located.pop(id(shape), None)
+            if location is None:
+                continue
+            key, cell_key = location
+            cells = self.batches[key].cells
+            cell = cells[cell_key]
+            changed = changed.united(cell.bounds)
+            cell.remove(shape)
+            if not cell.shapes:
+                del cells[cell_key]
+                if not cells:
+                    del self.batches[key]
+            removed.append(shape)
+        if removed:
+            self.update(self.margin(changed))
+        return removed
+
+    def update_bounds(self, rect: QRectF):
+        """grows the bounding rect by the vertices drawn at the border of the shapes and repaints the area"""
+        rect = self.margin(rect)
+        if not self.bounds.contains(rect):
+            self.prepareGeometryChange()
+            self.bounds = self.bounds.united(rect)
+        self.update(rect)
+
+    def visible_cells(self, batch: LayerBatch, rect: QRectF) -> List[LayerCell]:
+        """the cells of a batch with shapes within a rect, found from the grid positions around the rect"""
+        columns, rows = cell_range(rect.adjusted(-self.reach, -self.reach, self.reach, self.reach), self.CELL_SIZE)
+        if len(columns) * len(rows) > len(batch.cells):
+            candidates = batch.cells.values()
+        else:
+            candidates = (batch.cells.get((column, row)) for column in columns for row in rows)
+        return [cell for cell in candidates if cell is not None and cell.bounds.intersects(rect)]
@@ -103,6 +103,7 @@ class AnnotationTree(QTreeWidget):
 
             # detect possible change
             if shape.comment != dlg.comment:
+                shape.set_modified()
                 self.sChange.emit(3)
             # store the dialog result
             text = "Details" if dlg.comment else "Add comment"
@@ -1,17 +1,126 @@
 from PySide6.QtWidgets import QMessageBox, QPushButton, QStyle, QDialog, QTextEdit, QDialogButtonBox, QVBoxLayout, \
-    QLineEdit, QLabel, QFrame, QListWidgetItem, QListWidget, QHBoxLayout, QFileDialog
+    QLineEdit, QLabel, QFrame, QListWidgetItem, QListWidget, QHBoxLayout, QFileDialog, QComboBox
 from PySide6.QtCore import QSize, QPoint
 from PySide6.QtGui import Qt, QColor
 
-from typing import List
+from typing import Callable, List
 from pathlib import Path
+import csv
 import os
 
 from taplt.ui.list_widgets import LabelList, SettingList
+from taplt.utils.importer import TRANSFER_MODES, read_manifest, scan_directory
 from taplt.utils.qt import get_icon
 from taplt.utils.stylesheets import BUTTON_STYLESHEET
 
 
+class BulkImportDialog(QDialog):
+    """ lets the user select a folder or a csv manifest (file, patient) of files to be imported at once
+    and how the files get into the project"""
+
+    def __init__(self):
+        super().__init__()
+        self.setFixedSize(600, 220)
+        self.setWindowTitle("Import Folder")
+        self.files = list()
+        self.mode = TRANSFER_MODES[0]
+
+        self.header = QLabel()
+        self.header.setStyleSheet("font: bold 12px")
+        self.header.setText("Choose a folder or a csv file listing files and patients")
+
+        # LineEdit with the selected folder or manifest
+        self.source = QLineEdit(self)
+        self.source.setFixedHeight(30)
+
+        # buttons to open up a FileDialog
+        self.select_folder_button = QPushButton()
+        self.select_folder_button.setStyleSheet(BUTTON_STYLESHEET)
+        self.select_folder_button.setText("Folder...")
+        self.select_folder_button.clicked.connect(self.select_folder)
+        self.select_manifest_button = QPushButton()
+        self.select_manifest_button.setStyleSheet(BUTTON_STYLESHEET)
+        self.select_manifest_button.setText("Manifest...")
+        self.select_manifest_button.clicked.connect(self.select_manifest)
+
+        # patient of all files in a folder
+        self.patient = QLineEdit(self)
+        self.patient.setPlaceholderText("Patient (default: name of the folder containing each file)")
+
+        # the order of the entries follows TRANSFER_MODES
+        self.transfer_mode = QComboBox()
+        self.transfer_mode.addItems(["Copy files into the project",
+                                     "Hard link files (copy if on another drive)",
+                                     "Link to the original files"])
+
+        # info label for invalid selections
+        self.info = QLabel()
+        self.info.setStyleSheet("color: red;")
+
+        # Accept & cancel buttons
+        self.confirmation = QDialogButtonBox(
+            QDialogButtonBox.StandardButton.Ok | QDialogButtonBox.StandardButton.Cancel)
+        self.confirmation.button(QDialogButtonBox.StandardButton.Ok).setText("Import")
+        self.confirmation.accepted.connect(self.collect_files)
+        self.confirmation.rejected.connect(self.close)
+
+        # layout setup
+        self.source_row = QFrame()
+        self.source_row_layout = QHBoxLayout(self.source_row)
+        self.source_row_layout.setContentsMargins(0, 0, 0, 0)
+        self.source_row_layout.addWidget(self.source)
+        self.source_row_layout.addWidget(self.select_folder_button)
+        self.source_row_layout.addWidget(self.select_manifest_button)
+
+        self.layout = QVBoxLayout(self)
+        self.layout.addWidget(self.header)
+        self.layout.addWidget(self.source_row)
+        self.layout.addWidget(self.patient)
+        self.layout.addWidget(self.transfer_mode)
+        self.layout.addWidget(self.info)
+        self.layout.addWidget(self.confirmation)
+
+    def collect_files(self):
+        """ collects the supported files of the selected folder or manifest and closes the dialog"""
+        source = self.source.text()
+        try:
+            if os.path.isdir(source):
+                files = scan_directory(source, self.patient.text())
+            elif os.path.isfile(source):
+                files = read_manifest(source)
+            else:
+                self.info.setText("Please select a folder or a csv file.")
+                return
+        except (OSError, UnicodeDecodeError, csv.Error) as e:
+            self.info.setText("The manifest could not be read: {}".format(e))
+            return
+        if not files:
+            self.info.setText("No supported files found.")
+            return
+        self.files = files
+        self.mode = TRANSFER_MODES[self.transfer_mode.currentIndex()]
+        self.close()
+
+    def select_folder(self):
+        """opens a dialog to let the user select the folder to be imported"""
+        directory = QFileDialog.getExistingDirectory(self,
+                                                     caption="Select Folder",
+                                                     dir=str(Path.home()),
+                                                     options=QFileDialog.Option.DontUseNativeDialog)
+        if directory:
+            self.source.setText(directory)
+
+    def select_manifest(self):
+        """opens a dialog to let the user select a csv file listing the files to be imported"""
+        manifest, _ = QFileDialog.getOpenFileName(self,
+                                                  caption="Select Manifest",
+                                                  dir=str(Path.home()),
+                                                  filter="Manifest (*.csv)",
+                                                  options=QFileDialog.Option.DontUseNativeDialog)
+        if manifest:
+            self.source.setText(manifest)
+
+
 class CloseMessageBox(QMessageBox):
     def __init__(self, *args):
         super().__init__(*args)
@@ -122,11 +231,15 @@ class SelectionDialog(QDialog):
     """ a dialog that provides (a) a list with items where user can select from and search in
         and (b) the possibility to create a new item from user input
 
-        used as scaffolding for other classes that may fill the list with items """
+        used as scaffolding for other classes that may fill the list with items
+
+        the list is filtered by the items containing the input, or by the item texts
+        returned from the optional search function, e.g. the full-text index of the database """
 
-    def __init__(self, selection_list, *args):
+    def __init__(self, selection_list, *args, search: Callable[[str], set] = None):
         super().__init__(*args)
         self.result = ""
+        self.search = search
 
         self.setFixedSize(QSize(300, 400))
         self.setLayout(QVBoxLayout())
@@ -164,12 +277,15 @@ class SelectionDialog(QDialog):
         self.result = ""
         text = self.input.text()
         matches = 0
+        found = self.search(text) if self.search is not None and text else None
 
         # iterate through list, display only matches
         for item_idx in range(self.selection_list.count()):
             item = self.selection_list.item(item_idx)
             item.setSelected(False)
-            if text not in item.text():
+            # without results from the search, fall back to the items containing the input
+            match = item.text() in found if found else text in item.text()
+            if not match:
                 item.setHidden(True)
             else:
                 item.setHidden(False)
@@ -223,8 +339,8 @@ class NewLabelDialog(SelectionDialog):
 class SelectPatientDialog(SelectionDialog):
     """ inherits the SelectionDialog, uses it to display patient names"""
 
-    def __init__(self, existing_patients: list, *args):
-        super().__init__(QListWidget(), *args)
+    def __init__(self, existing_patients: list, *args, search: Callable[[str], set] = None):
+        super().__init__(QListWidget(), *args, search=search)
         self.setWindowTitle("Select a patient")
         self.input.setPlaceholderText("Enter patient name")
 
@@ -320,24 +436,24 @@ class ProjectHandlerDialog(QDialog):
         self.patients.append(dlg.result)
 
         if dlg.result:
-            filepath, _ = QFileDialog.getOpenFileName(self,
-                                                      caption="Select File",
-                                                      directory=str(Path.home()),
-                                                      options=QFileDialog.Option.DontUseNativeDialog)
-
-            # only care about the filename itself (not regarding its path), to make it easier to handle
-            filename = os.path.basename(filepath)
-            if self.exists(filename):
-                msg = QMessageBox()
-                msg.setIcon(QMessageBox.Icon.Information)
-                msg.setText("The file\n{}\nalready exists.\nOverwrite?".format(filename))
-                msg.setStandardButtons(QMessageBox.ButtonRole.Ok | QMessageBox.ButtonRole.Cancel)
-                msg.accepted.connect(lambda: self.overwrite(filepath, filename, dlg.result))
-                msg.exec()
-            elif filename:
-                # TODO: Implement possibility to add several files at once
-                self.files[filepath] = dlg.result
-                self.added_files.addItem(QListWidgetItem(filename))
+            filepaths, _ = QFileDialog.getOpenFileNames(self,
+                                                        caption="Select Files",
+                                                        directory=str(Path.home()),
+                                                        options=QFileDialog.Option.DontUseNativeDialog)
+
+            for filepath in filepaths:
+                # only care about the filename itself (not regarding its path), to make it easier to handle
+                filename = os.path.basename(filepath)
+                if self.exists(filename):
+                    msg = QMessageBox()
+                    msg.setIcon(QMessageBox.Icon.Information)
+                    msg.setText("The file\n{}\nalready exists.\nOverwrite?".format(filename))
+                    msg.setStandardButtons(QMessageBox.ButtonRole.Ok | QMessageBox.ButtonRole.Cancel)
+                    msg.accepted.connect(lambda path=filepath, name=filename: self.overwrite(path, name, dlg.result))
+                    msg.exec()
+                elif filename:
+                    self.files[filepath] = dlg.result
+                    self.added_files.addItem(QListWidgetItem(filename))
 
     def check_path(self):
         """ this function verifies/rejects the project path which the user entered in the LineEdit"""
@@ -0,0 +1,92 @@
+from PySide6.QtWidgets import QGraphicsItem, QGraphicsSceneMouseEvent, QStyleOptionGraphicsItem, QWidget
+from PySide6.QtGui import QBrush, QPainter, QPainterPath, QPen, QPolygonF
+from PySide6.QtCore import QPointF, QRectF, Qt
+
+import math
+
+from taplt.ui.shape import Shape
+
+
+class DrawingOverlay(QGraphicsItem):
+    """ takes the mouse input while a new shape is drawn and shows the shape in progress
+
+    the overlay covers the image, so its bounding rect never changes while drawing, and grabs the mouse;
+    the outline of polygons and traces is extended by one line per new point instead of being rebuilt.
+    the drawn shape is not part of the scene until it is finished with a right click"""
+
+    # distance in pixels the mouse has to move before another point is added
+    MIN_DISTANCE = 3
+
+    def __init__(self, shape: Shape, bounds: QRectF):
+        super(DrawingOverlay, self).__init__()
+        self.shape = shape
+        self.bounds = bounds
+        self.pen = QPen(shape.line_color, 1)
+        self.brush = QBrush(shape.brush_color)
+        self.vertex_pen = QPen(shape.line_color, 0.5)
+        self.path = QPainterPath()
+
+    def add_point(self, point: QPointF):
+        """appends a point to the shape and to the cached path, the shape extends its vertex squares itself"""
+        if len(self.shape.vertices) == 0:
+            self.path.moveTo(point)
+        else:
+            self.path.lineTo(point)
+        self.shape.vertices.append(point)
+
+    def boundingRect(self) -> QRectF:
+        return self.bounds
+
+    def extends_path(self) -> bool:
+        """whether every point is kept, otherwise the shape is spanned by its first point and the mouse"""
+        return self.shape.shape_type in ["polygon", "tempTrace", "trace"]
+
+    def mouseMoveEvent(self, event: QGraphicsSceneMouseEvent):
+        points = self.shape.vertices.vertices
+        delta = points[-1] - event.scenePos() if len(points) > 0 else event.scenePos()
+        if math.sqrt(delta.x() ** 2 + delta.y() ** 2) > self.MIN_DISTANCE:
+            point = self.shape.check_out_of_bounds(event.scenePos())
+            # only the area touched by the new point is repainted, not the whole image below the overlay
+            if self.extends_path() or len(points) <= 1:
+                # the new line and the closing line of a polygon
+                changed = QPolygonF([point, points[-1], points[0]] if len(points) > 0 else [point]).boundingRect()
+                self.add_point(point)
+            else:
+                changed = self.outline_rect()
+                self.shape.vertices.set_point(1, point)
+                changed = changed.united(self.outline_rect())
+            margin = self.shape.vertex_size
+            self.update(changed.adjusted(-margin, -margin, margin, margin))
+
+    def mousePressEvent(self, event: QGraphicsSceneMouseEvent):
+        """a right click finishes the shape once it has two points"""
+        event.accept()
+        if event.button() != Qt.MouseButton.LeftButton and len(self.shape.vertices) > 1:
+            self.ungrabMouse()
+            self.shape.is_closed_path = True
+            group = self.parentItem()
+            if group is not None:
+                group.shape_drawing_done(self.shape)
+
+    def outline_rect(self) -> QRectF:
+        """the bounding rect of the outline of a shape spanned by two points, e.g. of a circle around its center"""
+        outline = QPainterPath()
+        self.shape.add_outline(outline)
+        return outline.boundingRect()
+
+    def paint(self, painter: QPainter, option: QStyleOptionGraphicsItem, widget: QWidget = None):
+        points = self.shape.vertices.vertices
+        painter.setPen(self.pen)
+        # traces stay open, so only the other shapes are filled
+        painter.setBrush(self.brush if self.shape.shape_type != "trace" else QBrush())
+        if self.extends_path():
+            painter.drawPath(self.path)
+            painter.setBrush(self.brush)
+            if self.shape.shape_type == "polygon" and len(points) > 2:
+                painter.drawLine(points[len(points) - 1], points[0])
+            painter.setPen(self.vertex_pen)
+            painter.drawPath(self.shape.vertices.square_path())
+        elif len(points) > 1:
+            outline = QPainterPath()
+            self.shape.add_outline(outline)
+            painter.drawPath(outline)
@@ -6,6 +6,9 @@ from taplt.ui.image_viewer import ImageViewer
 from taplt.ui.annotation_group import AnnotationGroup
 from taplt.ui.shape import Shape
 from taplt.utils.qt import get_icon
+from taplt.ui.tiled_image import TiledImageItem
+from taplt.utils.image_loader import ImageLoader, image_size
+from taplt.utils.image_pyramid import Pyramid, PyramidBuilder, needs_pyramid
 from taplt.media_viewing_widgets.widgets.video_viewer import VideoPlayer
 
 from taplt.media_viewing_widgets.widgets.slide_viewer import SlideView
@@ -40,6 +43,20 @@ class CenterDisplayWidget(QWidget):
 
         self.pixmap = QGraphicsPixmapItem()
         self.scene.addItem(self.pixmap)
+
+        # images are decoded in the background, the pixmap is set once they arrive
+        self.image_size = QSize()
+        self.image_loader = ImageLoader()
+        self.image_loader.sImageLoaded.connect(self.set_image)
+        self.image_request = None
+        self.full_resolution = False
+
+        # images too large for a single pixmap are displayed from tile pyramids, built on first opening
+        self.filepath = None
+        self.tiled_image = None
+        self.pyramids = PyramidBuilder()
+        self.pyramids.sPreview.connect(self.set_pyramid_preview)
+        self.pyramids.sPyramidReady.connect(self.pyramid_ready)
         self.annotations = AnnotationGroup()
         self.scene.addItem(self.annotations)
         self.annotations.sToolTip.connect(self.sDrawingTooltip.emit)
@@ -72,11 +89,13 @@ class CenterDisplayWidget(QWidget):
         and triggers the image_viewer to display a default image"""
         self.scene.b_isInitialized = False
         self.image_viewer.b_isEmpty = True
+        self.image_loader.cancel()
+        self.set_tiled_image(None)
         self.scene.clear()
         self.set_labels([])
 
     def get_pixmap_dimensions(self):
-        return [self.pixmap.pixmap().width(), self.pixmap.pixmap().height()]
+        return [self.image_size.width(), self.image_size.height()]
 
     def init_image(self, filepath: str, patient: str, labels: list, classes: list):
         """initializes the pixmap to display the image in the center widget
@@ -86,14 +105,32 @@ class CenterDisplayWidget(QWidget):
 
         file_type = modality(filepath)
 
-        if not file_type == Modality.slide:
-            pixmap = QPixmap(filepath)
+        # the size is read from the header right away, so the annotations and the view do not wait for the decoding
+        self.filepath = filepath
+        self.pixmap.setPixmap(QPixmap())
+        self.pixmap.setTransform(QTransform())
+        self.full_resolution = False
+        self.set_tiled_image(None)
+        image = self.image_loader.cached(filepath) if file_type == Modality.image else None
+        if image is not None:
+            # decoded in advance, see prefetch
+            self.image_loader.cancel()
+            self.image_size = image.size()
+            self.image_request = None
+            self.set_image(self.image_request, image, True)
+        elif file_type == Modality.image:
+            self.image_size = image_size(filepath)
+            if needs_pyramid(self.image_size):
+                self.image_loader.cancel()
+                self.image_request = None
+                self.show_pyramid(filepath)
+            else:
+                self.image_request = self.image_loader.load(filepath)
         else:
-            pixmap = QPixmap()
+            self.image_size = QSize(0, 0)
+            self.image_request = None
+            self.image_loader.cancel()
 
-        self.image_size = pixmap.size()
-        self.pixmap.setPixmap(pixmap)
-        
         labels = [Shape(image_size=self.image_size,
                         label_dict=_label,
                         color=self.annotations.get_color_for_label(_label['label']))
@@ -109,6 +146,50 @@ class CenterDisplayWidget(QWidget):
     def is_empty(self):
         return self.image_viewer.b_isEmpty
 
+    def prefetch(self, filepaths: list):
+        """decodes the images among the files in advance, so they can be displayed without waiting;
+        the pyramids of large images are built instead"""
+        images = [filepath for filepath in filepaths if modality(filepath) == Modality.image]
+        large = [filepath for filepath in images if needs_pyramid(image_size(filepath))]
+        self.image_loader.prefetch([filepath for filepath in images if filepath not in large])
+        for filepath in large:
+            self.pyramids.generate(filepath)
+
+    def pyramid_ready(self, filepath: str):
+        """replaces the preview by the tiles once the pyramid of the current image was built"""
+        if filepath == self.filepath and self.tiled_image is None:
+            self.show_pyramid(filepath)
+
+    def set_image(self, request: int, image: QImage, full_resolution: bool):
+        """displays a decoded image of the current file; previews are stretched to the size of the image"""
+        if request != self.image_request or self.full_resolution:
+            return
+        self.full_resolution = full_resolution
+        self.pixmap.setPixmap(QPixmap.fromImage(image))
+        transform = QTransform()
+        if not full_resolution and not image.isNull():
+            transform.scale(self.image_size.width() / image.width(), self.image_size.height() / image.height())
+        self.pixmap.setTransform(transform)
+
+    def set_pyramid_preview(self, filepath: str, image: QImage):
+        """displays the preview of an image whose pyramid is being built"""
+        if filepath == self.filepath and self.tiled_image is None:
+            self.set_image(None, image, False)
+
+    def set_tiled_image(self, pyramid: Pyramid = None):
+        """displays the tiles of a pyramid instead of the pixmap, or removes them"""
+        if self.tiled_image is not None:
+            self.tiled_image.pool.clear()
+            if self.tiled_image.scene() is self.scene:
+                self.scene.removeItem(self.tiled_image)
+            self.tiled_image = None
+        if pyramid is not None:
+            self.pixmap.setPixmap(QPixmap())
+            self.tiled_image = TiledImageItem(pyramid)
+            # below the annotations
+            self.tiled_image.setZValue(-1)
+            self.scene.addItem(self.tiled_image)
+
     def set_initialized(self):
         self.scene.b_isInitialized = True
         self.image_viewer.b_isEmpty = False
@@ -124,6 +205,14 @@ class CenterDisplayWidget(QWidget):
         self.scene.addItem(pixmap_item)
         self.scene.addItem(self.annotations)
 
+    def show_pyramid(self, filepath: str):
+        """displays the tiles of an image if its pyramid is up to date, builds the pyramid otherwise"""
+        pyramid = Pyramid.load(filepath)
+        if pyramid is not None:
+            self.set_tiled_image(pyramid)
+        else:
+            self.pyramids.generate(filepath, priority=1)
+
     def switch_to_modality(self, filepath: str):
         """
         A function that switches to the modality based on the ``filepath`` parameter
@@ -2,17 +2,175 @@ from PySide6.QtWidgets import *
 from PySide6.QtCore import *
 from PySide6.QtGui import *
 
-import os
+import bisect
 from typing import List
 
 from taplt.ui.shape import Shape
 from taplt.utils.qt import createListWidgetItemWithSquareIcon, get_icon
 from taplt.utils.stylesheets import TAB_STYLESHEET, SETTING_STYLESHEET
 
+# the data stored in the items of a FileList
+FILE_UID_ROLE = Qt.ItemDataRole.UserRole
+ANNOTATION_COUNT_ROLE = Qt.ItemDataRole.UserRole + 1
 
-class FileList(QListWidget):
-    """ a list widget subclass to make use of context menu"""
-    sDeleteFile = Signal(str)
+
+class FileListModel(QAbstractListModel):
+    """ the files of a project in display order, read page by page from the database while the list is scrolled;
+    only the fetched files are kept, identified by their uids and sorted by their keys (modality rank, filename).
+    while searching, the best full-text matches are listed instead; if there are none, the files containing the
+    search text are paged as usual"""
+    PAGE_SIZE = 500
+    SEARCH_LIMIT = 1000
+    THUMBNAIL_SIZE = 48
+
+    def __init__(self):
+        super(FileListModel, self).__init__()
+        self.fetch_page = None  # reads the next page, see SQLiteDatabase.get_file_page
+        self.previous_files = None  # reads the files before a file, see SQLiteDatabase.get_previous_files
+        self.search_files = None  # reads the best matches, see SQLiteDatabase.search_files
+        self.thumbnail = None  # returns the thumbnail of a file if there is one, see ThumbnailCache.pixmap
+        self.search = ""
+        self.ranked = False
+        self.show_check_box = False
+        self.show_thumbnails = False
+        self.checked_icon = get_icon("checked")
+        # keeps the names aligned while thumbnails are missing, e.g. for videos or while they are generated
+        self.empty_thumbnail = QPixmap(self.THUMBNAIL_SIZE, self.THUMBNAIL_SIZE)
+        self.empty_thumbnail.fill(Qt.GlobalColor.transparent)
+        self.exhausted = True
+        self.keys = list()
+        self.uids = list()
+        self.file_keys = dict()
+        self.counts = dict()
+
+    def canFetchMore(self, parent: QModelIndex = QModelIndex()) -> bool:
+        return not parent.isValid() and not self.exhausted
+
+    def data(self, index: QModelIndex, role: int = Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        uid = self.uids[index.row()]
+        if role == Qt.ItemDataRole.DisplayRole:
+            return self.keys[index.row()][1]
+        if role == Qt.ItemDataRole.DecorationRole:
+            # display check box if image is populated with at least 1 annotation
+            checked = self.show_check_box and self.counts[uid]
+            if not self.show_thumbnails or self.thumbnail is None:
+                return self.checked_icon if checked else None
+            thumbnail = self.thumbnail(uid) or self.empty_thumbnail
+            return self.mark_checked(thumbnail) if checked else thumbnail
+        if role == FILE_UID_ROLE:
+            return uid
+        if role == ANNOTATION_COUNT_ROLE:
+            return self.counts[uid]
+        return None
+
+    def fetchMore(self, parent: QModelIndex = QModelIndex()):
+        if parent.isValid() or self.exhausted:
+            return
+        files = self.fetch_page(self.keys[-1] if self.keys else None, self.PAGE_SIZE, self.search)
+        self.exhausted = len(files) < self.PAGE_SIZE
+        # a page starts after the last fetched file, but may hold files whose FILE_ADDED update did not arrive yet
+        files = [file for file in files if file[0] not in self.file_keys]
+        if files:
+            self.beginInsertRows(QModelIndex(), len(self.uids), len(self.uids) + len(files) - 1)
+            for uid, _, key, num_annotations in files:
+                self.keys.append(key)
+                self.uids.append(uid)
+                self.file_keys[uid] = key
+                self.counts[uid] = num_annotations
+            self.endInsertRows()
+
+    def insert_file(self, file_uid: int, key: tuple, num_annotations: int):
+        """ inserts a new file if it belongs to the fetched part of the list and matches the search"""
+        if self.ranked or file_uid in self.file_keys or self.search.lower() not in key[1].lower():
+            return
+        row = bisect.bisect_left(self.keys, key)
+        if row == len(self.keys) and not self.exhausted:
+            return
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.keys.insert(row, key)
+        self.uids.insert(row, file_uid)
+        self.file_keys[file_uid] = key
+        self.counts[file_uid] = num_annotations
+        self.endInsertRows()
+
+    def mark_checked(self, thumbnail: QPixmap) -> QPixmap:
+        """ draws the check box into the corner of a thumbnail"""
+        size = self.THUMBNAIL_SIZE // 3
+        pixmap = thumbnail.scaled(self.THUMBNAIL_SIZE, self.THUMBNAIL_SIZE, Qt.AspectRatioMode.KeepAspectRatio)
+        painter = QPainter(pixmap)
+        painter.drawPixmap(pixmap.width() - size, pixmap.height() - size, self.checked_icon.pixmap(size, size))
+        painter.end()
+        return pixmap
+
+    def refresh_file(self, file_uid: int):
+        """ updates the icon of a single file, e.g. once its thumbnail was generated"""
+        row = self.row(file_uid)
+        if row >= 0:
+            self.dataChanged.emit(self.index(row), self.index(row), [Qt.ItemDataRole.DecorationRole])
+
+    def refresh_icons(self):
+        """ updates the check boxes of all fetched files"""
+        if self.uids:
+            self.dataChanged.emit(self.index(0), self.index(len(self.uids) - 1), [Qt.ItemDataRole.DecorationRole])
+
+    def remove_file(self, file_uid: int):
+        """ removes the file if it was fetched"""
+        row = self.row(file_uid)
+        if row < 0:
+            return
+        self.beginRemoveRows(QModelIndex(), row, row)
+        del self.keys[row]
+        del self.uids[row]
+        del self.file_keys[file_uid]
+        del self.counts[file_uid]
+        self.endRemoveRows()
+
+    def reset(self):
+        """ drops all fetched files and reads the first page again"""
+        self.beginResetModel()
+        self.keys, self.uids = list(), list()
+        self.file_keys, self.counts = dict(), dict()
+        self.exhausted = self.fetch_page is None
+        files = self.search_files(self.search, self.SEARCH_LIMIT) if self.search and self.search_files else None
+        self.ranked = bool(files)
+        if self.ranked:
+            self.exhausted = True
+            for uid, _, key, num_annotations in files:
+                self.keys.append(key)
+                self.uids.append(uid)
+                self.file_keys[uid] = key
+                self.counts[uid] = num_annotations
+        self.endResetModel()
+        self.fetchMore()
+
+    def row(self, file_uid: int) -> int:
+        """ the row of the file, -1 if it was not fetched"""
+        key = self.file_keys.get(file_uid)
+        if key is None:
+            return -1
+        return self.uids.index(file_uid) if self.ranked else bisect.bisect_left(self.keys, key)
+
+    def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.uids)
+
+    def set_annotation_count(self, file_uid: int, num_annotations: int):
+        """ updates the stored annotation count of a file and its check box"""
+        row = self.row(file_uid)
+        if row >= 0:
+            self.counts[file_uid] = num_annotations
+            self.dataChanged.emit(self.index(row), self.index(row))
+
+    def set_search(self, text: str):
+        """ lists only the files whose names contain the text"""
+        self.search = text
+        self.reset()
+
+
+class FileList(QListView):
+    """ a list view subclass to make use of context menu"""
+    sDeleteFile = Signal(int)
 
     def __init__(self):
         super(FileList, self).__init__()
@@ -20,13 +178,15 @@ class FileList(QListWidget):
         self.setContentsMargins(0, 0, 0, 0)
         self.setFrameShape(QFrame.Shape.NoFrame)
         self.setItemAlignment(Qt.AlignmentFlag.AlignLeft)
+        self.setUniformItemSizes(True)
 
     def contextMenuEvent(self, event: QContextMenuEvent) -> None:
-        item = self.itemAt(event.pos())
-        if item:
+        index = self.indexAt(event.pos())
+        if index.isValid():
+            file_uid = index.data(FILE_UID_ROLE)
             menu = QMenu()
             action = QAction("Delete")
-            action.triggered.connect(lambda: self.sDeleteFile.emit(item.text()))
+            action.triggered.connect(lambda: self.sDeleteFile.emit(file_uid))
             menu.addAction(action)
             menu.exec(event.globalPos())
 
@@ -48,6 +208,12 @@ class LabelList(QListWidget):
             global_pos = event.globalPos()
             menu.exec(global_pos)
 
+    def add_classes(self, classes: List[str], color_map: List[QColor]):
+        """ appends the given class names to the list, colored according to their position"""
+        for _class in classes:
+            item = createListWidgetItemWithSquareIcon(_class, color_map[self.count()], self._icon_size)
+            self.addItem(item)
+
     def update_with_classes(self, classes: List[str], color_map: List[QColor]):
         """ fills the list widget with the given class names and their corresponding colors"""
         self.clear()
@@ -86,7 +252,10 @@ class FileViewingWidget(QWidget):
     """ holds a QTabWidget to be able to display both images and whole slide images"""
     itemClicked = Signal(QListWidgetItem)
     sRequestFileChange = Signal(int)
-    sDeleteFile = Signal(str)
+    sDeleteFile = Signal(int)
+
+    # milliseconds without typing before the search is applied
+    SEARCH_DELAY = 250
 
     def __init__(self):
         super(FileViewingWidget, self).__init__()
@@ -125,58 +294,171 @@ class FileViewingWidget(QWidget):
         self.search_field.setObjectName("fileSearch")
         self.layout().addWidget(self.search_field)
 
+        self.model = FileListModel()
         self.image_list = FileList()
+        self.image_list.setModel(self.model)
         self.wsi_list = FileList()
         self.show_check_box = False
+        self.current_uid = None
+        # the sort key of the current file, which may lie beyond the fetched pages, and of the last file looked up there
+        self.current_key = None
+        self.looked_up = (None, None)
 
         self.tab.addTab(self.image_list, 'Images')
         self.tab.addTab(self.wsi_list, 'WSI')
         self.layout().addWidget(self.tab)
 
-        self.image_list.itemClicked.connect(self.file_selected)
+        self.search_timer = QTimer()
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(self.SEARCH_DELAY)
+
+        self.image_list.clicked.connect(self.file_selected)
         self.image_list.sDeleteFile.connect(self.sDeleteFile.emit)
-        self.search_field.textChanged.connect(self.search_text_changed)
-
-    def file_selected(self):
-        """gets the index of the selected file and emits a signal"""
-        idx2 = self.image_list.currentRow()
-        self.sRequestFileChange.emit(idx2)
-
-    def get_img_idx(self, filename: str) -> int:
-        """ searches through the ListWidget and returns the index of the item with the filename / -1 if not found"""
-        for i in range(self.image_list.count()):
-            item = self.image_list.item(i)
-            if item.text() == filename:
-                return i
-        return -1
-
-    def update_list(self, files: list, img_idx: int):
-        """ clears the list widget and fills it again with the provided filenames"""
-        self.image_list.clear()
-        for file in files:
-            filename = os.path.basename(file[0])
+        self.search_field.textChanged.connect(self.search_timer.start)
+        self.search_timer.timeout.connect(self.search_text_changed)
 
-            # display check box if image is populated with at least 1 annotation
-            if self.show_check_box and file[1]:
-                icon = get_icon("checked")
-                item = QListWidgetItem(icon, filename)
+    def file_selected(self, index: QModelIndex):
+        """gets the uid of the selected file and emits a signal"""
+        self.sRequestFileChange.emit(index.data(FILE_UID_ROLE))
+
+    def beyond_pages(self) -> bool:
+        """ whether the current file lies beyond the fetched pages, so its neighbours are looked up by its key"""
+        return (self.model.row(self.current_uid) < 0 and self.current_key is not None and not self.model.ranked
+                and self.model.fetch_page is not None and self.model.previous_files is not None)
+
+    def get_adjacent_file(self, direction: int):
+        """ returns the uid of the file next to the current one in the given direction, wrapping around at the ends
+        of the list; None if the list is empty. files beyond the fetched pages are looked up instead of fetching
+        all pages up to them"""
+        search = self.model.search
+        if self.beyond_pages():
+            if direction > 0:
+                files = self.model.fetch_page(self.current_key, 1, search)
+                if not files:
+                    return self.model.uids[0] if self.model.uids else None
             else:
-                item = QListWidgetItem(filename)
-            self.image_list.addItem(item)
-        if self.image_list.count() > 0:
-            self.image_list.setCurrentRow(img_idx)
+                files = self.model.previous_files(self.current_key, 1, search) or self.model.previous_files(
+                    None, 1, search)
+            return self.look_up(files[0]) if files else None
+        row = self.model.row(self.current_uid) + direction
+        if row >= self.model.rowCount():
+            self.model.fetchMore()
+        elif row < 0 and self.model.canFetchMore():
+            # the last file is looked up instead of fetching every page of the list
+            if self.model.previous_files is None:
+                row = 0
+            else:
+                files = self.model.previous_files(None, 1, search)
+                return self.look_up(files[0]) if files else None
+        if self.model.rowCount() == 0:
+            return None
+        return self.model.uids[row % self.model.rowCount()]
+
+    def get_neighbours(self, count: int) -> list:
+        """ returns the uids of up to count files before and after the current one, nearest first,
+        wrapping around at the ends like get_adjacent_file as long as no more than a page has to be fetched"""
+        row = self.model.row(self.current_uid)
+        neighbours = list()
+        if self.beyond_pages():
+            after = [file[0] for file in self.model.fetch_page(self.current_key, count, self.model.search)]
+            if len(after) < count:
+                # the end of the list was reached, the first files follow
+                after += self.model.uids[:count - len(after)]
+            before = [file[0] for file in self.model.previous_files(self.current_key, count, self.model.search)]
+            for distance in range(count):
+                for side in (after, before):
+                    if distance < len(side) and side[distance] != self.current_uid \
+                            and side[distance] not in neighbours:
+                        neighbours.append(side[distance])
+            return neighbours
+        if row < 0:
+            return neighbours
+        if row + count >= self.model.rowCount():
+            self.model.fetchMore()
+        num_rows = self.model.rowCount()
+        for distance in range(1, count + 1):
+            for neighbour in (row + distance, row - distance):
+                # wrapping backwards would need the whole list
+                if neighbour < 0 and self.model.canFetchMore():
+                    continue
+                uid = self.model.uids[neighbour % num_rows]
+                if uid != self.current_uid and uid not in neighbours:
+                    neighbours.append(uid)
+        return neighbours
+
+    def get_filename(self, file_uid: int) -> str:
+        """ returns the name of a fetched file"""
+        return self.model.file_keys[file_uid][1]
+
+    def insert_file(self, key: tuple, file_uid: int, filepath: str, num_annotations: int):
+        """ inserts a single file into the list without touching the other items"""
+        self.model.insert_file(file_uid, key, num_annotations)
+
+    def look_up(self, file: tuple) -> int:
+        """ remembers the key of a file found beyond the fetched pages until it becomes the current one
+        :param file: a tuple (uid, filename, sort key, number of annotations), see SQLiteDatabase.get_file_page
+        :return: the uid of the file"""
+        self.looked_up = (file[0], file[2])
+        return file[0]
+
+    def refresh_thumbnail(self, file_uid: int):
+        """ shows the thumbnail of a file which was generated in the meantime"""
+        if self.model.show_thumbnails:
+            self.model.refresh_file(file_uid)
+
+    def refresh_icons(self):
+        """ updates the check boxes of all items, e.g. after the corresponding setting changed"""
+        self.model.show_check_box = self.show_check_box
+        self.model.refresh_icons()
+
+    def remove_file(self, file_uid: int):
+        """ removes the file from the list"""
+        self.model.remove_file(file_uid)
+
+    def set_annotation_count(self, file_uid: int, num_annotations: int):
+        """ updates the stored annotation count of a file and its check box"""
+        self.model.set_annotation_count(file_uid, num_annotations)
+
+    def set_current_file(self, file_uid: int):
+        """ marks the file as the current one, nothing is marked if it was not fetched"""
+        key = self.model.file_keys.get(file_uid)
+        if key is None and file_uid == self.current_uid:
+            # the key of a file beyond the fetched pages is kept, e.g. while the list is read again
+            key = self.current_key
+        elif key is None and file_uid == self.looked_up[0]:
+            key = self.looked_up[1]
+        self.current_uid, self.current_key = file_uid, key
+        row = self.model.row(file_uid)
+        self.image_list.setCurrentIndex(self.model.index(row) if row >= 0 else QModelIndex())
+
+    def set_page_source(self, fetch_page, search_files=None, previous_files=None):
+        """ sets the functions reading the pages of the file list, the search results and the files before a file,
+        see SQLiteDatabase.get_file_page, SQLiteDatabase.search_files and SQLiteDatabase.get_previous_files"""
+        self.model.fetch_page = fetch_page
+        self.model.search_files = search_files
+        self.model.previous_files = previous_files
+
+    def set_show_thumbnails(self, show: bool):
+        """ switches between thumbnails and small check boxes next to the filenames"""
+        self.model.show_thumbnails = show
+        size = self.model.THUMBNAIL_SIZE if show else 11
+        self.image_list.setIconSize(QSize(size, size))
+        self.model.refresh_icons()
+
+    def set_thumbnail_source(self, thumbnail):
+        """ sets the function returning the thumbnail of a file, see ThumbnailCache.pixmap"""
+        self.model.thumbnail = thumbnail
+
+    def update_list(self, file_uid: int):
+        """ reads the file list again, starting with its first page
+        :param file_uid: the file to be marked as the current one"""
+        self.model.reset()
+        self.set_current_file(file_uid)
 
     def search_text_changed(self):
         """ filters the list regarding the user input in the search field"""
-        cur_text = self.search_field.toPlainText()
-        cur_list = self.tab.currentWidget()
-
-        for idx in range(cur_list.count()):
-            item = cur_list.item(idx)
-            if cur_text not in item.text():
-                item.setHidden(True)
-            else:
-                item.setHidden(False)
+        self.model.set_search(self.search_field.toPlainText())
+        self.set_current_file(self.current_uid)
 
 
 class SettingList(QListWidget):
@@ -8,13 +8,14 @@ from taplt.src.actions import Action
 from taplt.ui.file_display import CenterDisplayWidget
 from taplt.ui.toolbar import Toolbar
 from taplt.ui.dialogs import (SelectPatientDialog, CloseMessageBox, DeleteFileMessageBox,
-                              ForgotToSaveMessageBox, SettingDialog, ProjectHandlerDialog)
+                              ForgotToSaveMessageBox, SettingDialog, ProjectHandlerDialog, BulkImportDialog)
 from taplt.ui.menu_bar import MenuBar
 from taplt.ui.list_widgets import FileViewingWidget, LabelsViewingWidget
 from taplt.ui.annotation_tree import AnnotationTree
 from taplt.ui.welcome_screen import WelcomeScreen
 from taplt.utils.qt import colormap_rgb, get_icon
 from taplt.utils.project_structure import check_environment, Structure
+from taplt.utils.database import Update, TablePreview
 from taplt.macros.macros import Macros
 from taplt.macros.macros_dialogs import PreviewDatabaseDialog
 
@@ -27,10 +28,13 @@ class LabelingMainWindow(QMainWindow):
     sOpenProject = Signal(str)
     sAddPatient = Signal(str)
     sAddFile = Signal(str, str)
-    sRequestUpdate = Signal(int)
+    sImportFiles = Signal(list, str)
+    sCancelImport = Signal()
+    sRequestFile = Signal(int)
+    sPrefetch = Signal(list)
     sRequestCheckForChanges = Signal(int, int)
-    sSaveToDatabase = Signal(list, int)
-    sDeleteFile = Signal(str, int)
+    sSaveToDatabase = Signal(list, list, list, int)
+    sDeleteFile = Signal(int, int)
     sUpdateSettings = Signal(list)
     sDisconnect = Signal()
 
@@ -114,6 +118,16 @@ class LabelingMainWindow(QMainWindow):
         self.statusbar = QStatusBar()
         self.setStatusBar(self.statusbar)
 
+        # progress of the bulk imports, only visible while they are running
+        self.import_bar = QProgressBar()
+        self.import_bar.setMaximumWidth(250)
+        self.import_bar.setFormat("Importing %v / %m")
+        self.cancel_import_button = QPushButton("Cancel Import")
+        self.cancel_import_button.clicked.connect(self.sCancelImport.emit)
+        self.statusbar.addPermanentWidget(self.import_bar)
+        self.statusbar.addPermanentWidget(self.cancel_import_button)
+        self.show_import_progress(0, 0, 0)
+
         self.toolBar = Toolbar(self)
         self.addToolBar(Qt.ToolBarArea.LeftToolBarArea, self.toolBar)
         self.toolBar.init_margins()
@@ -128,7 +142,11 @@ class LabelingMainWindow(QMainWindow):
         self.file_display.sDrawingTooltip.connect(self.set_tool_tip)
 
         # TODO: if possible, get rid of such variables
-        self.img_idx = 0
+        self.file_uid = None
+        self.num_files = 0
+        self.search = None  # full-text search of the database, see SQLiteDatabase.search
+        self.prefetch_files = 0
+        self.classes = list()
         self.changes = list()
         self.autoSave = False
 
@@ -153,6 +171,7 @@ class LabelingMainWindow(QMainWindow):
         self.menubar.sRequestSave.connect(self.save_to_database)
         self.menubar.sNewProject.connect(self.new_project)
         self.menubar.sOpenProject.connect(self.open_project)
+        self.menubar.sImportFolder.connect(self.import_folder)
         self.menubar.sCloseProject.connect(self.close_project)
         self.menubar.sExampleProject.connect(self.macros.example_project)
 
@@ -168,9 +187,15 @@ class LabelingMainWindow(QMainWindow):
                 self.autoSave = setting[1]
             elif setting[0] == "Mark annotated files":
                 self.file_list.show_check_box = setting[1]
-                self.sRequestUpdate.emit(self.img_idx)
+                self.file_list.refresh_icons()
             elif setting[0] == "Display patient name":
                 self.file_display.patient_label.setVisible(setting[1])
+            elif setting[0] == "Show thumbnails":
+                self.file_list.set_show_thumbnails(setting[1])
+            elif setting[0] == "Prefetch/files":
+                self.prefetch_files = int(setting[1])
+            elif setting[0] == "Prefetch/image_memory":
+                self.file_display.image_loader.cache.set_limit(int(setting[1]))
         self.sUpdateSettings.emit(settings)
 
     def change_detected(self, change: int):
@@ -209,25 +234,24 @@ class LabelingMainWindow(QMainWindow):
         if self.check_for_changes():
             self.set_welcome_screen(True)
             self.menubar.enable_tools(["New Project", "Open Project", "Quit Program", "Example Project"])
+            self.show_import_progress(0, 0, 0)
             self.sDisconnect.emit()
 
-    def delete_file(self, filename):
+    def delete_file(self, file_uid: int):
         """asks for user consent, emits a signal to permanently delete a project file"""
-        dlg = DeleteFileMessageBox(filename)
+        dlg = DeleteFileMessageBox(self.file_list.get_filename(file_uid))
         dlg.exec()
 
         if dlg.result() == QMessageBox.StandardButton.Ok:
-            self.sDeleteFile.emit(filename, self.img_idx)
+            self.sDeleteFile.emit(file_uid, self.file_uid)
 
-    def file_list_item_clicked(self, new_img_idx: int):
+    def file_list_item_clicked(self, file_uid: int):
         """switches to the image clicked by the user"""
         if self.autoSave:
             self.save_to_database()
-            self.img_idx = new_img_idx
-            self.sRequestUpdate.emit(new_img_idx)
+            self.request_file(file_uid)
         elif self.check_for_changes():
-            self.img_idx = new_img_idx
-            self.sRequestUpdate.emit(new_img_idx)
+            self.request_file(file_uid)
 
     def hide_toolbar(self):
         """hides or shows the toolbar"""
@@ -240,7 +264,7 @@ class LabelingMainWindow(QMainWindow):
 
     def import_file(self, existing_patients: list):
         """executes a dialog to let the user enter all information regarding file import"""
-        dlg = SelectPatientDialog(existing_patients)
+        dlg = SelectPatientDialog(existing_patients, search=self.search_patients if self.search else None)
         dlg.exec()
         patient = dlg.result
 
@@ -252,7 +276,13 @@ class LabelingMainWindow(QMainWindow):
             if filepath:
                 if self.check_for_changes():
                     self.sAddFile.emit(filepath, patient)
-                    self.sRequestUpdate.emit(self.img_idx)
+
+    def import_folder(self):
+        """executes a dialog to let the user select a folder or a manifest of files to be imported at once"""
+        dlg = BulkImportDialog()
+        dlg.exec()
+        if dlg.files:
+            self.sImportFiles.emit(dlg.files, dlg.mode)
 
     def new_project(self):
         """executes a dialog prompting the user to enter information about the new project"""
@@ -298,25 +328,37 @@ class LabelingMainWindow(QMainWindow):
     def next_image(self, direction: int):
         """proceeds to the next/previous image"""
         if not self.file_display.is_empty():
-            new_img_idx = (self.img_idx + direction) % self.file_list.image_list.count()
+            # start from the most recently requested file, which may not be displayed yet
+            file_uid = self.file_list.get_adjacent_file(direction)
+            if file_uid is None:
+                return
             if self.autoSave:
                 self.save_to_database()
-                self.img_idx = new_img_idx
-                self.sRequestUpdate.emit(new_img_idx)
+                self.request_file(file_uid)
             elif self.check_for_changes():
-                self.img_idx = new_img_idx
-                self.sRequestUpdate.emit(new_img_idx)
+                self.request_file(file_uid)
 
-    def preview_database(self, headers: list, content: list):
+    def preview_database(self, preview: TablePreview):
         """displays the database content of the specified table in a dialog"""
-        dlg = PreviewDatabaseDialog(headers, content)
+        dlg = PreviewDatabaseDialog(preview)
         dlg.exec()
 
+    def request_file(self, file_uid: int):
+        """asks the database for a file; self.file_uid keeps pointing to the displayed file until it arrives"""
+        self.file_list.set_current_file(file_uid)
+        self.sRequestFile.emit(file_uid)
+
     def save_to_database(self):
         """stores the current state of the image to the database"""
-        annotations = list(self.file_display.annotations.annotations.values())
+        if self.file_uid is None:
+            return
+        created, modified, deleted = self.file_display.annotations.take_changes()
         self.changes.clear()
-        self.sSaveToDatabase.emit(annotations, self.img_idx)
+        self.sSaveToDatabase.emit(created, modified, deleted, self.file_uid)
+
+    def search_patients(self, text: str) -> set:
+        """the ids of the patients matching the text in the full-text index"""
+        return {some_id for _, _, some_id in self.search(text, 'patients')}
 
     def set_no_files_screen(self, b: bool):
         """ either hides the default label or the image display"""
@@ -331,18 +373,75 @@ class LabelingMainWindow(QMainWindow):
         self.right_menu_widget.setHidden(b)
         self.welcome_screen.setHidden(not b)
 
-    def update_window(self, files: list, img_idx, patient: str, classes: list, labels: list):
-        """main updating function: all necessary information is passed to the main window"""
-        self.img_idx = img_idx
+    def show_import_progress(self, processed: int, total: int, failed: int):
+        """shows the progress of the bulk imports in the status bar, and a summary once they finished"""
+        running = processed < total
+        self.import_bar.setVisible(running)
+        self.cancel_import_button.setVisible(running)
+        if running:
+            self.import_bar.setMaximum(total)
+            self.import_bar.setValue(processed)
+        elif failed:
+            self.statusbar.showMessage("Import finished, {} of {} files could not be imported".format(failed, total))
+        elif total:
+            self.statusbar.showMessage("Import finished", 5000)
+
+    def update_window(self, updates: list):
+        """main updating function: applies the changes reported by the database to the window"""
         color_map, new_color = colormap_rgb(n=NUM_COLORS)
-        self.labels_list.label_list.update_with_classes(classes, color_map)
-        self.file_list.update_list(files, self.img_idx)
-        if files:
-            self.set_no_files_screen(False)
-            current_labels = self.file_display.init_image(files[self.img_idx][0], patient, labels, classes)
-            self.polygons.update_polygons(current_labels)
-        else:
-            self.set_no_files_screen(True)
+        for update in updates:
+            kind, args = update[0], update[1:]
+
+            if kind == Update.PROJECT:
+                self.num_files, classes = args
+                self.classes = list(classes)
+                self.labels_list.label_list.update_with_classes(self.classes, color_map)
+                self.file_list.update_list(self.file_uid)
+                self.set_no_files_screen(not self.num_files)
+
+            elif kind == Update.FILE_ADDED:
+                key, file_uid, filepath, num_annotations = args
+                self.num_files += 1
+                self.file_list.insert_file(key, file_uid, filepath, num_annotations)
+                self.file_list.set_current_file(self.file_uid)
+
+            elif kind == Update.FILE_REMOVED:
+                file_uid, = args
+                self.num_files -= 1
+                self.file_list.remove_file(file_uid)
+                self.file_list.set_current_file(self.file_uid)
+                if self.num_files == 0:
+                    self.file_uid = None
+                    self.set_no_files_screen(True)
+
+            elif kind == Update.ANNOTATIONS_SAVED:
+                file_uid, uids = args
+                if file_uid == self.file_uid:
+                    self.file_display.annotations.assign_uids(uids)
+
+            elif kind == Update.FILE_STATUS:
+                file_uid, num_annotations = args
+                self.file_list.set_annotation_count(file_uid, num_annotations)
+
+            elif kind == Update.LABELS_ADDED:
+                classes, = args
+                new_classes = [c for c in classes if c not in self.classes]
+                self.classes.extend(new_classes)
+                self.labels_list.label_list.add_classes(new_classes, color_map)
+
+            elif kind == Update.FILE_LOADED:
+                file_uid, filepath, patient, labels = args
+                self.file_uid = file_uid
+                self.file_list.set_current_file(file_uid)
+                self.set_no_files_screen(False)
+                current_labels = self.file_display.init_image(filepath, patient, labels, list(self.classes))
+                self.polygons.update_polygons(current_labels)
+                if self.prefetch_files > 0:
+                    self.sPrefetch.emit(self.file_list.get_neighbours(self.prefetch_files))
+            elif kind == Update.FILES_PREFETCHED:
+                self.file_display.prefetch(args[0])
+            elif kind == Update.IMPORT_PROGRESS:
+                self.show_import_progress(*args)
 
     def define_img_actions(self):
         actions = (Action(self,
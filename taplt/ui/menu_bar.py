@@ -11,6 +11,7 @@ class MenuBar(QMenuBar):
     sOpenProject = Signal()
     sCloseProject = Signal()
     sRequestImport = Signal()
+    sImportFolder = Signal()
     sRequestSave = Signal()
     sRequestSettings = Signal()
     sExampleProject = Signal()
@@ -57,6 +58,12 @@ class MenuBar(QMenuBar):
                                'Ctrl+I',
                                "import",
                                "Import a new file to database")
+        action_import_folder = Action(self,
+                                      "Import Folder",
+                                      self.sImportFolder.emit,
+                                      'Ctrl+Shift+I',
+                                      "import",
+                                      "Import all files of a folder or a csv manifest to database")
         action_quit = Action(self,
                              "Quit Program",
                              parent.close,
@@ -74,9 +81,9 @@ class MenuBar(QMenuBar):
         macros_preview_annotations = Action(self,
                                             "Annotations",
                                             lambda: self.sPreviewDatabase.emit("Annotations"))
-        macros_preview_images = Action(self,
-                                       "Images",
-                                       lambda: self.sPreviewDatabase.emit("Images"))
+        macros_preview_files = Action(self,
+                                      "Files",
+                                      lambda: self.sPreviewDatabase.emit("Files"))
         macros_preview_patients = Action(self,
                                          "Patients",
                                          lambda: self.sPreviewDatabase.emit("Patients"))
@@ -89,11 +96,12 @@ class MenuBar(QMenuBar):
                         action_close_project,
                         action_save,
                         action_import,
+                        action_import_folder,
                         action_quit,
                         action_settings,
                         macros_example_project,
                         macros_preview_annotations,
-                        macros_preview_images,
+                        macros_preview_files,
                         macros_preview_patients,
                         macros_preview_classes]
 
@@ -105,10 +113,11 @@ class MenuBar(QMenuBar):
                                  action_close_project))
 
         self.edit.addActions((action_save,
-                              action_import))
+                              action_import,
+                              action_import_folder))
         self.macros.addAction(macros_example_project)
         self.preview.addActions((macros_preview_annotations,
-                                 macros_preview_images,
+                                 macros_preview_files,
                                  macros_preview_patients,
                                  macros_preview_classes))
         self.macros.addMenu(self.preview)
@@ -8,20 +8,16 @@ from typing import *
 import numpy as np
 from taplt.config import VERTEX_SIZE, SCALING_INITIAL
 
-from taplt.utils.qt import closest_euclidean_distance
+from taplt.utils.qt import closest_euclidean_distance, polygon_from_array
 
 
-class Shape(QGraphicsObject):
-    # TODO: Maybe we should make these QGraphicsItems again to reduce overhead.
-    hover_enter = Signal()
-    hover_exit = Signal()
-    clicked = Signal(QGraphicsSceneMouseEvent)
-    selected = Signal()
-    deselected = Signal()
-    mode_changed = Signal(int)
-    deleted = Signal()
-    drawingDone = Signal()
-    sChange = Signal(int)
+class Shape(QGraphicsItem):
+    """ an annotation drawn on top of the image
+
+    shapes are plain QGraphicsItems rather than QObjects, so dense annotation layers do not create a QObject
+    with its own signals and connections per shape; instead, a shape passes its events on to the AnnotationGroup
+    it belongs to, see notify. shapes nobody interacts with are not even part of the scene, the group's
+    AnnotationLayer draws them instead"""
 
     @dataclass
     class ShapeMode:
@@ -29,6 +25,12 @@ class Shape(QGraphicsObject):
         EDIT: int = 1
         CREATE: int = 2
 
+    @dataclass
+    class ShapeState:
+        STORED: int = 0  # unchanged since it was loaded from or written to the database
+        CREATED: int = 1
+        MODIFIED: int = 2
+
     @dataclass
     class ShapeType:
         POLYGON: str = 'polygon'
@@ -39,7 +41,7 @@ class Shape(QGraphicsObject):
     def __init__(self,
                  image_size: QSize,
                  label: str = None,
-                 points: List[QPointF] = None,
+                 points: Union[np.ndarray, List[QPointF]] = None,
                  color: QColor = None,
                  shape_type: str = None,
                  flags=None,
@@ -48,7 +50,7 @@ class Shape(QGraphicsObject):
                  mode: ShapeMode = ShapeMode.FIXED):
         super(Shape, self).__init__()
 
-        _points = points if points else []
+        _points = points if points is not None else []
         self.image_size = image_size
         self.image_rect = QRectF(0, 0, self.image_size.width(), self.image_size.height())
         self.vertex_size = VERTEX_SIZE
@@ -61,7 +63,7 @@ class Shape(QGraphicsObject):
             if 'label' in label_dict:
                 self.label = label_dict['label']
             if 'points' in label_dict:
-                _points = [QPointF(_pt[0], _pt[1]) for _pt in label_dict['points']]
+                _points = np.asarray(label_dict['points'], dtype=float).reshape(-1, 2)
             if 'shape_type' in label_dict:
                 self.shape_type = label_dict['shape_type']
             if 'flags' in label_dict:
@@ -77,6 +79,12 @@ class Shape(QGraphicsObject):
             self.group_id = group_id
             self.comment = ""
 
+        # the uid of the corresponding database entry, None for shapes that were not saved yet
+        self.uid = label_dict.get('uid') if label_dict else None
+        self.state = Shape.ShapeState.STORED if self.uid is not None else Shape.ShapeState.CREATED
+
+        # the AnnotationGroup which handles the events of the shape, set when the shape is added to it
+        self.group = None
         self._path = None  # only necessary for the temporary Polygon and trace
         self._anchorPoint = None
         self.line_color, self.brush_color = QColor(), QColor()
@@ -100,7 +108,13 @@ class Shape(QGraphicsObject):
 
         if self.mode == Shape.ShapeMode.CREATE:
             self.setSelected(True)
-        self.mode_changed.emit(self.mode)
+        self.notify('shape_mode_changed', self.mode)
+
+    def notify(self, handler: str, *args):
+        """calls a handler of the AnnotationGroup containing the shape with the shape and the given arguments;
+        shapes which were not added to a group yet have nobody to notify"""
+        if self.group is not None:
+            getattr(self.group, handler)(self, *args)
 
     def clip_to_scene(self, scene_pos: QPointF) -> QPointF:
         rect = self.scene().itemsBoundingRect()  # type: QRect
@@ -111,60 +125,36 @@ class Shape(QGraphicsObject):
     def sceneEvent(self, event: QEvent) -> bool:
         return super(Shape, self).sceneEvent(event)
 
-    @Slot(QGraphicsSceneMouseEvent)
-    def mouseMoveEvent(self, event: QGraphicsSceneMouseEvent):
-        if self.mode == Shape.ShapeMode.CREATE:
-            if len(self.vertices.vertices) > 0:
-                delta = self.vertices.vertices[-1] - event.scenePos()
-            else:
-                delta = event.scenePos()
-            if math.sqrt(delta.x() ** 2 + delta.y() ** 2) > 3:
-                if self.shape_type in ["polygon", "tempTrace","trace"] or len(self.vertices.vertices) <= 1:
-                    self.vertices.vertices.append(self.check_out_of_bounds(event.scenePos()))
-                else:
-                    self.vertices.vertices[1] = self.check_out_of_bounds(event.scenePos())
-                self.update()
-        
-        super(Shape, self).mouseMoveEvent(event)
-
-    def check_out_of_bounds(self, pos: QPointF):
-        scene_pos = np.clip(np.array((pos.x(), pos.y())),
-                            np.array((0, 0)),
-                            (self.image_size.width(), self.image_size.height()))
-        return QPointF(scene_pos[0], scene_pos[1])
+    def check_out_of_bounds(self, pos: Union[QPointF, np.ndarray]) -> Union[QPointF, np.ndarray]:
+        """clips a point or an (n, 2) array of points to the image"""
+        width, height = self.image_size.width(), self.image_size.height()
+        if isinstance(pos, np.ndarray):
+            return np.clip(pos, (0, 0), (width, height))
+        # a single point is clipped without numpy, it is checked on every mouse move while drawing
+        return QPointF(min(max(pos.x(), 0), width), min(max(pos.y(), 0), height))
 
     def contextMenuEvent(self, event: QGraphicsSceneContextMenuEvent) -> None:
         pos = event.screenPos()
         menu = QMenu()
 
         action = QAction("Delete")
-        action.triggered.connect(self.deleted.emit)
+        action.triggered.connect(lambda: self.notify('shape_deleted'))
         menu.addAction(action)
 
         self.setSelected(True)
-        self.selected.emit()
+        self.notify('shape_selected')
         menu.exec(pos)
 
     @Slot(QGraphicsSceneMouseEvent)
     def mousePressEvent(self, event: QGraphicsSceneMouseEvent):
         # TODO: Add a new tip that tells the user, that they can end the annotation by right clicking
         if event.button() == Qt.MouseButton.LeftButton:
-            if self.mode == Shape.ShapeMode.CREATE:
-                pass
-            elif self.contains(event.pos()):
+            if self.contains(event.pos()):
                 self.setSelected(True)
-                self.selected.emit()
-                self.clicked.emit(event)
+                self.notify('shape_selected')
                 super(Shape, self).mousePressEvent(event)
             else:
                 event.ignore()
-            pass
-        elif self.mode == Shape.ShapeMode.CREATE and len(self.vertices) > 1:
-            self.ungrabMouse()
-            self.is_closed_path = True
-
-            self.drawingDone.emit()
-            super(Shape, self).mousePressEvent(event)
 
 
     def mouseDoubleClickEvent(self, event: QGraphicsSceneMouseEvent):
@@ -181,7 +171,8 @@ class Shape(QGraphicsObject):
             self.vertices.translate(self.pos())  # shift actual points to new location
             self.setPos(0, 0)  # reset the anchor to line up with the original origin
             self.set_mode(Shape.ShapeMode.FIXED)
-            self.sChange.emit(2)
+            self.set_modified()
+            self.notify('shape_changed', 2)
 
     @Slot(QGraphicsSceneHoverEvent)
     def hoverEnterEvent(self, event: QGraphicsSceneHoverEvent):
@@ -196,12 +187,12 @@ class Shape(QGraphicsObject):
             if self.contains(event.pos()):
                 if not self.is_highlighted:
                     self.is_highlighted = True
-                    self.hover_enter.emit()
+                    self.notify('shape_highlighted', True)
                     self.update()
             else:
                 if self.is_highlighted:
                     self.is_highlighted = False
-                    self.hover_exit.emit()
+                    self.notify('shape_highlighted', False)
                     self.update()
         event.ignore()
         super(Shape, self).hoverMoveEvent(event)
@@ -210,36 +201,40 @@ class Shape(QGraphicsObject):
     def hoverLeaveEvent(self, event: QGraphicsSceneHoverEvent):
         if self.is_highlighted:
             self.is_highlighted = False
-            self.hover_exit.emit()
+            self.notify('shape_highlighted', False)
             self.update()
         event.ignore()
         super(Shape, self).hoverLeaveEvent(event)
 
+    def add_outline(self, path: QPainterPath):
+        """adds the outline of a finished shape to a path, the way paint draws it"""
+        points = self.vertices.vertices
+        if self.shape_type == 'polygon':
+            path.addPolygon(points)
+            path.closeSubpath()
+        elif self.shape_type == 'trace':
+            path.addPolygon(points)
+        elif len(points) > 1:
+            if self.shape_type == "ellipse":
+                path.addEllipse(QRectF(points[0], points[len(points) // 2]))
+            elif self.shape_type == "circle":
+                second_point = points[1] if len(points) == 2 else points[2]
+                radius = math.sqrt((points[0].x() - second_point.x()) ** 2 + (points[0].y() - second_point.y()) ** 2)
+                path.addEllipse(points[0], radius, radius)
+            elif self.shape_type == "rectangle":
+                path.addRect(QRectF(points[0], points[len(points) // 2]))
+
     def boundingRect(self) -> QRectF:
-        if self.mode == Shape.ShapeMode.CREATE:
-            # if creating the shape we need to ensure the mouse events get called, so we find the biggest boundingRect
-            # in the scene. This could probably be done cleaner
-            left_most = 0
-            top_most = 0
-            width = 0
-            height = 0
-            for item in self.scene().items():
-                if item != self and item != self.parentItem():
-                    p = item.pos()
-                    r = item.boundingRect()
-                    left_most = p.x() if p.x() < left_most else left_most
-                    top_most = p.y() if p.y() < top_most else top_most
-                    width = r.width() if r.width() > width else width
-                    height = r.height() if r.height() > height else height
-            return QRectF(left_most, top_most, width, height)
+        # shapes being drawn take no input themselves, the DrawingOverlay does
         return self.vertices.bounding_rect()
 
     def setSelected(self, selected: bool):
+        if selected:
+            # shapes drawn by the AnnotationLayer are not part of the scene, which would keep them from being selected
+            self.notify('shape_activated')
         QGraphicsItem.setSelected(self, selected)
-        """if self.isSelected():
-            self.selected.emit()
-        else:
-            self.deselected.emit()"""
+        if not selected:
+            self.notify('shape_deselected')
 
     def check_displacement(self, displacement: QPointF) -> QPointF:
         """This function checks whether the bounding rect of the current shape exceeds the image if the
@@ -317,20 +312,21 @@ class Shape(QGraphicsObject):
 
     def move_vertex(self, v_num: int, new_pos: QPointF):
         """Handles the movement of one vertex"""
-        if self.shape_type == 'polygon':
-            self.vertices.vertices[v_num] = QPointF(new_pos.x(), new_pos.y())
+        if self.shape_type in ['polygon', 'trace']:
+            self.vertices.set_point(v_num, new_pos)
         elif self.shape_type in ['rectangle', 'ellipse', 'circle']:
             if not self._anchorPoint:
                 # this point is the anchor a.k.a the point diagonally from the selected one
                 # however, as i am rebuilding the shape from there, i only need to select the anchor once and store it
                 self._anchorPoint = deepcopy(self.vertices.vertices[v_num - 2])
                 print("New Anchor Set")
-            self.vertices.vertices = QPolygonF([self._anchorPoint, new_pos])
+            self.vertices.set_points([self._anchorPoint, new_pos])
 
         if self.shape_type in ['rectangle', 'ellipse', 'circle'] and len(self.vertices.vertices) == 2:
             self.vertices.complete_poly()
 
         self.vertices.update_sel_and_high(np.asarray([new_pos.x(), new_pos.y()]))
+        self.set_modified()
 
     def paint(self, painter: QPainter, *args) -> None:
         if len(self.vertices.vertices) > 0:
@@ -371,20 +367,28 @@ class Shape(QGraphicsObject):
                     painter.drawEllipse(center, radius, radius)
                 elif self.shape_type == "rectangle":
                     painter.drawRect(QRectF(self.vertices.vertices[0], self.vertices.vertices[len(self.vertices.vertices)//2]))
+                elif self.shape_type == "trace":
+                    painter.drawPolyline(self.vertices.vertices)
 
                 if any((self.isSelected, self.is_highlighted, self.vertices.selected_vertex != -1)):
                     self.vertices.paint(painter)
 
+    def set_modified(self):
+        """marks a stored shape as changed, so it gets written on the next save"""
+        if self.state == Shape.ShapeState.STORED:
+            self.state = Shape.ShapeState.MODIFIED
+
     def to_dict(self) -> Tuple[dict, str]:
         r"""Returns a dict and a string from a shape item as those can be easier serialized
         with pickle compared to own classes"""
         # TODO: maybe json serialization? Or look into how one can pickle own classes and de-pickle them
         dictionary = {'label': self.label,
-                      'points': [[_pt.x(), _pt.y()] for _pt in self.vertices.vertices],
+                      'points': self.vertices.coords.tolist(),
                       'shape_type': self.shape_type,
                       'flags': self.flags,
                       'group_id': self.group_id,
-                      'comment': self.comment}
+                      'comment': self.comment,
+                      'uid': self.uid}
         return dictionary, self.label
 
     def update_color(self, color: QColor):
@@ -394,7 +398,7 @@ class Shape(QGraphicsObject):
             self.vertices.update_color(self.line_color, self.brush_color)
 
     def __eq__(self, other):
-        """overridden equality comparison since Shapes are now QGraphicsObjects
+        """overridden equality comparison since Shapes are QGraphicsItems
         which will always return False when compared using equality operator"""
         if isinstance(self, other.__class__):
             return (self.image_size == other.image_size and
@@ -405,13 +409,24 @@ class Shape(QGraphicsObject):
                     self.group_id == other.group_id and
                     self.comment == other.comment and
                     self.line_color == other.line_color and
-                    self.vertices.vertices == other.vertices.vertices)
+                    np.array_equal(self.vertices.coords, other.vertices.coords))
         return False
 
 
 class VertexCollection(object):
-    def __init__(self, points: List[QPointF], line_color: QColor, brush_color: QColor, vertex_size):
-        self._points = QPolygonF(points)
+    """ the vertices of a shape, kept in a contiguous (n, 2) float array
+
+    the array is the source of truth, the nearest vertex search, translation and serialization work on all points
+    at once. the QPolygonF and the squares marking the vertices are views built from the array when they are needed;
+    changes made through the collection keep them up to date or drop them, so the views themselves must not be
+    changed"""
+    # there is one collection per shape, slots keep them small in dense annotation layers
+    __slots__ = ('_coords', '_size', '_polygon', '_squares', 'line_color', 'brush_color',
+                 'highlight_color', 'vertex_size', '_highlight_size', 'highlighted_vertex', 'selected_vertex',
+                 '_scaling')
+
+    def __init__(self, points: Union[np.ndarray, List[QPointF]], line_color: QColor, brush_color: QColor,
+                 vertex_size):
         self.line_color = line_color
         self.brush_color = brush_color
         self.highlight_color = Qt.GlobalColor.white
@@ -420,61 +435,115 @@ class VertexCollection(object):
         self.highlighted_vertex = -1
         self.selected_vertex = -1
         self._scaling = SCALING_INITIAL
+        self.set_points(points)
 
     def __len__(self):
-        return len(self._points)
-
-    def bounding_rect(self):
-        return self._points.boundingRect()
-
-    def translate(self, offset):
-        self._points.translate(offset)
+        return self._size
+
+    def append(self, point: QPointF):
+        """adds a point at the end, e.g. while a trace is drawn; the array doubles its capacity when it is full"""
+        if self._size == len(self._coords):
+            coords = np.empty((max(2 * self._size, 16), 2))
+            coords[:self._size] = self._coords[:self._size]
+            self._coords = coords
+        self._coords[self._size] = (point.x(), point.y())
+        self._size += 1
+        if self._polygon is not None:
+            self._polygon.append(point)
+        if self._squares is not None:
+            self._squares.addRect(self.vertex_rect(self._size - 1, self.vertex_size / 2))
+
+    def bounding_rect(self) -> QRectF:
+        return self.vertices.boundingRect()
+
+    def translate(self, offset: QPointF):
+        self._coords[:self._size] += (offset.x(), offset.y())
+        if self._polygon is not None:
+            self._polygon.translate(offset)
+        if self._squares is not None:
+            self._squares.translate(offset)
 
     def closest_vertex(self, point: np.ndarray) -> int:
         """Calculate the euclidean distance between a point and all vertices and return the index of
         the closest node to the point"""
-        arr = np.asarray([[_pt.x(), _pt.y()] for _pt in self._points])
-        return closest_euclidean_distance(point, arr)
+        return closest_euclidean_distance(point, self.coords)
 
     def complete_poly(self):
         """This function generates the other bounding points of the shape"""
-        self._points.insert(1, QPointF(self._points[1].x(), self._points[0].y()))
-        self._points.append(QPointF(self._points[0].x(), self._points[2].y()))
+        (x0, y0), (x1, y1) = self._coords[:2].tolist()
+        self.set_points(np.array([[x0, y0], [x1, y0], [x1, y1], [x0, y1]]))
+
+    @property
+    def coords(self) -> np.ndarray:
+        """a read-only (n, 2) view on the points, changes go through the collection"""
+        coords = self._coords[:self._size]
+        coords.flags.writeable = False
+        return coords
+
+    def invalidate(self):
+        """drops the views, which are built from the array again when they are needed"""
+        self._polygon = None
+        self._squares = None
 
     def is_on_vertex(self, point: QPointF) -> Tuple[bool, int]:
         """Check if a point is within the closest vertex rectangle"""
         closest_vertex = self.closest_vertex(np.asarray([point.x(), point.y()]))
-        vertex_center = self._points[closest_vertex]
         if closest_vertex in [self.highlighted_vertex, self.selected_vertex]:
             size = (self.vertex_size * self._scaling) / 2
         else:
             size = self.vertex_size / 2
-        vertex_rect = QRectF(vertex_center - QPointF(size, size),
-                             vertex_center + QPointF(size, size))
 
-        if vertex_rect.contains(point):
+        if self.vertex_rect(closest_vertex, size).contains(point):
             return True, closest_vertex
         else:
             return False, -1
 
     def paint(self, painter: QPainter):
-        for _idx, _vertex in enumerate(self._points):
-            qt_point = _vertex
-            painter.setPen(QPen(self.line_color, 0.5))  # TODO: width dependent on the size of the image or something
-            painter.setBrush(QBrush(self.brush_color))
-
-            if _idx == self.selected_vertex:
-                painter.setBrush(QBrush(self.highlight_color))
-                painter.setPen(QPen(self.highlight_color, 0.5))
-                size = (self.vertex_size * self._scaling) / 2
-
-            elif _idx == self.highlighted_vertex:
-                painter.setBrush(QBrush(self.highlight_color))
-                size = (self.vertex_size * self._scaling) / 2
-            else:
-                size = self.vertex_size / 2  # determines the diagonal of the rectangle
-            painter.drawRect(QRectF(qt_point - QPointF(size, size),
-                                    qt_point + QPointF(size, size)))
+        painter.setPen(QPen(self.line_color, 0.5))  # TODO: width dependent on the size of the image or something
+        painter.setBrush(QBrush(self.brush_color))
+        painter.drawPath(self.square_path())
+
+        # the highlighted and the selected vertex are drawn larger on top
+        size = (self.vertex_size * self._scaling) / 2
+        painter.setBrush(QBrush(self.highlight_color))
+        if 0 <= self.highlighted_vertex < self._size and self.highlighted_vertex != self.selected_vertex:
+            painter.drawRect(self.vertex_rect(self.highlighted_vertex, size))
+        if 0 <= self.selected_vertex < self._size:
+            painter.setPen(QPen(self.highlight_color, 0.5))
+            painter.drawRect(self.vertex_rect(self.selected_vertex, size))
+
+    def set_point(self, index: int, point: QPointF):
+        """moves one vertex, the views are changed in place"""
+        index = range(self._size)[index]
+        self._coords[index] = (point.x(), point.y())
+        if self._polygon is not None:
+            self._polygon[index] = point
+        if self._squares is not None:
+            # the elements of a square added by addRect: its top left corner, the other corners and back
+            rect = self.vertex_rect(index, self.vertex_size / 2)
+            for element, corner in enumerate((rect.topLeft(), rect.topRight(), rect.bottomRight(),
+                                              rect.bottomLeft(), rect.topLeft())):
+                self._squares.setElementPositionAt(5 * index + element, corner.x(), corner.y())
+
+    def set_points(self, points: Union[np.ndarray, List[QPointF]]):
+        """replaces all points by a copy of an (n, 2) array or a list of points"""
+        if isinstance(points, np.ndarray):
+            self._coords = np.array(points, dtype=float).reshape(-1, 2)
+        else:
+            self._coords = np.array([(point.x(), point.y()) for point in points], dtype=float).reshape(-1, 2)
+        self._size = len(self._coords)
+        self.invalidate()
+
+    def square_path(self) -> QPainterPath:
+        """the squares marking the vertices as one path"""
+        if self._squares is None:
+            self._squares = QPainterPath()
+            # squares of neighbouring vertices overlap, which would cut holes with the default odd even fill
+            self._squares.setFillRule(Qt.FillRule.WindingFill)
+            size = self.vertex_size / 2
+            for x, y in self.coords.tolist():
+                self._squares.addRect(x - size, y - size, 2 * size, 2 * size)
+        return self._squares
 
     def update_color(self, line_color: QColor, brush_color: QColor):
         if line_color and brush_color:
@@ -485,10 +554,18 @@ class VertexCollection(object):
         idx = self.closest_vertex(new_pos)
         self.selected_vertex = self.highlighted_vertex = idx
 
+    def vertex_rect(self, index: int, size: float) -> QRectF:
+        """the square of a vertex with half the edge length size"""
+        x, y = self._coords[index].tolist()
+        return QRectF(x - size, y - size, 2 * size, 2 * size)
+
     @property
     def vertices(self) -> QPolygonF:
-        return self._points
+        """the points as polygon, built once after the points were replaced"""
+        if self._polygon is None:
+            self._polygon = polygon_from_array(self.coords)
+        return self._polygon
 
     @vertices.setter
-    def vertices(self, value):
-        self._points = value
+    def vertices(self, value: Union[np.ndarray, List[QPointF]]):
+        self.set_points(value)
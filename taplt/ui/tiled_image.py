@@ -0,0 +1,81 @@
+from PySide6.QtWidgets import QGraphicsItem, QGraphicsObject, QStyleOptionGraphicsItem, QWidget
+from PySide6.QtGui import QImage, QPainter, QPixmap
+from PySide6.QtCore import Signal, QRectF, QThreadPool
+
+import math
+
+from taplt.utils.cache import LRUCache
+from taplt.utils.image_pyramid import Pyramid, TILE_SIZE
+
+
+class TiledImageItem(QGraphicsObject):
+    """ displays an image from its pyramid in the coordinates of the full resolution image
+
+    only the tiles in view are drawn, from the level matching the zoom; missing tiles are read in a thread pool
+    while the coarsest level, which is a single tile, stands in for them. read tiles are kept in a cache
+    limited in bytes, the least recently drawn ones are dropped first"""
+    sTileLoaded = Signal(int, int, int, QImage)  # level, column, row, tile
+
+    def __init__(self, pyramid: Pyramid, max_bytes: int = 134217728, max_threads: int = 2):
+        super(TiledImageItem, self).__init__()
+        self.setFlag(QGraphicsItem.GraphicsItemFlag.ItemUsesExtendedStyleOption)
+        self.pyramid = pyramid
+        self.tiles = LRUCache(max_bytes, lambda pixmap: pixmap.width() * pixmap.height() * pixmap.depth() // 8)
+        self.requested = set()
+        self.visible = set()  # the tiles of the latest paint, requests for other tiles are skipped
+        self.pool = QThreadPool()
+        self.pool.setMaxThreadCount(max_threads)
+        self.overview = QPixmap(pyramid.tile_path(pyramid.levels - 1, 0, 0))
+        self.sTileLoaded.connect(self.tile_loaded)
+
+    def boundingRect(self) -> QRectF:
+        return QRectF(0, 0, self.pyramid.width, self.pyramid.height)
+
+    def paint(self, painter: QPainter, option: QStyleOptionGraphicsItem, widget: QWidget = None):
+        painter.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform)
+        painter.drawPixmap(self.boundingRect(), self.overview, QRectF(self.overview.rect()))
+
+        level = self.pyramid.level_for(option.levelOfDetailFromTransform(painter.worldTransform()))
+        scale_x, scale_y = self.tile_scale(level)
+        exposed = option.exposedRect & self.boundingRect()
+        columns = range(int(exposed.left() / scale_x), math.ceil(exposed.right() / scale_x))
+        rows = range(int(exposed.top() / scale_y), math.ceil(exposed.bottom() / scale_y))
+        self.visible = {(level, column, row) for column in columns for row in rows}
+        for key in sorted(self.visible):
+            tile = self.tiles.get(key)
+            if tile is None:
+                self.request(*key)
+            else:
+                target = QRectF(key[1] * scale_x, key[2] * scale_y,
+                                tile.width() * scale_x / TILE_SIZE, tile.height() * scale_y / TILE_SIZE)
+                painter.drawPixmap(target, tile, QRectF(tile.rect()))
+
+    def request(self, level: int, column: int, row: int):
+        """reads a tile in the thread pool unless it is already requested"""
+        key = (level, column, row)
+        if key in self.requested:
+            return
+        self.requested.add(key)
+        path = self.pyramid.tile_path(level, column, row)
+
+        def read():
+            # panned or zoomed out of view while the request was waiting
+            image = QImage(path) if key in self.visible else QImage()
+            self.sTileLoaded.emit(level, column, row, image)
+
+        self.pool.start(read)
+
+    def tile_loaded(self, level: int, column: int, row: int, image: QImage):
+        """stores a read tile and draws it; runs in the gui thread"""
+        key = (level, column, row)
+        self.requested.discard(key)
+        if image.isNull():
+            return
+        self.tiles.put(key, QPixmap.fromImage(image))
+        scale_x, scale_y = self.tile_scale(level)
+        self.update(QRectF(column * scale_x, row * scale_y, scale_x, scale_y))
+
+    def tile_scale(self, level: int) -> tuple:
+        """the extent of a tile of the level in the coordinates of the full resolution"""
+        size = self.pyramid.level_size(level)
+        return TILE_SIZE * self.pyramid.width / size.width(), TILE_SIZE * self.pyramid.height / size.height()
@@ -0,0 +1,62 @@
+import collections
+from typing import Callable, Hashable
+
+
+class LRUCache:
+    """a mapping which keeps the total size of its values below a number of bytes
+    by dropping the least recently used ones; not thread-safe"""
+
+    def __init__(self, max_bytes: int, size: Callable[[object], int]):
+        """
+        :param max_bytes: the maximum total size of the values, values larger than this are never stored
+        :param size: returns the size of a value in bytes
+        """
+        self.max_bytes = max_bytes
+        self.size = size
+        self.items = collections.OrderedDict()  # key -> (value, size), least recently used first
+        self.num_bytes = 0
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.items
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def clear(self):
+        self.items.clear()
+        self.num_bytes = 0
+
+    def get(self, key: Hashable, default=None):
+        """returns the value of the key and marks it as recently used"""
+        if key not in self.items:
+            return default
+        self.items.move_to_end(key)
+        return self.items[key][0]
+
+    def pop(self, key: Hashable, default=None):
+        """removes the key, e.g. because its value became outdated"""
+        if key not in self.items:
+            return default
+        value, size = self.items.pop(key)
+        self.num_bytes -= size
+        return value
+
+    def put(self, key: Hashable, value):
+        """stores the value as the most recently used one and drops the least recently used values if necessary"""
+        self.pop(key)
+        size = self.size(value)
+        if size > self.max_bytes:
+            return
+        self.items[key] = (value, size)
+        self.num_bytes += size
+        self.shrink()
+
+    def set_limit(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.shrink()
+
+    def shrink(self):
+        """drops the least recently used values until the total size is within the limit"""
+        while self.num_bytes > self.max_bytes:
+            _, (_, size) = self.items.popitem(last=False)
+            self.num_bytes -= size
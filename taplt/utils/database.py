@@ -1,19 +1,27 @@
+import bisect
+import contextlib
 import enum
+import json
+import queue
 import sqlite3
 import pickle
 import pathlib
-import shutil
 import os
+import threading
+import numpy as np
 
-from typing import List, Union
+from typing import List, Optional, Union
+from taplt.utils.cache import LRUCache
+from taplt.utils.importer import FileImporter, CANCELLED, TRANSFER_MODES, content_hash, link_object, store_object, \
+    store_path
 from taplt.utils.project_structure import modality, create_project_structure, Structure, Modality
-from taplt.utils.settings import SETTINGS, get_tooltip
+from taplt.utils.settings import SETTINGS, DATABASE_SETTINGS, PREFETCH_SETTINGS, get_tooltip
+from taplt.utils.thumbnails import ThumbnailCache
 
-from PySide6.QtCore import Signal, QObject, QSettings
+from PySide6.QtCore import Signal, Slot, QObject, QSettings
 
-# TODO: 'file' value references the uid in either 'videos', 'images', or 'whole slide images'
-#  (depends on 'modality' value),
-#  therefore no foreign key constraint here; need to implement it somewhere else (?)
+# the initial schema (version 0), new projects are brought up to date by the MIGRATIONS like existing ones;
+# the annotations and the per-modality file tables are replaced in version 3, see unify_file_tables
 CREATE_ANNOTATIONS_TABLE = """
     CREATE TABLE IF NOT EXISTS annotations (
     uid INTEGER PRIMARY KEY,
@@ -53,7 +61,11 @@ CREATE_WSI_TABLE = """
     institution TEXT,
     FOREIGN KEY (patient) REFERENCES patients(uid));"""
 
-FILE_TABLES = ['images', 'videos', 'slides']
+# the per-modality file tables before schema version 3, indexed by Modality
+FILE_TABLES = ['videos', 'images', 'slides']
+
+# the order in which the files of the different modalities are listed in the gui
+DISPLAY_ORDER = [Modality.image, Modality.video, Modality.slide]
 
 CREATE_PATIENTS_TABLE = """
     CREATE TABLE IF NOT EXISTS patients (
@@ -66,94 +78,350 @@ CREATE_LABELS_TABLE = """
     uid INTEGER PRIMARY KEY,
     label_class TEXT NOT NULL UNIQUE);"""
 
-ADD_ANNOTATION = "INSERT INTO annotations (modality, file, patient, shape, label) VALUES (?, ?, ?, ?, ?);"
-ADD_VIDEO = "INSERT INTO videos (filename, patient) VALUES (?, ?);"
-ADD_IMAGE = "INSERT INTO images (filename, patient) VALUES (?, ?);"
-ADD_WSI = "INSERT INTO 'slides' (filename, patient) VALUES (?, ?);"
+ADD_ANNOTATION = """INSERT INTO annotations (file, patient, label, shape_type, group_id, comment, points)
+                    VALUES (:file, :patient, :label, :shape_type, :group_id, :comment, :points);"""
+ADD_FILE = "INSERT INTO files (filename, modality, patient, content_hash) VALUES (?, ?, ?, ?);"
 ADD_PATIENT = "INSERT INTO patients (some_id, another_id) VALUES (?, ?);"
 ADD_LABEL = "INSERT INTO labels (label_class) VALUES (?);"
 
-DELETE_FILE_ANNOTATIONS = "DELETE FROM annotations WHERE modality = ? AND file = ?"
+UPDATE_ANNOTATION = """UPDATE annotations SET label = :label, shape_type = :shape_type, group_id = :group_id,
+                       comment = :comment, points = :points WHERE uid = :uid AND file = :file;"""
+DELETE_ANNOTATION = "DELETE FROM annotations WHERE uid = ? AND file = ?;"
+
+# the annotations are removed by the foreign key's cascade
+DELETE_FILE = "DELETE FROM files WHERE uid = ?;"
+
+SELECT_FILE_ANNOTATIONS = """
+    SELECT labels.label_class, annotations.shape_type, annotations.group_id, annotations.comment,
+           annotations.points, annotations.uid
+    FROM annotations JOIN labels ON labels.uid = annotations.label
+    WHERE annotations.file = ?
+    ORDER BY annotations.uid;"""
+
+# vertices are stored as packed little-endian float32 (x, y) pairs
+POINTS_DTYPE = np.dtype('<f4')
+
+# all files in display order together with their modality, patient and number of annotations
+SELECT_FILES = """
+    WITH counts AS (
+        SELECT file, COUNT(*) AS num_annotations FROM annotations GROUP BY file)
+    SELECT files.uid, files.filename, files.modality, patients.some_id, IFNULL(counts.num_annotations, 0)
+    FROM files
+    LEFT JOIN patients ON patients.uid = files.patient
+    LEFT JOIN counts ON counts.file = files.uid
+    ORDER BY CASE files.modality {} END, files.filename;""".format(
+        " ".join("WHEN {} THEN {}".format(int(moda), rank) for rank, moda in enumerate(DISPLAY_ORDER)))
+
+# a page of the files of one modality in display order, starting after the given filename
+SELECT_FILE_PAGE = """
+    SELECT uid, filename, (SELECT COUNT(*) FROM annotations WHERE annotations.file = files.uid)
+    FROM files
+    WHERE modality = ? AND filename > ? AND filename LIKE ? ESCAPE '\\'
+    ORDER BY filename LIMIT ?;"""
+
+# the files of one modality before the given filename in reverse display order, read backwards on the
+# (modality, filename) index
+SELECT_PREVIOUS_FILES = """
+    SELECT uid, filename, (SELECT COUNT(*) FROM annotations WHERE annotations.file = files.uid)
+    FROM files
+    WHERE modality = ? AND filename < ? AND filename LIKE ? ESCAPE '\\'
+    ORDER BY filename DESC LIMIT ?;"""
+# sorts after all filenames, as it is the last code point
+LAST_FILENAME = "\U0010ffff"
+
+# the full-text search index of each search scope: (fts table, indexed column), see add_search_index
+SEARCH_SCOPES = {'files': ('files_search', 'filename'),
+                 'patients': ('patients_search', 'some_id'),
+                 'labels': ('labels_search', 'label_class'),
+                 'comments': ('comments_search', 'comment')}
+
+# the files matching a full-text query, best matches first
+SEARCH_FILES = """
+    SELECT files.uid, files.filename, files.modality,
+           (SELECT COUNT(*) FROM annotations WHERE annotations.file = files.uid)
+    FROM files_search JOIN files ON files.uid = files_search.rowid
+    WHERE files_search MATCH ?
+    ORDER BY files_search.rank LIMIT ?;"""
+
+# the uids of all files, used to fill the lookup caches of SQLiteDatabase
+SELECT_FILE_UIDS = "SELECT filename, modality, uid, patient, content_hash FROM files;"
+
+
+class Update(enum.IntEnum):
+    """the kinds of changes the database reports to the gui via sUpdate;
+    each change is emitted as a tuple (kind, *payload)"""
+    PROJECT = 0         # (number of files, classes) - a new or reloaded project
+    FILE_ADDED = 1      # (sort key, file uid, filepath, annotation count) - files are listed in the order of their keys
+    FILE_REMOVED = 2    # (file uid,)
+    FILE_STATUS = 3     # (file uid, annotation count)
+    LABELS_ADDED = 4    # (classes,)
+    FILE_LOADED = 5     # (file uid, filepath, patient, labels) - the file to be displayed
+    ANNOTATIONS_SAVED = 6   # (file uid, uids) - the uids of the newly created annotations in the order they were sent
+    FILES_PREFETCHED = 7    # (filepaths,) - files whose annotations were loaded in advance, nearest first
+    IMPORT_PROGRESS = 8     # (processed, total, failed) - progress of the bulk imports, complete if processed == total
+
+
+class ConnectionManager:
+    """opens the connections to a project database: the write connection, owned by the thread calling connect,
+    and a small pool of read-only connections which can be used from any thread, one at a time"""
+
+    def __init__(self, database_path: str, settings: dict):
+        """
+        :param database_path: path to the database
+        :param settings: the values of DATABASE_SETTINGS, keyed by the names after 'Database/'
+        """
+        self.database_path = database_path
+        self.journal_mode = pragma_keyword(settings['journal_mode'])
+        self.synchronous = pragma_keyword(settings['synchronous'])
+        self.cache_size = int(settings['cache_size'])
+        self.mmap_size = int(settings['mmap_size'])
+        self.temp_store = pragma_keyword(settings['temp_store'])
+        self.max_readers = max(1, int(settings['read_connections']))
+        self.readers = queue.LifoQueue()
+        self.num_readers = 0
+        self.lock = threading.Lock()
+
+    def close(self):
+        """closes all read connections which are currently not in use"""
+        while True:
+            try:
+                self.readers.get_nowait().close()
+            except queue.Empty:
+                break
+            with self.lock:
+                self.num_readers -= 1
+
+    def configure(self, connection: sqlite3.Connection):
+        """applies the per-connection pragmas"""
+        connection.execute("PRAGMA synchronous = {}".format(self.synchronous))
+        connection.execute("PRAGMA cache_size = {}".format(self.cache_size))
+        connection.execute("PRAGMA mmap_size = {}".format(self.mmap_size))
+        connection.execute("PRAGMA temp_store = {}".format(self.temp_store))
+        connection.execute("PRAGMA foreign_keys = ON")
+
+    def connect(self) -> sqlite3.Connection:
+        """opens the write connection; the journal mode is stored in the database file"""
+        connection = sqlite3.connect(self.database_path)
+        connection.execute("PRAGMA journal_mode = {}".format(self.journal_mode))
+        self.configure(connection)
+        return connection
+
+    def open_reader(self) -> sqlite3.Connection:
+        """opens a new read-only connection outside of the pool, which the caller has to close"""
+        uri = pathlib.Path(self.database_path).absolute().as_uri() + "?mode=ro"
+        connection = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        self.configure(connection)
+        return connection
+
+    @contextlib.contextmanager
+    def reader(self) -> sqlite3.Connection:
+        """borrows a read-only connection from the pool, opening a new one if the pool is not exhausted yet"""
+        try:
+            connection = self.readers.get_nowait()
+        except queue.Empty:
+            with self.lock:
+                create = self.num_readers < self.max_readers
+                if create:
+                    self.num_readers += 1
+            if create:
+                connection = self.open_reader()
+            else:
+                connection = self.readers.get()
+        try:
+            yield connection
+        finally:
+            self.readers.put(connection)
+
+
+class TablePreview:
+    """a read-only view of a table on a connection of its own, queried page by page by the preview dialog;
+    BLOB columns are replaced by their size, so their payload is never read"""
+
+    def __init__(self, connection: sqlite3.Connection, table_name: str, columns: list, blobs: list):
+        """
+        :param connection: a read-only connection, closed together with the preview
+        :param table_name: name of the table
+        :param columns: names of the columns
+        :param blobs: for each column, whether it holds BLOB payloads
+        """
+        self.connection = connection
+        self.table_name = table_name
+        self.columns = columns
+        self.blobs = blobs
+
+    def close(self):
+        """closes the connection, all cursors returned by query become invalid"""
+        self.connection.close()
+
+    def query(self, sort_column: int = None, descending: bool = False, search: str = "") -> sqlite3.Cursor:
+        """
+        runs the query for the rows of the table, sorted and filtered by sqlite
+        :param sort_column: index of the column to sort by, the order of insertion if not specified
+        :param descending: whether to sort in descending order
+        :param search: only rows where any column other than a BLOB contains this text
+        :return: a cursor which yields the rows while they are fetched
+        """
+        names = [sql_identifier(column) for column in self.columns]
+        projection = ["length({0}) AS {0}".format(name) if blob else name for name, blob in zip(names, self.blobs)]
+        sql = "SELECT {} FROM {}".format(", ".join(projection), sql_identifier(self.table_name))
+        parameters = list()
+        searched = [name for name, blob in zip(names, self.blobs) if not blob]
+        if search and searched:
+            sql += " WHERE " + " OR ".join("{} LIKE ? ESCAPE '\\'".format(name) for name in searched)
+            pattern = like_pattern(search)
+            parameters = [pattern] * len(searched)
+        direction = "DESC" if descending else "ASC"
+        if sort_column is not None:
+            sql += " ORDER BY {} {}, rowid {}".format(names[sort_column], direction, direction)
+        else:
+            sql += " ORDER BY rowid"
+        return self.connection.execute(sql, parameters)
 
 
 class SQLiteDatabase(QObject):
-    """class to control an SQL database. inherits a QObject to enable pyqt-signal transfer"""
-    sUpdate = Signal(list, int, str, list, list)
+    """class to control an SQL database. inherits a QObject to enable pyqt-signal transfer
+
+    the database is meant to live in its own QThread (see MainLogic): all requests arrive as queued signals
+    and are handled one after another in the order they were sent, results are sent back via signals.
+    the sqlite connection is opened in initialize and therefore owned by that thread"""
+    sUpdate = Signal(list)
     sImportFile = Signal(list)
     sOpenSettings = Signal(list)
     sApplySettings = Signal(list)
-    sPreviewDatabase = Signal(list, list)
+    sPreviewDatabase = Signal(object)
 
     def __init__(self):
         super(SQLiteDatabase, self).__init__()
+        self.connections = None  # type: ConnectionManager
         self.connection = None
         self.cursor = None
         self.location = ""
-        self.file_tables = FILE_TABLES
         self.is_initialized = False
         self.settings = None  # type: QSettings
         self.database_path = "none"
 
-    def add_annotation(self, modality: int, file: int, patient: int, shape: bytes, label: int):
+        # uids of the files in display order and their sort keys (rank of the modality, filename) in the same order,
+        # kept up to date incrementally; positions are found by bisecting the keys
+        self.files = list()
+        self.file_keys = list()
+
+        # write-through lookup caches, filled in initialize and updated by every method changing the rows;
+        # call invalidate_caches after modifying these tables by other means
+        self.file_uids = dict()     # filename -> (modality, file uid, patient uid)
+        self.filenames = dict()     # file uid -> filename
+        self.file_hashes = dict()   # file uid -> content hash, for the files imported since schema version 6
+        self.label_uids = dict()    # label class -> uid, in the order of the uids
+        self.patient_uids = dict()  # patient id -> uid
+        self.patient_ids = dict()   # uid -> patient id
+
+        # the annotation rows of recently loaded and prefetched files, dropped whenever the annotations of a file change
+        self.annotation_rows = LRUCache(0, rows_size)  # file uid -> rows of SELECT_FILE_ANNOTATIONS
+
+        # previews of the images, generated in the background and read by the file list
+        self.thumbnails = ThumbnailCache()
+
+        # bulk imports: the files being transferred, filename -> (filepath, patient, transfer mode),
+        # and the progress of all running imports as [processed, total, failed], see import_files
+        self.importer = FileImporter()
+        self.importer.sTransferred.connect(self.register_files)
+        self.imports = dict()
+        self.import_progress = [0, 0, 0]
+
+        # number of file requests which were sent but not handled yet, see count_file_request
+        self.pending_file_requests = 0
+        self.requests_lock = threading.Lock()
+
+    def add_annotation(self, file: int, patient: int, label: int, label_dict: dict):
         """ adds an entry to the annotation table using the parameter values"""
+        entry = {'file': file, 'patient': patient, 'label': label}
+        entry.update(encode_shape(label_dict))
         with self.connection:
-            self.cursor.execute(ADD_ANNOTATION, (modality, file, patient, shape, label))
+            self.cursor.execute(ADD_ANNOTATION, entry)
 
     def add_file(self, filepath: str, patient: str):
         """
-        adds a file to the database
+        adds a file to the database, see insert_file
         :param filepath: the name of the file to be added
         :param patient: a patient id which may be added to the database
         """
+        # add the patient if it does not exist yet
+        patient = self.add_patient(patient)
+        digest = content_hash(filepath)
+        store_object(self.location + Structure.STORE_DIR, filepath, digest)
         with self.connection:
+            inserted = self.insert_file(filepath, digest, patient, dict())
+        if inserted is None:
+            return
+        updates = self.file_inserted(*inserted)
 
-            # check if patient already exists, add if necessary
-            p = self.cursor.execute("""SELECT uid FROM patients WHERE some_id = ?""", (patient,)).fetchone()
-            patient = p[0] if p else self.add_patient(patient)
-            mod = modality(filepath)
-
-            # copy to project location and add to database
-            if mod == Modality.video:
-                shutil.copy(filepath, self.location + Structure.VIDEOS_DIR)
-                self.cursor.execute(ADD_VIDEO, (os.path.basename(filepath), patient))
-            elif mod == Modality.image:
-                shutil.copy(filepath, self.location + Structure.IMAGES_DIR)
-                self.cursor.execute(ADD_IMAGE, (os.path.basename(filepath), patient))
-            elif mod == Modality.slide:
-                shutil.copy(filepath, self.location + Structure.SLIDES_DIR)
-                self.cursor.execute(ADD_WSI, (os.path.basename(filepath), patient))
+        # a running project only gets notified about the new file
+        if self.is_initialized:
+            self.sUpdate.emit(updates)
 
     def add_label(self, label_class: str):
         """ add a new label class to database"""
+        # make sure label does not already exist
+        if label_class in self.label_uids:
+            return
         with self.connection:
-            # make sure label does not already exist
-            if self.cursor.execute("SELECT uid FROM labels WHERE label_class = ?", (label_class,)).fetchone():
-                return
             self.cursor.execute(ADD_LABEL, (label_class,))
+        self.label_uids[label_class] = self.cursor.lastrowid
 
     def add_patient(self, some_id: str, another_id: str = "2"):
         """ add a new patient to database
-        returns the uid of the new patient"""
+        returns the uid of the patient, which may have existed before"""
+        # patient ids are compared as text, sqlite stores numeric ids as integers
+        some_id = str(some_id)
+        if some_id in self.patient_uids:
+            return self.patient_uids[some_id]
         with self.connection:
-            # make sure patient does not already exist
-            if self.cursor.execute("SELECT uid FROM patients WHERE some_id = ?", (some_id,)).fetchone():
-                return
             self.cursor.execute(ADD_PATIENT, (some_id, another_id))
-            result = self.cursor.execute("SELECT uid FROM patients WHERE some_id = ?", (some_id,)).fetchone()
-        return result[0]
-
-    def create_annotation_entry(self, filename: str, label_dict: dict, label_class: str):
-        mod, file_uid = self.get_uids_from_filename(filename)
-        patient_uid = self.get_patient_by_filename(filename, mod)
-        label_class = self.get_uid_from_label(label_class)
-
-        annotation_entry = {'modality': mod,
-                            'file': file_uid,
-                            'patient': patient_uid,
-                            'shape': pickle.dumps(label_dict),
-                            'label': label_class}
+        uid = self.cursor.lastrowid
+        self.patient_uids[some_id] = uid
+        self.patient_ids[uid] = some_id
+        return uid
+
+    def cancel_import(self):
+        """stops the running imports; the files transferred so far are registered, the others are skipped"""
+        self.importer.cancel()
+        self.remove_import_journal()
+
+    def clear_caches(self):
+        """empties the lookup caches, see invalidate_caches"""
+        self.file_uids = dict()
+        self.filenames = dict()
+        self.file_hashes = dict()
+        self.label_uids = dict()
+        self.patient_uids = dict()
+        self.patient_ids = dict()
+        self.annotation_rows.clear()
+
+    @Slot()
+    def close(self):
+        """closes the connection to the current project's database"""
+        if self.connection is not None:
+            self.connection.close()
+            self.connections.close()
+        self.connection = None
+        self.connections = None
+        self.cursor = None
+        self.thumbnails.set_directory(None)
+        # running imports are resumed from the journal when the project is opened again
+        self.importer.reset()
+        self.imports = dict()
+        self.import_progress = [0, 0, 0]
+        self.is_initialized = False
+        self.files = list()
+        self.file_keys = list()
+        self.clear_caches()
 
-        return annotation_entry
+    def count_file_request(self, file_uid: int):
+        """
+        has to be connected directly (i.e. running in the gui thread) and before load_file,
+        so load_file can tell whether a newer file request is already waiting in the queue
+        """
+        with self.requests_lock:
+            self.pending_file_requests += 1
 
     def create_initial_tables(self):
         """
@@ -168,27 +436,52 @@ class SQLiteDatabase(QObject):
             self.cursor.execute(CREATE_LABELS_TABLE)
             self.cursor.execute(CREATE_ANNOTATIONS_TABLE)
 
-    def delete_file(self, filename: str, cur_img_idx: int):
+    def delete_file(self, file_uid: int, current_uid: int):
         """ this method deletes a file from the database and removes all corresponding annotations
-        updates the gui afterwards while regarding the possible image switching"""
-        deleted_idx = 0
-        images = self.get_images()
-        for i in range(len(images)):
-            if images[i] == filename:
-                deleted_idx = i
-        if cur_img_idx == 0:
-            new_img_idx = 0
-        elif deleted_idx <= cur_img_idx:
-            new_img_idx = cur_img_idx - 1
-        else:
-            new_img_idx = cur_img_idx
-
-        modality, file = self.get_uids_from_filename(filename)
-        table_name = self.file_tables[modality]
+        updates the gui afterwards while regarding the possible image switching
+        :param file_uid: the file to be deleted
+        :param current_uid: the file which is currently displayed"""
+        filename = self.filenames.pop(file_uid)
+        moda, _, _ = self.file_uids.pop(filename)
+        self.file_hashes.pop(file_uid, None)
+        self.annotation_rows.pop(file_uid)
+        self.thumbnails.remove(file_uid)
+        with self.connection:
+            self.cursor.execute(DELETE_FILE, (file_uid,))
+        index = bisect.bisect_left(self.file_keys, (DISPLAY_ORDER.index(moda), filename))
+        self.file_keys.pop(index)
+        self.files.pop(index)
+
+        # the displayed file only has to be replaced if it was the deleted one, the previous file is shown instead
+        updates = [(Update.FILE_REMOVED, file_uid)]
+        if file_uid == current_uid and self.files:
+            updates.append(self.load_update(self.files[max(index - 1, 0)]))
+        self.sUpdate.emit(updates)
+
+    def file_inserted(self, filename: str, mod: Modality, uid: int, patient: int, digest: str) -> list:
+        """updates the caches once the row of a new file was committed, returns the updates for the gui"""
+        self.file_uids[filename] = (mod, uid, patient)
+        self.filenames[uid] = filename
+        self.file_hashes[uid] = digest
+        if mod == Modality.image:
+            self.thumbnails.generate(uid, self.get_filepath(filename, mod))
+        return self.list_file(filename, mod, uid) if self.is_initialized else list()
+
+    def get_annotation_count(self, filename: str) -> int:
+        """returns the number of annotations of the specified file"""
+        _, file = self.get_uids_from_filename(filename)
         with self.connection:
-            self.cursor.execute(DELETE_FILE_ANNOTATIONS, (modality, file))
-            self.cursor.execute("DELETE FROM {} WHERE filename = ?".format(table_name), (filename,))
-        self.update_gui(new_img_idx)
+            result = self.cursor.execute("SELECT COUNT(*) FROM annotations WHERE file = ?", (file,)).fetchone()
+        return result[0]
+
+    def get_annotation_rows(self, file_uid: int) -> list:
+        """returns the rows of SELECT_FILE_ANNOTATIONS of the specified file, from the cache if possible"""
+        rows = self.annotation_rows.get(file_uid)
+        if rows is None:
+            with self.connection:
+                rows = self.cursor.execute(SELECT_FILE_ANNOTATIONS, (file_uid,)).fetchall()
+            self.annotation_rows.put(file_uid, rows)
+        return rows
 
     def get_column_names(self, table_name: str) -> list:
         """
@@ -199,103 +492,150 @@ class SQLiteDatabase(QObject):
             columns = self.cursor.execute("PRAGMA table_info({})".format(table_name)).fetchall()
         return [col[0] for col in columns]
 
+    def get_file_page(self, after: tuple = None, limit: int = 500, search: str = "") -> list:
+        """
+        reads a page of the file list on a pooled read connection, so it can be called from any thread
+        :param after: the sort key (modality rank, filename) of the last file of the previous page,
+                      None for the first page
+        :param limit: the maximum number of files
+        :param search: only files whose names contain this text (case-insensitive) are listed
+        :return: a list of tuples (uid, filename, sort key, number of annotations) in display order
+        """
+        connections = self.connections
+        if connections is None:
+            return list()
+        rank, name = after if after is not None else (0, "")
+        pattern = like_pattern(search)
+        files = list()
+        with connections.reader() as connection:
+            # each modality is read in the order of its (modality, filename) index
+            for rank in range(rank, len(DISPLAY_ORDER)):
+                page = connection.execute(SELECT_FILE_PAGE, (int(DISPLAY_ORDER[rank]), name, pattern,
+                                                             limit - len(files))).fetchall()
+                files.extend((uid, filename, (rank, filename), num) for uid, filename, num in page)
+                if len(files) >= limit:
+                    break
+                name = ""
+        return files
+
+    def get_previous_files(self, before: tuple = None, limit: int = 1, search: str = "") -> list:
+        """
+        reads the files before a file of the file list on a pooled read connection, without reading the pages
+        before them, e.g. to go back from the first file to the end of the list
+        :param before: the sort key (modality rank, filename) of the file, None to read from the end of the list
+        :param limit: the maximum number of files
+        :param search: only files whose names contain this text (case-insensitive) are listed
+        :return: a list of tuples (uid, filename, sort key, number of annotations) like get_file_page, nearest first
+        """
+        connections = self.connections
+        if connections is None:
+            return list()
+        rank, name = before if before is not None else (len(DISPLAY_ORDER) - 1, LAST_FILENAME)
+        pattern = like_pattern(search)
+        files = list()
+        with connections.reader() as connection:
+            for rank in range(rank, -1, -1):
+                page = connection.execute(SELECT_PREVIOUS_FILES, (int(DISPLAY_ORDER[rank]), name, pattern,
+                                                                  limit - len(files))).fetchall()
+                files.extend((uid, filename, (rank, filename), num) for uid, filename, num in page)
+                if len(files) >= limit:
+                    break
+                name = LAST_FILENAME
+        return files
+
+    def get_filepath(self, filename: str, moda: int) -> str:
+        """returns the full path of a project file"""
+        if moda == Modality.image:
+            return self.location + Structure.IMAGES_DIR + filename
+        elif moda == Modality.video:
+            return self.location + Structure.VIDEOS_DIR + filename
+        return self.location + Structure.SLIDES_DIR + filename
+
+    def get_files(self) -> list:
+        """
+        collects all project files with a single query, without loading any annotation shapes
+        :return: a list of tuples (uid, filename, modality, patient id, number of annotations) in display order
+        """
+        with self.connection:
+            files = self.cursor.execute(SELECT_FILES).fetchall()
+        return [(uid, filename, Modality(moda), patient, num) for uid, filename, moda, patient, num in files]
+
     def get_images(self) -> list:
         """ returns a list of all image names which are currently stored in the database"""
         with self.connection:
-            image_paths = self.cursor.execute("SELECT filename FROM images").fetchall()
+            image_paths = self.cursor.execute("SELECT filename FROM files WHERE modality = ?",
+                                              (int(Modality.image),)).fetchall()
         return [image_path[0] for image_path in image_paths]
 
     def get_videos(self) -> list:
         """ returns a list of all video names which are currently stored in the database"""
         with self.connection:
-            video_paths = self.cursor.execute("SELECT filename FROM videos").fetchall()
+            video_paths = self.cursor.execute("SELECT filename FROM files WHERE modality = ?",
+                                              (int(Modality.video),)).fetchall()
         return [video_path[0] for video_path in video_paths]
 
     def get_slides(self) -> list:
         """ returns a list of all wsi names which are currently stored in the database"""
         with self.connection:
-            wsi_paths = self.cursor.execute("SELECT filename FROM slides").fetchall()
+            wsi_paths = self.cursor.execute("SELECT filename FROM files WHERE modality = ?",
+                                            (int(Modality.slide),)).fetchall()
         return [wsi_path[0] for wsi_path in wsi_paths]
 
     def get_label_classes(self) -> list:
         """
         :return: a list of all label classes which are currently stored in the database
         """
-        with self.connection:
-            label_classes = self.cursor.execute("SELECT label_class FROM labels").fetchall()
-        return [label_class[0] for label_class in label_classes]
+        return list(self.label_uids)
 
     def get_label_from_file(self, image: str, moda=0):
         """
         :param image: the image name to be searched in
         :return: a list of all label shapes related to the specified image
         """
-        with self.connection:
-            table = self.file_tables[moda]
-            image_id = self.get_uid_from_filename(table, image)
-            labels = self.cursor.execute("""SELECT shape FROM annotations
-                                            WHERE modality = ? AND file = ?""", (moda, image_id,)).fetchall()
-
-        return check_for_bytes(labels)
+        image_id = self.file_uids[image][1]
+        return [decode_shape(*label) for label in self.get_annotation_rows(image_id)]
 
     def get_patients(self):
         """returns all patient ids (not the uids)"""
-        with self.connection:
-            result = self.cursor.execute("SELECT some_id FROM patients").fetchall()
-        return [res[0] for res in result]
+        return list(self.patient_uids)
 
     def get_patient_by_filename(self, filename: str, moda: int):
         """returns the corresponding patient uid of an image"""
-        if moda == Modality.image:
-            with self.connection:
-                self.cursor.execute("SELECT patient FROM images WHERE filename = ?", (filename,))
-                return self.cursor.fetchone()[0]
-        elif moda == Modality.video:
-            with self.connection:
-                self.cursor.execute("SELECT patient FROM videos WHERE filename = ?", (filename,))
-                return self.cursor.fetchone()[0]
-        elif moda == Modality.slide:
-            with self.connection:
-                self.cursor.execute("SELECT patient FROM 'slides' WHERE filename = ?", (filename,))
-                return self.cursor.fetchone()[0]
+        return self.file_uids[filename][2]
 
     def get_patient_by_uid(self, patient_uid: int):
         """returns the id/patient info from the patients table by the corresponding uid"""
-        self.cursor.execute("SELECT some_id FROM patients WHERE uid = ?", (patient_uid,))
-        return self.cursor.fetchone()[0]
+        return self.patient_ids.get(patient_uid)
+
+    def get_database_settings(self) -> dict:
+        """retrieves the connection settings from the settings file, keyed by the names after 'Database/'"""
+        settings = dict()
+        for key, default, _ in DATABASE_SETTINGS:
+            settings[key.split('/')[-1]] = self.settings.value(key, default, type=type(default))
+        return settings
+
+    def get_prefetch_settings(self) -> list:
+        """retrieves the prefetch settings from the settings file as triples (name, value, hint)"""
+        return [(key, self.settings.value(key, default, type=type(default)), hint)
+                for key, default, hint in PREFETCH_SETTINGS]
 
     def get_settings(self):
-        """retrieves the values stored in the settings file"""
+        """retrieves the values of the preferences stored in the settings file"""
         settings = list()
         for key in self.settings.allKeys():
+            if key not in [setting[0] for setting in SETTINGS]:
+                continue
             value = self.settings.value(key)
             tooltip = get_tooltip(key)
             settings.append((key, value, tooltip))
         return settings
 
-    def get_uid_from_filename(self, table_name: str, filename: str) -> int:
-        """
-        :param table_name: videos, images, or whole slide images
-        :param filename: name of the file
-        :return: the uid which is related to the specified file
-        """
-        with self.connection:
-            query = "SELECT uid FROM " + table_name + " WHERE filename = ?"
-            self.cursor.execute(query, (filename,))
-            result = self.cursor.fetchone()
-        return result[0] if result is not None else None
-
     def get_uids_from_filename(self, filename: str) -> tuple:
         """
         :param filename: name of the file
         :return: a tuple holding: modality uid (video/image/whole slide image) and file uid
         """
-        modality, file = None, None
-        for i, table_name in enumerate(self.file_tables):
-            file = self.get_uid_from_filename(table_name, filename)
-            if file is not None:
-                modality = i
-                break
+        modality, file, _ = self.file_uids.get(filename, (None, None, None))
         return modality, file
 
     def get_uid_from_label(self, label: str) -> int:
@@ -303,10 +643,7 @@ class SQLiteDatabase(QObject):
         :param label: the label class to get the uid from
         :return: the uid of the label class if existing
         """
-        with self.connection:
-            self.cursor.execute("""SELECT uid FROM labels WHERE label_class = ?""", (label,))
-            result = self.cursor.fetchone()
-        return result[0] if result is not None else None
+        return self.label_uids.get(label)
 
     def initialize(self, database_path: str, files: dict = None):
         """
@@ -314,168 +651,608 @@ class SQLiteDatabase(QObject):
         :param database_path: path to the database
         :param files: initially added files in case of newly created project
         """
+        if self.connection is not None:
+            self.close()
+
         self.location = str(pathlib.Path(database_path).parents[0])
         # indicates a new project - set up project environment
         if files is not None:
             create_project_structure(self.location)
 
-        self.connection = sqlite3.connect(database_path)
+        self.settings = QSettings(self.location + '/settings', QSettings.Format.NativeFormat)
+
+        # write the default preferences and tuning parameters to the settings file if they are missing,
+        # e.g. for projects created by older versions of the program
+        self.update_settings([setting for setting in SETTINGS + DATABASE_SETTINGS + PREFETCH_SETTINGS
+                              if not self.settings.contains(setting[0])])
+        self.thumbnails.set_directory(self.location + Structure.THUMBNAILS_DIR)
+        prefetch_settings = {key: value for key, value, _ in self.get_prefetch_settings()}
+        self.annotation_rows.set_limit(prefetch_settings["Prefetch/annotation_memory"])
+
+        self.connections = ConnectionManager(database_path, self.get_database_settings())
+        self.connection = self.connections.connect()
         self.database_path = database_path
         self.cursor = self.connection.cursor()
 
-        # indicates a new project - add initial files
+        # indicates a new project - create the initial schema
         if files is not None:
             self.create_initial_tables()
-            for file, patient in files.items():
-                self.add_file(file, patient)
-            self.settings = QSettings(self.location + '/settings', QSettings.Format.NativeFormat)
-            self.update_settings(SETTINGS)
-        else:
-            self.settings = QSettings(self.location + '/settings', QSettings.Format.NativeFormat)
 
-        with self.connection:
-            self.cursor.execute(f"PRAGMA foreign_keys = ON;")
+        # bring the schema up to date, this also upgrades databases created by older versions of the program
+        self.migrate()
+        self.invalidate_caches()
 
         self.is_initialized = True
         self.update_gui()
-        settings = self.get_settings()
+        # indicates a new project - import the initial files, they are listed as soon as they are transferred
+        if files is not None:
+            self.import_files(list(files.items()))
+        else:
+            self.resume_imports()
+        # resume the generation of thumbnails which was interrupted, e.g. by closing the program
+        self.thumbnails.generate_missing([(uid, self.get_filepath(filename, moda))
+                                          for filename, (moda, uid, _) in self.file_uids.items()
+                                          if moda == Modality.image])
+        # the prefetch settings are applied by the gui as well, but not shown in the preferences dialog
+        settings = self.get_settings() + self.get_prefetch_settings()
         self.sApplySettings.emit(settings)
 
+    def import_files(self, files: list, mode: str = TRANSFER_MODES[0]):
+        """
+        imports many files at once: they are hashed and transferred into the project's content store in parallel
+        by the importer, and registered in batches, see register_files. the pending files are recorded in the
+        project's import journal, so an import interrupted by closing the program is resumed when the project is
+        opened again
+        :param files: tuples (filepath, patient)
+        :param mode: how the files are transferred, one of TRANSFER_MODES
+        """
+        if not files:
+            return
+        entries = list()
+        duplicates = 0
+        pending = set(self.imports)
+        for filepath, patient in files:
+            if filepath in pending:
+                # still counted by the import it belongs to
+                continue
+            if filepath in self.imports:
+                # listed twice, done right away
+                duplicates += 1
+                continue
+            self.imports[filepath] = (str(patient), mode)
+            entries.append((filepath, str(patient)))
+        processed, total, failed = self.import_progress
+        self.import_progress = [processed + duplicates, total + len(entries) + duplicates, failed]
+        if entries:
+            self.write_import_journal()
+            self.importer.start(entries, self.location + Structure.STORE_DIR, mode)
+        self.sUpdate.emit([self.import_update()])
+
+    def import_update(self) -> tuple:
+        """reports the progress of the imports; resets it and removes the journal once all files were processed"""
+        processed, total, failed = self.import_progress
+        # transfers repeated by a resumed import may have been reported twice and are counted once
+        update = (Update.IMPORT_PROGRESS, processed if self.imports else total, total, failed)
+        if not self.imports:
+            self.import_progress = [0, 0, 0]
+            self.remove_import_journal()
+        return update
+
+    def insert_file(self, filepath: str, digest: str, patient: int, inserted: dict) -> Optional[tuple]:
+        """
+        links a stored file into the project directory and adds its row, as part of the caller's transaction.
+        a file whose name and content exist in the project already is skipped, a different file with the name
+        of an existing one gets the start of its content hash appended
+        :param filepath: the original path of the file
+        :param digest: its content hash, the file has to be in the content store, see store_object
+        :param patient: uid of the patient
+        :param inserted: filename -> content hash of the files inserted earlier in the same transaction
+        :return: (filename, modality, uid, patient, content hash) of the new row, None if the file was skipped
+        """
+        stem, suffix = os.path.splitext(os.path.basename(filepath))
+        mod = modality(filepath)
+        for filename in (stem + suffix, "{}_{}{}".format(stem, digest[:8], suffix), stem + "_" + digest + suffix):
+            if filename in inserted:
+                existing = inserted[filename]
+            elif filename in self.file_uids:
+                existing = self.file_hashes.get(self.file_uids[filename][1])
+            else:
+                break
+            if existing == digest:
+                return None
+        else:
+            return None
+        link_object(store_path(self.location + Structure.STORE_DIR, digest, suffix), self.get_filepath(filename, mod))
+        self.cursor.execute(ADD_FILE, (filename, int(mod), patient, digest))
+        inserted[filename] = digest
+        return filename, mod, self.cursor.lastrowid, patient, digest
+
+    def invalidate_caches(self):
+        """reloads the lookup caches from the database; has to be called whenever the files, labels
+        or patients were changed without using the methods of this class"""
+        self.clear_caches()
+        with self.connection:
+            for filename, moda, uid, patient, digest in self.cursor.execute(SELECT_FILE_UIDS).fetchall():
+                self.file_uids[filename] = (Modality(moda), uid, patient)
+                self.filenames[uid] = filename
+                if digest is not None:
+                    self.file_hashes[uid] = digest
+            self.label_uids.update(self.cursor.execute("SELECT label_class, uid FROM labels ORDER BY uid").fetchall())
+            for uid, some_id in self.cursor.execute("SELECT uid, some_id FROM patients").fetchall():
+                self.patient_uids[str(some_id)] = uid
+                self.patient_ids[uid] = str(some_id)
+
+    def list_file(self, filename: str, mod: Modality, uid: int) -> list:
+        """inserts a new file into the display order, returns the updates which report it to the gui"""
+        key = (DISPLAY_ORDER.index(mod), filename)
+        index = bisect.bisect_left(self.file_keys, key)
+        self.file_keys.insert(index, key)
+        self.files.insert(index, uid)
+        updates = [(Update.FILE_ADDED, key, uid, self.get_filepath(filename, mod), 0)]
+        if len(self.files) == 1:
+            updates.append(self.load_update(uid))
+        return updates
+
+    def load_file(self, file_uid: int):
+        """emits everything needed to display the given file;
+        skipped if the user already requested another file in the meantime or the file was deleted"""
+        with self.requests_lock:
+            self.pending_file_requests = max(0, self.pending_file_requests - 1)
+            stale = self.pending_file_requests > 0
+        if file_uid in self.filenames and not stale:
+            self.sUpdate.emit([self.load_update(file_uid)])
+
+    def load_update(self, file_uid: int) -> tuple:
+        """
+        :param file_uid: uid of the file
+        :return: the FILE_LOADED update holding the file's path, patient and annotations
+        """
+        file = self.filenames[file_uid]
+        moda, _, patient = self.file_uids[file]
+        labels = self.get_label_from_file(file, moda)
+        patient = self.get_patient_by_uid(patient)
+        return Update.FILE_LOADED, file_uid, self.get_filepath(file, moda), patient, labels
+
+    def migrate(self):
+        """
+        brings the database schema up to date by running all migrations newer than the version
+        stored in the database's user_version; each migration is applied in its own transaction
+        """
+        version = self.cursor.execute("PRAGMA user_version").fetchone()[0]
+        for new_version, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+            with self.connection:
+                self.cursor.execute("BEGIN")
+                migration(self.cursor)
+                self.cursor.execute("PRAGMA user_version = {}".format(new_version))
+
     def open_settings(self):
         """emits a signal to open the settings dialog"""
         settings = self.get_settings()
         self.sOpenSettings.emit(settings)
 
-    def prepare_files(self, files: list, moda: dict) -> list:
-        """goes through all filenames and returns them as full paths,
-        in a tuple together with a boolean indicating whether there is at least 1 annotation in the image"""
-        result = list()
-        for file in files:
-            labels = self.get_label_from_file(file)
-            populated = True if labels else False
-            if moda[file] == Modality.image:
-                file = self.location + Structure.IMAGES_DIR + file
-            elif moda[file] == Modality.video:
-                file = self.location + Structure.VIDEOS_DIR + file
-            else:
-                file = self.location + Structure.SLIDES_DIR + file
-            result.append((file, populated))
-        return result
+    def prefetch(self, file_uids: list):
+        """
+        loads the annotations of the files into the cache and sends their paths, so the gui can decode them;
+        skipped if the user already requested another file, which would otherwise wait for the prefetching
+        :param file_uids: the files next to the displayed one, nearest first
+        """
+        with self.requests_lock:
+            if self.pending_file_requests > 0:
+                return
+        filepaths = list()
+        for file_uid in file_uids:
+            if file_uid in self.filenames:
+                file = self.filenames[file_uid]
+                self.get_annotation_rows(file_uid)
+                filepaths.append(self.get_filepath(file, self.file_uids[file][0]))
+        self.sUpdate.emit([(Update.FILES_PREFETCHED, filepaths)])
 
     def preview_database(self, table_name: str):
-        """collects all information from the specified table and emits a signal"""
+        """emits a preview of the specified table, reading on its own read-only connection;
+        has to be connected directly, so the dialog does not wait for running writes"""
+        connections = self.connections
+        if connections is None:
+            return
+        connection = connections.open_reader()
+        columns = connection.execute("PRAGMA table_info({})".format(sql_identifier(table_name))).fetchall()
+        if not columns:
+            connection.close()
+            return
+        blobs = [column_type.upper() == "BLOB" for _, _, column_type, *_ in columns]
+        self.sPreviewDatabase.emit(TablePreview(connection, table_name, [column[1] for column in columns], blobs))
+
+    def save(self, created: list, modified: list, deleted: list, file_uid: int):
+        """
+        writes the changes made to the annotations of a file
+        :param created: dictionaries of the new shapes (see Shape.to_dict)
+        :param modified: dictionaries of the changed shapes, holding the uid of their annotation entry
+        :param deleted: uids of the removed annotations
+        :param file_uid: uid of the file
+        """
+        if file_uid in self.filenames:
+            file = self.filenames[file_uid]
+            uids, new_classes = self.update_image_annotations(file, created, modified, deleted)
+
+            updates = [(Update.ANNOTATIONS_SAVED, file_uid, uids),
+                       (Update.FILE_STATUS, file_uid, self.get_annotation_count(file))]
+            if new_classes:
+                updates.append((Update.LABELS_ADDED, new_classes))
+            self.sUpdate.emit(updates)
+
+    def register_files(self, entries: list):
+        """
+        adds a batch of files stored by the importer to the database in a single transaction, see insert_file
+        :param entries: tuples (filepath, patient, content hash, error) as sent by FileImporter.sTransferred
+        """
+        # transfers of a closed project are dropped, they are resumed from the journal
+        entries = [entry for entry in entries if self.connection is not None and entry[0] in self.imports]
+        if not entries:
+            return
+        patient_uids = dict()
+        inserted = list()
+        names = dict()
+        failed = 0
         with self.connection:
-            headers = self.cursor.execute("PRAGMA table_info({})".format(table_name)).fetchall()
-            headers = [header[1] for header in headers]
-            content = self.cursor.execute("SELECT * FROM {}".format(table_name)).fetchall()
-        self.sPreviewDatabase.emit(headers, content)
-
-    def save(self, current_labels: list, img_idx: int):
-        files = self.get_images()
-        files += self.get_videos()
-        files += self.get_slides()
-        if files:
-            file = files[img_idx]
-            entries = list()
-            for lbl in current_labels:
-                label_dict, label_class = lbl.to_dict()
-                self.add_label(label_class)
-                entries.append(self.create_annotation_entry(file, label_dict, label_class))
-            self.update_image_annotations(image_name=file, entries=entries)
-        self.update_gui(img_idx)
+            for filepath, patient, digest, error in entries:
+                if error is not None:
+                    failed += error != CANCELLED
+                    continue
+                patient_uid = self.patient_uids.get(patient, patient_uids.get(patient))
+                if patient_uid is None:
+                    self.cursor.execute(ADD_PATIENT, (patient, "2"))
+                    patient_uid = patient_uids[patient] = self.cursor.lastrowid
+                try:
+                    row = self.insert_file(filepath, digest, patient_uid, names)
+                except OSError:
+                    failed += 1
+                    continue
+                if row is not None:
+                    inserted.append(row)
+
+        # the caches are only updated once the transaction succeeded
+        for entry in entries:
+            self.imports.pop(entry[0])
+        for some_id, uid in patient_uids.items():
+            self.patient_uids[some_id] = uid
+            self.patient_ids[uid] = some_id
+        updates = list()
+        for row in inserted:
+            updates.extend(self.file_inserted(*row))
+        self.import_progress[0] += len(entries)
+        self.import_progress[2] += failed
+        if self.imports:
+            self.write_import_journal()
+        updates.append(self.import_update())
+        self.sUpdate.emit(updates)
+
+    def remove_import_journal(self):
+        path = self.location + Structure.IMPORT_JOURNAL
+        if os.path.exists(path):
+            os.remove(path)
+
+    def resume_imports(self):
+        """restarts the imports recorded in the journal, e.g. after the program was closed during an import"""
+        try:
+            with open(self.location + Structure.IMPORT_JOURNAL) as file:
+                pending = json.load(file)
+        except (OSError, ValueError):
+            return
+        for mode in TRANSFER_MODES:
+            self.import_files([(filepath, patient) for filepath, patient, transfer_mode in pending
+                               if transfer_mode == mode], mode)
+
+    def search(self, query: str, scope: str = None, limit: int = 100) -> list:
+        """
+        looks up the words of the query as prefixes in the full-text index, on a pooled read connection
+        :param query: the text entered by the user
+        :param scope: one of SEARCH_SCOPES, all scopes if not specified
+        :param limit: the maximum number of results
+        :return: a list of tuples (scope, uid, text), best matches first
+        """
+        connections = self.connections
+        match = fts_query(query)
+        if connections is None or not match:
+            return list()
+        results = list()
+        with connections.reader() as connection:
+            for scope in [scope] if scope is not None else SEARCH_SCOPES:
+                table, column = SEARCH_SCOPES[scope]
+                rows = connection.execute("SELECT rank, rowid, {1} FROM {0} WHERE {0} MATCH ? ORDER BY rank LIMIT ?"
+                                          .format(table, column), (match, limit)).fetchall()
+                results.extend((rank, scope, uid, str(text)) for rank, uid, text in rows)
+        results.sort(key=lambda result: result[0])
+        return [result[1:] for result in results[:limit]]
+
+    def search_files(self, query: str, limit: int = 1000) -> list:
+        """
+        like search, restricted to the files
+        :return: a list of tuples (uid, filename, sort key, number of annotations) like get_file_page,
+                 best matches first
+        """
+        connections = self.connections
+        match = fts_query(query)
+        if connections is None or not match:
+            return list()
+        with connections.reader() as connection:
+            files = connection.execute(SEARCH_FILES, (match, limit)).fetchall()
+        return [(uid, filename, (DISPLAY_ORDER.index(Modality(moda)), filename), num)
+                for uid, filename, moda, num in files]
 
     def send_import_info(self):
         existing_patients = self.get_patients()
         self.sImportFile.emit(existing_patients)
 
-    def update_image_annotations(self, image_name: str, entries: list):
+    def update_image_annotations(self, image_name: str, created: list, modified: list, deleted: list) -> tuple:
         """
-        updates the annotations associated with a given image
+        applies row-level changes to the annotations of a given image in a single transaction
         :param image_name: the image to be updated
-        :param entries: list of dictionaries representing the annotation entries
+        :param created: dictionaries of shapes to be inserted
+        :param modified: dictionaries of shapes to be updated, identified by their 'uid'
+        :param deleted: uids of annotations to be deleted
+        :return: the uids of the inserted annotations and the label classes which did not exist before
         """
+        _, file, patient = self.file_uids[image_name]
+        classes = dict.fromkeys(label_dict['label'] for label_dict in created + modified)
+        new_classes = [label_class for label_class in classes if label_class not in self.label_uids]
+        label_uids = dict(self.label_uids)
         with self.connection:
+            # add the missing label classes, the cache is only updated once the transaction succeeded
+            for label_class in new_classes:
+                self.cursor.execute(ADD_LABEL, (label_class,))
+                label_uids[label_class] = self.cursor.lastrowid
+
+            def entry(label_dict: dict) -> dict:
+                result = {'file': file, 'patient': patient,
+                          'label': label_uids[label_dict['label']], 'uid': label_dict.get('uid')}
+                result.update(encode_shape(label_dict))
+                return result
+
+            self.cursor.executemany(DELETE_ANNOTATION, [(uid, file) for uid in deleted])
+            self.cursor.executemany(UPDATE_ANNOTATION, [entry(label_dict) for label_dict in modified])
+            uids = list()
+            for label_dict in created:
+                self.cursor.execute(ADD_ANNOTATION, entry(label_dict))
+                uids.append(self.cursor.lastrowid)
+        self.label_uids = label_uids
+        self.annotation_rows.pop(file)
+        return uids, new_classes
+
+    def update_gui(self, file_uid: int = None):
+        """gathers all information about the project and sends it to the gui;
+        the file list itself is read page by page by the gui, see get_file_page
+        :param file_uid: the file to be displayed, the first one if not specified"""
+        order = sorted(((DISPLAY_ORDER.index(moda), filename), uid)
+                       for filename, (moda, uid, _) in self.file_uids.items())
+        self.file_keys = [key for key, _ in order]
+        self.files = [uid for _, uid in order]
 
-            # delete all currently stored annotations for the image
-            modality, file = self.get_uids_from_filename(image_name)
-            self.cursor.execute("""DELETE FROM annotations WHERE modality = ?
-                                AND file = ?""", (modality, file))
-
-            # add new, updated list of annotations
-            for entry in entries:
-                self.cursor.execute("""INSERT INTO annotations (modality, file, patient, shape, label) 
-                    VALUES (:modality, :file, :patient, :shape, :label)""", entry)
-
-    def update_gui(self, img_idx: int = 0):
-        """gathers all information about the project and updates the database"""
-        images = self.get_images()
-        videos = self.get_videos()
-        slides = self.get_slides()
-
-        moda = {image: Modality.image for image in images}
-        moda.update({video: Modality.video for video in videos})
-        moda.update({slide: Modality.slide for slide in slides})
-
-        files = images
-        files.extend(videos)
-        files.extend(slides)
-
-        if files:
-            file = files[img_idx]
-            labels = self.get_label_from_file(file, moda[file])
-            patient = self.get_patient_by_uid(self.get_patient_by_filename(file, moda[file]))
-        else:
-            labels, patient = [], ""
-        files = self.prepare_files(files, moda)
         classes = self.get_label_classes()
-        self.sUpdate.emit(files, img_idx, patient, classes, labels)
+        updates = [(Update.PROJECT, len(self.files), classes)]
+        if self.files:
+            updates.append(self.load_update(file_uid if file_uid in self.filenames else self.files[0]))
+        self.sUpdate.emit(updates)
 
     def update_labels(self, classes: list):
         """
         goes through a list of label class names and adds them to database if they don't already exist
         :param classes: list of label classes
         """
-        with self.connection:
-            for label_class in classes:
-                self.cursor.execute("""SELECT * FROM labels WHERE label_class = ?""", (label_class,))
-                if not self.cursor.fetchone():
-                    self.cursor.execute("""INSERT INTO labels (label_class) VALUES (?)""", (label_class,))
+        for label_class in classes:
+            self.add_label(label_class)
 
     def update_settings(self, settings: list):
         """saves the specified settings in the QSettings file"""
         for setting in settings:
             self.settings.setValue(setting[0], setting[1])
 
-
-def check_for_bytes(lst: List[tuple]) -> Union[List[list], list]:
-    """ Iterates over a list of tuples and de-pickles byte objects. The output is converted depending on how many entries
-    the initial list contains. If its just one per sub-list, each of them is removed
-
-        :param tuple lst: tuple to be searched for
-        :returns: Either a List of Lists or just a List depending on how many entries are put in
+    def write_import_journal(self):
+        """records the files of the running imports which were not registered yet,
+        replacing the journal only once it is written completely"""
+        path = self.location + Structure.IMPORT_JOURNAL
+        with open(path + ".part", "w") as file:
+            json.dump([[filepath, patient, mode] for filepath, (patient, mode) in self.imports.items()], file)
+        os.replace(path + ".part", path)
+
+
+def pragma_keyword(value: str) -> str:
+    """makes sure a pragma value read from the settings file is a plain keyword"""
+    value = str(value).upper()
+    if not value.isalpha():
+        raise ValueError("Invalid pragma value: {}".format(value))
+    return value
+
+
+def like_pattern(text: str) -> str:
+    """a LIKE pattern with ESCAPE '\\' matching any text which contains the given text"""
+    return "%{}%".format(text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_"))
+
+
+def sql_identifier(name: str) -> str:
+    """quotes the name of a table or column for use in an sql statement"""
+    return '"{}"'.format(name.replace('"', '""'))
+
+
+def fts_query(text: str) -> str:
+    """turns user input into a full-text query matching all of its words as prefixes"""
+    return " ".join('"{}"*'.format(term.replace('"', '""')) for term in text.split())
+
+
+def add_indexes(cursor: sqlite3.Cursor):
+    """schema version 1: indexes for looking up annotations by file, label and patient
+    and files by patient, which would otherwise scan the whole table"""
+    cursor.execute("CREATE INDEX IF NOT EXISTS annotations_file ON annotations (modality, file)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS annotations_label ON annotations (label)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS annotations_patient ON annotations (patient)")
+    for table_name in FILE_TABLES:
+        cursor.execute("CREATE INDEX IF NOT EXISTS {0}_patient ON {0} (patient)".format(table_name))
+
+
+def add_geometry_columns(cursor: sqlite3.Cursor, chunk_size: int = 10000):
+    """schema version 2: stores the shapes as typed columns and packed vertex arrays
+    instead of pickled dictionaries; converts all existing annotations"""
+    cursor.execute("ALTER TABLE annotations ADD COLUMN shape_type TEXT")
+    cursor.execute("ALTER TABLE annotations ADD COLUMN group_id INTEGER")
+    cursor.execute("ALTER TABLE annotations ADD COLUMN comment TEXT")
+    cursor.execute("ALTER TABLE annotations ADD COLUMN points BLOB")
+
+    last_uid = -1
+    while True:
+        rows = cursor.execute("""SELECT uid, shape FROM annotations WHERE uid > ? AND shape IS NOT NULL
+                                 ORDER BY uid LIMIT ?""", (last_uid, chunk_size)).fetchall()
+        if not rows:
+            break
+        entries = list()
+        for uid, shape in rows:
+            entry = encode_shape(pickle.loads(shape))
+            entry['uid'] = uid
+            entries.append(entry)
+        cursor.executemany("""UPDATE annotations SET shape_type = :shape_type, group_id = :group_id,
+                              comment = :comment, points = :points, shape = NULL WHERE uid = :uid""", entries)
+        last_uid = rows[-1][0]
+
+
+def unify_file_tables(cursor: sqlite3.Cursor):
+    """schema version 3: replaces the per-modality file tables by a single table with a modality column,
+    so annotations can reference their file by a foreign key and are deleted together with it;
+    the metadata of the slides moves to a side table. annotations of files which no longer exist are dropped"""
+    cursor.execute("""
+        CREATE TABLE files (
+        uid INTEGER PRIMARY KEY,
+        filename TEXT NOT NULL UNIQUE,
+        modality INTEGER NOT NULL,
+        patient INTEGER,
+        FOREIGN KEY (patient) REFERENCES patients(uid))""")
+    cursor.execute("""
+        CREATE TABLE slide_metadata (
+        file INTEGER PRIMARY KEY,
+        biopsy_id INTEGER,
+        year INTEGER,
+        staining TEXT,
+        width INTEGER,
+        height INTEGER,
+        manufacturer TEXT,
+        institution TEXT,
+        FOREIGN KEY (file) REFERENCES files(uid) ON DELETE CASCADE)""")
+
+    # remember the former uids to translate the annotations' references
+    cursor.execute("CREATE TEMP TABLE file_uids (modality INTEGER, old_uid INTEGER, new_uid INTEGER)")
+    for moda, table_name in enumerate(FILE_TABLES):
+        for old_uid, filename, patient in cursor.execute("SELECT uid, filename, patient FROM {} ORDER BY uid"
+                                                         .format(table_name)).fetchall():
+            cursor.execute("INSERT INTO files (filename, modality, patient) VALUES (?, ?, ?)",
+                           (filename, moda, patient))
+            cursor.execute("INSERT INTO file_uids VALUES (?, ?, ?)", (moda, old_uid, cursor.lastrowid))
+    cursor.execute("""
+        INSERT INTO slide_metadata
+        SELECT file_uids.new_uid, biopsy_id, year, staining, width, height, manufacturer, institution
+        FROM slides JOIN file_uids ON file_uids.modality = ? AND file_uids.old_uid = slides.uid
+        WHERE COALESCE(biopsy_id, year, staining, width, height, manufacturer, institution) IS NOT NULL""",
+                   (int(Modality.slide),))
+
+    # a foreign key can't be added to an existing table; the pickled shapes were converted in version 2
+    cursor.execute("ALTER TABLE annotations RENAME TO legacy_annotations")
+    cursor.execute("""
+        CREATE TABLE annotations (
+        uid INTEGER PRIMARY KEY,
+        file INTEGER NOT NULL,
+        patient INTEGER NOT NULL,
+        label INTEGER NOT NULL,
+        shape_type TEXT,
+        group_id INTEGER,
+        comment TEXT,
+        points BLOB,
+        FOREIGN KEY (file) REFERENCES files(uid) ON DELETE CASCADE,
+        FOREIGN KEY (patient) REFERENCES patients(uid),
+        FOREIGN KEY (label) REFERENCES labels(uid))""")
+    cursor.execute("""
+        INSERT INTO annotations (uid, file, patient, label, shape_type, group_id, comment, points)
+        SELECT legacy_annotations.uid, file_uids.new_uid, patient, label, shape_type, group_id, comment, points
+        FROM legacy_annotations JOIN file_uids
+        ON file_uids.modality = legacy_annotations.modality AND file_uids.old_uid = legacy_annotations.file""")
+    cursor.execute("DROP TABLE legacy_annotations")
+    cursor.execute("DROP TABLE file_uids")
+    for table_name in FILE_TABLES:
+        cursor.execute("DROP TABLE {}".format(table_name))
+
+    cursor.execute("CREATE INDEX annotations_file ON annotations (file)")
+    cursor.execute("CREATE INDEX annotations_label ON annotations (label)")
+    cursor.execute("CREATE INDEX annotations_patient ON annotations (patient)")
+    cursor.execute("CREATE INDEX files_patient ON files (patient)")
+
+
+def add_file_order_index(cursor: sqlite3.Cursor):
+    """schema version 4: lets the file list be read page by page in display order, see get_file_page"""
+    cursor.execute("CREATE INDEX files_order ON files (modality, filename)")
+
+
+def add_search_index(cursor: sqlite3.Cursor):
+    """schema version 5: full-text indexes with prefix support on the filenames, patient ids, label classes and
+    annotation comments; they refer to the rows of their tables and are kept up to date by triggers.
+    empty texts are not indexed, which saves index updates for the many annotations without a comment"""
+    for table, column, index in (('files', 'filename', 'files_search'),
+                                 ('patients', 'some_id', 'patients_search'),
+                                 ('labels', 'label_class', 'labels_search'),
+                                 ('annotations', 'comment', 'comments_search')):
+        cursor.execute("CREATE VIRTUAL TABLE {index} USING fts5({column}, content='{table}', content_rowid='uid', "
+                       "prefix='2 3')".format(table=table, column=column, index=index))
+        insert = "INSERT INTO {index} (rowid, {column}) SELECT new.uid, new.{column} WHERE new.{column} <> '';"
+        delete = ("INSERT INTO {index} ({index}, rowid, {column}) SELECT 'delete', old.uid, old.{column} "
+                  "WHERE old.{column} <> '';")
+        triggers = {'insert': "AFTER INSERT ON {table} BEGIN " + insert + " END",
+                    'delete': "AFTER DELETE ON {table} BEGIN " + delete + " END",
+                    'update': "AFTER UPDATE OF {column} ON {table} WHEN old.{column} IS NOT new.{column} "
+                              "BEGIN " + delete + " " + insert + " END"}
+        for name, trigger in triggers.items():
+            cursor.execute(("CREATE TRIGGER {index}_" + name + " " + trigger).format(table=table, column=column,
+                                                                                      index=index))
+        cursor.execute("INSERT INTO {index} (rowid, {column}) SELECT uid, {column} FROM {table} WHERE {column} <> ''"
+                       .format(table=table, column=column, index=index))
+
+
+def add_content_hashes(cursor: sqlite3.Cursor):
+    """schema version 6: the content hash of each file, which links identical imported files to the same stored
+    file, see insert_file; files imported before are not hashed, as this would read all of them"""
+    cursor.execute("ALTER TABLE files ADD COLUMN content_hash TEXT")
+
+
+# the schema migrations in order; a database's user_version is the number of migrations applied to it
+MIGRATIONS = [add_indexes, add_geometry_columns, unify_file_tables, add_file_order_index, add_search_index,
+              add_content_hashes]
+
+
+def rows_size(rows: list) -> int:
+    """estimates the memory used by rows of SELECT_FILE_ANNOTATIONS, dominated by the packed vertices"""
+    return sum(len(points or b"") + len(comment or "") + 200 for _, _, _, comment, points, _ in rows)
+
+
+def decode_points(points: bytes) -> np.ndarray:
+    """returns a read-only (n, 2) float32 view on the packed vertices without copying them"""
+    return np.frombuffer(points, dtype=POINTS_DTYPE).reshape(-1, 2)
+
+
+def decode_shape(label_class: str, shape_type: str, group_id: int, comment: str,
+                 points: Optional[bytes], uid: Optional[int] = None) -> dict:
     """
-    lst = convert_to_list(lst)
-    for _list_idx, _list_entry in enumerate(lst):
-
-        # this replaces lists with only one entry
-        if len(_list_entry) == 1:
-            if isinstance(_list_entry[0], bytes):
-                lst[_list_idx] = pickle.loads(_list_entry[0])
-            else:
-                lst[_list_idx] = _list_entry[0]
-        else:
-            for _tuple_idx, _value in enumerate(list(_list_entry)):
-                if isinstance(_value, bytes):
-                    lst[_list_idx][_tuple_idx] = pickle.loads(_value)
-                else:
-                    continue
-
-    if len(lst) == 1:
-        # lst = lst[0]
-        pass
-
-    return lst
-
-
-def convert_to_list(lst: List[tuple]) -> List[list]:
-    return [list(elem) for elem in lst]
+    assembles the dictionary Shape objects are created from out of an annotation row
+    :param uid: the uid of the annotation entry
+    """
+    return {'label': label_class,
+            'points': decode_points(points) if points is not None else np.empty((0, 2), POINTS_DTYPE),
+            'shape_type': shape_type,
+            'flags': None,
+            'group_id': group_id,
+            'comment': comment if comment is not None else "",
+            'uid': uid}
+
+
+def encode_points(points: Union[np.ndarray, List[list]]) -> bytes:
+    """packs a sequence of (x, y) vertices into a float32 byte string"""
+    return np.ascontiguousarray(points, dtype=POINTS_DTYPE).reshape(-1, 2).tobytes()
+
+
+def encode_shape(label_dict: dict) -> dict:
+    """converts the dictionary of a shape into the values of the annotation table's geometry columns"""
+    return {'shape_type': label_dict.get('shape_type'),
+            'group_id': label_dict.get('group_id'),
+            'comment': label_dict.get('comment') or "",
+            'points': encode_points(label_dict.get('points', []))}
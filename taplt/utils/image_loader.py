@@ -0,0 +1,112 @@
+from PySide6.QtCore import Signal, QObject, QSize, Qt, QThreadPool
+from PySide6.QtGui import QImage, QImageReader, QImageIOHandler
+
+import threading
+from typing import Optional
+
+from taplt.utils.cache import LRUCache
+
+
+def image_size(filepath: str) -> QSize:
+    """the size of an image as stored in its header, without decoding it; empty if the file cannot be read"""
+    size = QImageReader(filepath).size()
+    return size if size.isValid() else QSize(0, 0)
+
+
+class ImageLoader(QObject):
+    """decodes images in a thread pool so that the gui thread never waits for a large file
+
+    every call of load cancels the previous request: decodes which did not start yet are taken back from the pool,
+    running ones are discarded once they finish. if the image format can decode at a reduced size (e.g. jpg),
+    a downscaled preview is sent before the full image.
+    full images are kept in a cache limited in bytes, which prefetch fills with the images to be shown next"""
+    sImageLoaded = Signal(int, QImage, bool)  # request, image, whether the image has its full resolution
+    sDecoded = Signal(int, str, QImage, bool)  # sent from the pool to the gui thread, see decoded
+
+    # longest side of the previews
+    PREVIEW_SIZE = 1024
+    # request of prefetched images, which are only stored in the cache
+    PREFETCH = -1
+
+    def __init__(self, max_threads: int = 2, max_bytes: int = 0):
+        super(ImageLoader, self).__init__()
+        self.pool = QThreadPool()
+        self.pool.setMaxThreadCount(max_threads)
+        self.lock = threading.Lock()
+        self.request = 0
+        self.prefetch_request = 0
+        self.cache = LRUCache(max_bytes, QImage.sizeInBytes)
+        self.sDecoded.connect(self.decoded)
+
+    def cached(self, filepath: str) -> Optional[QImage]:
+        """returns the full image if it was decoded before and is still cached"""
+        return self.cache.get(filepath)
+
+    def cancel(self):
+        """drops the current request and the pending prefetches"""
+        with self.lock:
+            self.request += 1
+            self.prefetch_request += 1
+        self.pool.clear()
+
+    def decoded(self, request: int, filepath: str, image: QImage, full_resolution: bool):
+        """caches a full image and passes it on if it was requested by load; runs in the gui thread"""
+        if full_resolution and not image.isNull():
+            self.cache.put(filepath, image)
+        if request != self.PREFETCH and self.is_current(request):
+            self.sImageLoaded.emit(request, image, full_resolution)
+
+    def is_current(self, request: int) -> bool:
+        with self.lock:
+            return request == self.request
+
+    def is_prefetching(self, prefetch_request: int) -> bool:
+        with self.lock:
+            return prefetch_request == self.prefetch_request
+
+    def load(self, filepath: str) -> int:
+        """
+        starts decoding an image, the results are sent with sImageLoaded
+        :param filepath: path to the image
+        :return: the number of the request, to tell the results of this request from earlier ones
+        """
+        self.cancel()
+        with self.lock:
+            request = self.request
+        preview = QImageReader(filepath)
+        if preview.supportsOption(QImageIOHandler.ImageOption.ScaledSize) and \
+                max(preview.size().width(), preview.size().height()) > self.PREVIEW_SIZE:
+            bounds = QSize(self.PREVIEW_SIZE, self.PREVIEW_SIZE)
+            self.start(lambda: self.is_current(request), request, filepath, bounds, priority=2)
+        self.start(lambda: self.is_current(request), request, filepath, priority=1)
+        return request
+
+    def prefetch(self, filepaths: list):
+        """
+        decodes images into the cache, after the requested image
+        :param filepaths: the images, most important first; replaces the previous prefetches
+        """
+        with self.lock:
+            self.prefetch_request += 1
+            prefetch_request = self.prefetch_request
+        for filepath in filepaths:
+            if filepath not in self.cache:
+                self.start(lambda: self.is_prefetching(prefetch_request), self.PREFETCH, filepath)
+
+    @staticmethod
+    def read(filepath: str, bounds: QSize = None) -> QImage:
+        """decodes an image, scaled to fit into the bounds if given"""
+        reader = QImageReader(filepath)
+        if bounds is not None:
+            reader.setScaledSize(reader.size().scaled(bounds, Qt.AspectRatioMode.KeepAspectRatio))
+        return reader.read()
+
+    def start(self, valid, request: int, filepath: str, bounds: QSize = None, priority: int = 0):
+        """queues a decode in the pool, which is skipped or discarded as soon as valid returns False"""
+        def run():
+            if valid():
+                image = self.read(filepath, bounds)
+                if valid():
+                    self.sDecoded.emit(request, filepath, image, bounds is None)
+
+        self.pool.start(run, priority)
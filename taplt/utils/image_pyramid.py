@@ -0,0 +1,156 @@
+from PySide6.QtCore import Signal, QObject, QRect, QSize, Qt, QThreadPool
+from PySide6.QtGui import QImage, QImageReader
+
+import json
+import math
+import os
+import shutil
+import threading
+from typing import Optional
+
+# edge length of the tiles in pixels
+TILE_SIZE = 512
+# longest side from which images are displayed from a pyramid instead of a single pixmap
+MIN_SIZE = 8192
+
+
+def needs_pyramid(size: QSize) -> bool:
+    return max(size.width(), size.height()) >= MIN_SIZE
+
+
+def pyramid_directory(filepath: str) -> str:
+    """the pyramid of a project file is stored in data/.tiles/<filename>/, next to the directories of the files"""
+    data = os.path.dirname(os.path.dirname(os.path.abspath(filepath)))
+    return os.path.join(data, ".tiles", os.path.basename(filepath)) + "/"
+
+
+class Pyramid:
+    """the tiles of an image at decreasing resolutions, stored on disk: level 0 has the full resolution,
+    every further level halves it, the last one fits into a single tile"""
+
+    INFO = "pyramid.json"
+
+    def __init__(self, directory: str, width: int, height: int, levels: int, suffix: str):
+        self.directory = directory
+        self.width = width
+        self.height = height
+        self.levels = levels
+        self.suffix = suffix
+
+    @classmethod
+    def load(cls, filepath: str) -> Optional['Pyramid']:
+        """returns the pyramid of an image, None if it does not exist or is older than the image"""
+        directory = pyramid_directory(filepath)
+        try:
+            with open(directory + cls.INFO) as file:
+                info = json.load(file)
+            source = os.stat(filepath)
+        except (OSError, ValueError):
+            return None
+        if info.get('source') != [source.st_size, source.st_mtime]:
+            return None
+        return cls(directory, info['width'], info['height'], info['levels'], info['suffix'])
+
+    def level_for(self, level_of_detail: float) -> int:
+        """the coarsest level which still has at least one pixel per screen pixel at the given zoom"""
+        if level_of_detail <= 0:
+            return self.levels - 1
+        return min(max(int(math.floor(math.log2(1 / level_of_detail))), 0), self.levels - 1)
+
+    def level_size(self, level: int) -> QSize:
+        width, height = self.width, self.height
+        for _ in range(level):
+            width, height = (width + 1) // 2, (height + 1) // 2
+        return QSize(width, height)
+
+    def tile_path(self, level: int, column: int, row: int) -> str:
+        return "{}{}/{}_{}.{}".format(self.directory, level, column, row, self.suffix)
+
+
+class PyramidBuilder(QObject):
+    """generates the pyramids of large images in a thread pool and caches them on disk
+
+    the image is decoded once at full resolution; a downscaled preview is sent right away, the pyramid once all
+    of its tiles were written. pyramids are written to a temporary directory first, so an interrupted build
+    is simply started again the next time the image is opened"""
+    sPreview = Signal(str, QImage)  # filepath, downscaled image
+    sPyramidReady = Signal(str)  # filepath
+
+    # longest side of the previews
+    PREVIEW_SIZE = 2048
+    # decodes in progress with the allocation limit of QImageReader lifted, and the limit restored after them
+    decoding = 0
+    allocation_limit = 0
+    decoding_lock = threading.Lock()
+
+    def __init__(self, max_threads: int = 1):
+        super(PyramidBuilder, self).__init__()
+        self.pool = QThreadPool()
+        self.pool.setMaxThreadCount(max_threads)
+        self.lock = threading.Lock()
+        self.pending = set()
+
+    def build(self, filepath: str):
+        """decodes the image and writes all levels of its pyramid; runs in the thread pool"""
+        try:
+            image = self.decode(filepath)
+            if image.isNull():
+                return
+            self.sPreview.emit(filepath, image.scaled(self.PREVIEW_SIZE, self.PREVIEW_SIZE,
+                                                      Qt.AspectRatioMode.KeepAspectRatio,
+                                                      Qt.TransformationMode.SmoothTransformation))
+            source = os.stat(filepath)
+            directory = pyramid_directory(filepath)
+            temporary = directory.rstrip("/") + ".part/"
+            shutil.rmtree(temporary, ignore_errors=True)
+            suffix = "png" if filepath.lower().endswith("png") else "jpg"
+            width, height, level = image.width(), image.height(), 0
+            while True:
+                os.makedirs(temporary + str(level))
+                for row in range(math.ceil(image.height() / TILE_SIZE)):
+                    for column in range(math.ceil(image.width() / TILE_SIZE)):
+                        tile = QRect(column * TILE_SIZE, row * TILE_SIZE, TILE_SIZE, TILE_SIZE) & image.rect()
+                        image.copy(tile).save("{}{}/{}_{}.{}".format(temporary, level, column, row, suffix))
+                if image.width() <= TILE_SIZE and image.height() <= TILE_SIZE:
+                    break
+                image = image.scaled((image.width() + 1) // 2, (image.height() + 1) // 2,
+                                     Qt.AspectRatioMode.IgnoreAspectRatio, Qt.TransformationMode.SmoothTransformation)
+                level += 1
+            with open(temporary + Pyramid.INFO, "w") as file:
+                json.dump({'width': width, 'height': height, 'levels': level + 1, 'suffix': suffix,
+                           'source': [source.st_size, source.st_mtime]}, file)
+            shutil.rmtree(directory, ignore_errors=True)
+            os.replace(temporary, directory)
+        finally:
+            with self.lock:
+                self.pending.discard(filepath)
+        self.sPyramidReady.emit(filepath)
+
+    @classmethod
+    def decode(cls, filepath: str) -> QImage:
+        """decodes an image at full resolution; the images handled here exceed the default allocation limit of 256 MB,
+        which applies to all image readers of the program, so it is only lifted while builders decode"""
+        with cls.decoding_lock:
+            if cls.decoding == 0:
+                cls.allocation_limit = QImageReader.allocationLimit()
+                QImageReader.setAllocationLimit(0)
+            cls.decoding += 1
+        try:
+            return QImageReader(filepath).read()
+        finally:
+            with cls.decoding_lock:
+                cls.decoding -= 1
+                if cls.decoding == 0:
+                    QImageReader.setAllocationLimit(cls.allocation_limit)
+
+    def generate(self, filepath: str, priority: int = 0):
+        """queues the build of a pyramid unless it is up to date or already queued"""
+        with self.lock:
+            if filepath in self.pending:
+                return
+            self.pending.add(filepath)
+        if Pyramid.load(filepath) is not None:
+            with self.lock:
+                self.pending.discard(filepath)
+            return
+        self.pool.start(lambda: self.build(filepath), priority)
@@ -0,0 +1,202 @@
+from PySide6.QtCore import Signal, QObject, QThreadPool
+
+import csv
+import hashlib
+import os
+import shutil
+import threading
+import time
+
+from taplt.utils.project_structure import modality
+
+# how imported files get into the project: copied, hard-linked (copied if the source is on another file system)
+# or referenced by a symbolic link, which leaves the project depending on the original location
+TRANSFER_MODES = ('copy', 'hardlink', 'symlink')
+# the error of the transfers skipped by FileImporter.cancel
+CANCELLED = "cancelled"
+# number of bytes read at once while hashing
+CHUNK_SIZE = 1048576
+
+
+def content_hash(filepath: str) -> str:
+    """the sha256 digest of a file's content as hex string, read chunk by chunk"""
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as file:
+        for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def is_supported(filepath: str) -> bool:
+    try:
+        modality(filepath)
+    except Exception:
+        return False
+    return True
+
+
+def link_object(path: str, target: str):
+    """makes a stored file available under a path of the project without copying it: by a hard link,
+    or by a symbolic link where the file system has no hard links"""
+    partial = "{}.{}.part".format(target, threading.get_ident())
+    try:
+        os.link(path, partial)
+    except OSError:
+        os.symlink(os.path.abspath(path), partial)
+    os.replace(partial, target)
+
+
+def read_manifest(manifest: str) -> list:
+    """
+    reads the files to be imported from a csv file with the columns file and patient, a header row is optional
+    :param manifest: path to the csv file, relative file paths are resolved against its directory
+    :return: tuples (filepath, patient) of the supported files; without a patient, the name of the directory
+    containing a file is its patient, like in scan_directory
+    """
+    directory = os.path.dirname(os.path.abspath(manifest))
+    files = list()
+    with open(manifest, newline='') as file:
+        for row in csv.reader(file):
+            if len(row) < 2 or row[0].strip().lower() == 'file':
+                continue
+            filepath = os.path.join(directory, row[0].strip())
+            if is_supported(filepath):
+                files.append((filepath, row[1].strip() or os.path.basename(os.path.dirname(filepath))))
+    return files
+
+
+def scan_directory(directory: str, patient: str = "") -> list:
+    """
+    collects the supported files in a directory and its subdirectories
+    :param directory: the directory to be imported
+    :param patient: the patient of all files; if empty, the name of the directory containing a file is its patient
+    :return: tuples (filepath, patient) in the order of the paths
+    """
+    files = list()
+    for root, _, filenames in os.walk(directory):
+        for filename in filenames:
+            if is_supported(filename):
+                files.append((os.path.join(root, filename), patient or os.path.basename(root)))
+    return sorted(files)
+
+
+def store_object(store: str, source: str, digest: str, mode: str = TRANSFER_MODES[0]) -> str:
+    """
+    puts a file into the content-addressed store of a project unless identical content is stored already
+    :param store: the store directory, see Structure.STORE_DIR
+    :param source: the file to be imported
+    :param digest: its content hash
+    :param mode: one of TRANSFER_MODES
+    :return: the path of the stored file
+    """
+    path = store_path(store, digest, os.path.splitext(source)[1])
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        transfer(source, path, mode)
+    return path
+
+
+def store_path(store: str, digest: str, suffix: str) -> str:
+    """stored files are named after their content hash, spread over subdirectories by its first two digits;
+    the suffix keeps the type of the file recognizable"""
+    return "{}{}/{}{}".format(store, digest[:2], digest, suffix.lower())
+
+
+def transfer(source: str, target: str, mode: str):
+    """
+    puts a file into the project under a temporary name first, so an interrupted transfer never leaves an
+    incomplete file behind; files transferred to the same target at once do not interfere
+    :param source: the file to be imported
+    :param target: its path in the project
+    :param mode: one of TRANSFER_MODES
+    """
+    partial = "{}.{}.part".format(target, threading.get_ident())
+    if mode == 'symlink':
+        os.symlink(os.path.abspath(source), partial)
+    elif mode == 'hardlink':
+        try:
+            os.link(source, partial)
+        except OSError:
+            shutil.copyfile(source, partial)
+    else:
+        shutil.copyfile(source, partial)
+    os.replace(partial, target)
+
+
+class FileImporter(QObject):
+    """hashes files and transfers them into the content-addressed store of a project in a thread pool
+
+    finished transfers are sent in batches, so the database registers many files per transaction and the gui
+    receives few large updates. imports started while others are running share the pool;
+    cancel skips all transfers which did not start yet, they are still reported, reset drops them silently"""
+    sTransferred = Signal(list)  # the entries of start, each extended by the content hash and an error message
+
+    BATCH_SIZE = 250
+    # longest time in seconds a finished transfer waits for the rest of its batch
+    BATCH_DELAY = 1.0
+
+    def __init__(self, max_threads: int = 4):
+        super(FileImporter, self).__init__()
+        self.pool = QThreadPool()
+        self.pool.setMaxThreadCount(max_threads)
+        self.lock = threading.Lock()
+        # imports are numbered by start; those up to cancelled are skipped, those up to dropped are not reported
+        self.started = 0
+        self.cancelled = 0
+        self.dropped = 0
+        self.total = 0
+        self.processed = 0
+        self.batch = list()
+        self.batch_time = 0
+
+    def cancel(self):
+        with self.lock:
+            self.cancelled = self.started
+
+    def reset(self):
+        """skips all transfers without reporting them, e.g. when the project is closed"""
+        with self.lock:
+            self.cancelled = self.dropped = self.started
+            self.batch = list()
+
+    def run(self, number: int, entry: tuple, store: str, mode: str):
+        """stores a file and adds it to the current batch, which is sent once it is complete; runs in the pool"""
+        with self.lock:
+            skip = number <= self.cancelled
+        digest, error = None, CANCELLED
+        if not skip:
+            try:
+                digest = content_hash(entry[0])
+                store_object(store, entry[0], digest, mode)
+                error = None
+            except OSError as e:
+                error = str(e)
+        with self.lock:
+            self.processed += 1
+            if number > self.dropped:
+                self.batch.append(entry + (digest, error))
+            finished = self.processed == self.total
+            if finished:
+                self.processed = self.total = 0
+            if self.batch and (finished or len(self.batch) >= self.BATCH_SIZE or
+                               time.monotonic() - self.batch_time >= self.BATCH_DELAY):
+                # sent while holding the lock, so the batches arrive in order
+                self.sTransferred.emit(self.batch)
+                self.batch = list()
+                self.batch_time = time.monotonic()
+
+    def start(self, entries: list, store: str, mode: str):
+        """
+        queues the transfer of files, the results are sent with sTransferred
+        :param entries: tuples (source, ...), passed on unchanged
+        :param store: the store directory of the project, see store_object
+        :param mode: one of TRANSFER_MODES
+        """
+        with self.lock:
+            if self.total == 0:
+                self.batch_time = time.monotonic()
+            self.total += len(entries)
+            self.started += 1
+            number = self.started
+        for entry in entries:
+            self.pool.start(lambda entry=entry: self.run(number, entry, store, mode))
@@ -14,6 +14,9 @@ class Structure:
     VIDEOS_DIR = "/data/videos/"
     SLIDES_DIR = "/data/slides/"
     FILE_DIRS = [IMAGES_DIR, VIDEOS_DIR, SLIDES_DIR]
+    THUMBNAILS_DIR = "/data/.thumbs/"
+    IMPORT_JOURNAL = "/data/.import.json"
+    STORE_DIR = "/data/.store/"
     DATABASE_DEFAULT_NAME = '/database.db'
 
 
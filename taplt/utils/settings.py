@@ -12,7 +12,54 @@ s3 = ("Display patient name",
       False,
       "Shows the patient name at the bottom of the image")
 
-SETTINGS = [s1, s2, s3]
+s4 = ("Show thumbnails",
+      True,
+      "Displays a small preview of each image in the file list")
+
+SETTINGS = [s1, s2, s3, s4]
+
+# tuning parameters of the database connections; they are stored in the project's settings file,
+# but not shown in the preferences dialog
+d1 = ("Database/journal_mode",
+      "WAL",
+      "SQLite journal mode; WAL lets previews and other reads run while annotations are written")
+
+d2 = ("Database/synchronous",
+      "NORMAL",
+      "How often SQLite waits for data to reach the disk; NORMAL is safe in WAL mode")
+
+d3 = ("Database/cache_size",
+      -65536,
+      "Page cache per connection; negative values are in KiB")
+
+d4 = ("Database/mmap_size",
+      268435456,
+      "Number of bytes of the database file which are memory-mapped")
+
+d5 = ("Database/temp_store",
+      "MEMORY",
+      "Where temporary tables and indices are kept")
+
+d6 = ("Database/read_connections",
+      4,
+      "Number of read-only connections for queries which run concurrently with writes")
+
+DATABASE_SETTINGS = [d1, d2, d3, d4, d5, d6]
+
+# prefetching of the files next to the displayed one; stored like the tuning parameters of the database
+p1 = ("Prefetch/files",
+      2,
+      "Number of files before and after the displayed one which are loaded in advance")
+
+p2 = ("Prefetch/image_memory",
+      536870912,
+      "Number of bytes of decoded images which are kept in memory")
+
+p3 = ("Prefetch/annotation_memory",
+      67108864,
+      "Number of bytes of annotation rows which are kept in memory")
+
+PREFETCH_SETTINGS = [p1, p2, p3]
 
 
 def get_tooltip(setting: str):
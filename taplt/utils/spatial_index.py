@@ -0,0 +1,76 @@
+from PySide6.QtCore import QPointF, QRectF
+
+import math
+from typing import Dict, Hashable, List, Tuple
+
+
+def cell_range(rect: QRectF, cell_size: float) -> Tuple[range, range]:
+    """the columns and rows of the square cells of a grid covered by a rect"""
+    return (range(math.floor(rect.left() / cell_size), math.floor(rect.right() / cell_size) + 1),
+            range(math.floor(rect.top() / cell_size), math.floor(rect.bottom() / cell_size) + 1))
+
+
+class GridIndex:
+    """finds the keys whose bounding rects contain a point without looking at all of them
+
+    the rects are stored in the square cells of a uniform grid they overlap, so a query only looks at the few
+    entries in the cell of the point; rects spanning more than MAX_CELLS cells are kept apart and checked by
+    every query, which keeps single huge rects from filling the grid. not thread-safe"""
+
+    MAX_CELLS = 64
+
+    def __init__(self, cell_size: float = 256):
+        self.cell_size = cell_size
+        self.cells = {}  # type: Dict[Tuple[int, int], Dict[Hashable, Tuple[float, float, float, float]]]
+        self.large = {}  # type: Dict[Hashable, Tuple[float, float, float, float]]
+        self.rects = {}  # type: Dict[Hashable, Tuple[float, float, float, float]]
+        # the cells each key was stored in, computing them again from the bounds may round differently
+        self.covered = {}  # type: Dict[Hashable, List[Tuple[int, int]]]
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.rects
+
+    def __len__(self) -> int:
+        return len(self.rects)
+
+    def clear(self):
+        self.cells.clear()
+        self.large.clear()
+        self.rects.clear()
+        self.covered.clear()
+
+    def insert(self, key: Hashable, rect: QRectF):
+        """adds a key with its bounding rect, replacing its previous rect"""
+        if key in self.rects:
+            self.remove(key)
+        bounds = (rect.left(), rect.top(), rect.right(), rect.bottom())
+        self.rects[key] = bounds
+        columns, rows = cell_range(rect, self.cell_size)
+        if len(columns) * len(rows) > self.MAX_CELLS:
+            self.large[key] = bounds
+            return
+        covered = self.covered[key] = [(column, row) for column in columns for row in rows]
+        for cell_key in covered:
+            cell = self.cells.get(cell_key)
+            if cell is None:
+                cell = self.cells[cell_key] = {}
+            cell[key] = bounds
+
+    def query_point(self, point: QPointF) -> List[Hashable]:
+        """the keys whose rects contain the point"""
+        x, y = point.x(), point.y()
+        cell = self.cells.get((math.floor(x / self.cell_size), math.floor(y / self.cell_size)), {})
+        return [key for entries in (cell, self.large) for key, (left, top, right, bottom) in entries.items()
+                if left <= x <= right and top <= y <= bottom]
+
+    def remove(self, key: Hashable):
+        bounds = self.rects.pop(key, None)
+        if bounds is None:
+            return
+        if self.large.pop(key, None) is not None:
+            return
+        for cell_key in self.covered.pop(key):
+            cell = self.cells[cell_key]
+            del cell[key]
+            if not cell:
+                del self.cells[cell_key]
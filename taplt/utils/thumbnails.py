@@ -0,0 +1,119 @@
+from PySide6.QtCore import Signal, QObject, Qt, QThreadPool
+from PySide6.QtGui import QImageReader, QPixmap
+
+import os
+import threading
+from typing import Optional
+
+from taplt.utils.cache import LRUCache
+
+
+class ThumbnailCache(QObject):
+    """downscaled previews of the images of a project, stored as files named after the uids of the images
+    in the project's thumbnail directory
+
+    thumbnails are generated in a thread pool and written under a temporary name first, so an interrupted
+    generation never leaves a broken file; a thumbnail older than its image is generated again.
+    the generation never blocks the caller, sThumbnailReady reports each finished thumbnail"""
+    sThumbnailReady = Signal(int)  # file uid
+
+    # longest side of the stored thumbnails
+    SIZE = 128
+    QUALITY = 85
+
+    def __init__(self, max_threads: int = 2, max_bytes: int = 33554432):
+        super(ThumbnailCache, self).__init__()
+        self.pool = QThreadPool()
+        self.pool.setMaxThreadCount(max_threads)
+        self.lock = threading.Lock()
+        self.directory = None
+        self.pending = set()
+        # the loaded thumbnails, keyed by path and modification time; only used from the gui thread
+        self.pixmaps = LRUCache(max_bytes, lambda pixmap: pixmap.width() * pixmap.height() * pixmap.depth() // 8)
+
+    def generate(self, file_uid: int, filepath: str):
+        """queues the generation of a thumbnail unless it is up to date or already queued"""
+        with self.lock:
+            directory = self.directory
+            if directory is None or file_uid in self.pending:
+                return
+            self.pending.add(file_uid)
+        self.pool.start(lambda: self.write(directory, file_uid, filepath))
+
+    def generate_missing(self, files: list):
+        """
+        queues the generation of all missing and outdated thumbnails, e.g. those interrupted by closing the program;
+        the files are checked in the thread pool as well
+        :param files: tuples (file uid, filepath) of the images
+        """
+        directory = self.directory
+
+        def check():
+            if directory != self.directory:
+                return
+            thumbnails = {entry.name: entry.stat().st_mtime for entry in os.scandir(directory)}
+            for file_uid, filepath in files:
+                modified = thumbnails.get(thumbnail_name(file_uid))
+                if modified is None or (os.path.exists(filepath) and os.path.getmtime(filepath) > modified):
+                    self.generate(file_uid, filepath)
+
+        self.pool.start(check)
+
+    def path(self, file_uid: int) -> Optional[str]:
+        directory = self.directory
+        return directory + thumbnail_name(file_uid) if directory is not None else None
+
+    def pixmap(self, file_uid: int) -> Optional[QPixmap]:
+        """returns the thumbnail of an image, None if it was not generated yet; has to run in the gui thread"""
+        path = self.path(file_uid)
+        try:
+            key = (path, os.path.getmtime(path))
+        except (OSError, TypeError):
+            return None
+        pixmap = self.pixmaps.get(key)
+        if pixmap is None:
+            pixmap = QPixmap(path)
+            if pixmap.isNull():
+                return None
+            self.pixmaps.put(key, pixmap)
+        return pixmap
+
+    def remove(self, file_uid: int):
+        """deletes the thumbnail of a removed file"""
+        path = self.path(file_uid)
+        if path is not None and os.path.exists(path):
+            os.remove(path)
+
+    def set_directory(self, directory: Optional[str]):
+        """
+        switches to the thumbnails of another project, the generation of the previous one is dropped
+        :param directory: the thumbnail directory, created if it does not exist; None when the project is closed
+        """
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+        with self.lock:
+            self.directory = directory
+            self.pending = set()
+        self.pool.clear()
+
+    def write(self, directory: str, file_uid: int, filepath: str):
+        """decodes the image at a reduced size and stores it as the thumbnail; runs in the thread pool"""
+        try:
+            if directory != self.directory:
+                return
+            reader = QImageReader(filepath)
+            if max(reader.size().width(), reader.size().height()) > self.SIZE:
+                reader.setScaledSize(reader.size().scaled(self.SIZE, self.SIZE, Qt.AspectRatioMode.KeepAspectRatio))
+            image = reader.read()
+            path = directory + thumbnail_name(file_uid)
+            if image.isNull() or not image.save(path + ".part", "JPEG", self.QUALITY):
+                return
+            os.replace(path + ".part", path)
+        finally:
+            with self.lock:
+                self.pending.discard(file_uid)
+        self.sThumbnailReady.emit(file_uid)
+
+
+def thumbnail_name(file_uid: int) -> str:
+    return "{}.jpg".format(file_uid)
@@ -0,0 +1,251 @@
+"""Benchmarks for the SQLiteDatabase on large synthetic projects.
+Run from the repository root, e.g. 'python -m test.benchmark_database --files 50000 --annotations 1000000'"""
+import argparse
+import os
+import pickle
+import random
+import tempfile
+import threading
+import time
+
+from PySide6.QtCore import QCoreApplication
+
+from taplt.utils.database import SQLiteDatabase, Update, ADD_ANNOTATION, SELECT_FILE_ANNOTATIONS, SELECT_FILES, \
+    decode_shape, encode_shape
+from taplt.utils.importer import scan_directory
+from taplt.utils.project_structure import Modality
+
+
+def create_synthetic_project(num_files: int, num_annotations: int, num_patients: int = 500,
+                             num_labels: int = 20, num_points: int = 12) -> SQLiteDatabase:
+    """creates a new project in a temporary directory and fills it with random images and annotations"""
+    project_path = tempfile.mkdtemp() + "/project"
+    database = SQLiteDatabase()
+    database.initialize(project_path + "/database.db", files={})
+
+    rng = random.Random(0)
+    with database.connection:
+        database.cursor.executemany("INSERT INTO patients (some_id, another_id) VALUES (?, ?)",
+                                    [("Patient {}".format(i), "2") for i in range(num_patients)])
+        database.cursor.executemany("INSERT INTO labels (label_class) VALUES (?)",
+                                    [("Class {}".format(i),) for i in range(num_labels)])
+        database.cursor.executemany("INSERT INTO files (filename, modality, patient) VALUES (?, ?, ?)",
+                                    [("image_{:07d}.png".format(i), int(Modality.image), rng.randint(1, num_patients))
+                                     for i in range(num_files)])
+
+        def annotations():
+            for _ in range(num_annotations):
+                label = rng.randint(1, num_labels)
+                entry = {'file': rng.randint(1, num_files), 'patient': 1, 'label': label}
+                entry.update(encode_shape(random_shape(rng, "Class {}".format(label - 1), num_points)))
+                yield entry
+
+        database.cursor.executemany(ADD_ANNOTATION, annotations())
+    database.invalidate_caches()
+    return database
+
+
+def random_shape(rng: random.Random, label: str, num_points: int) -> dict:
+    """a polygon with random vertices in the dictionary format of Shape.to_dict"""
+    return {'label': label,
+            'points': [[rng.uniform(0, 1000), rng.uniform(0, 1000)] for _ in range(num_points)],
+            'shape_type': 'polygon',
+            'flags': None,
+            'group_id': 0,
+            'comment': ""}
+
+
+def benchmark_shape_encoding(num_shapes: int = 10000, num_points: int = 40):
+    """compares pickled shape dictionaries with packed float32 vertices for a densely annotated file"""
+    rng = random.Random(0)
+    shapes = [random_shape(rng, "Nucleus", num_points) for _ in range(num_shapes)]
+
+    pickled = [pickle.dumps(shape) for shape in shapes]
+    start = time.perf_counter()
+    _ = [pickle.loads(blob) for blob in pickled]
+    pickle_time = time.perf_counter() - start
+
+    packed = [encode_shape(shape) for shape in shapes]
+    start = time.perf_counter()
+    _ = [decode_shape("Nucleus", row['shape_type'], row['group_id'], row['comment'], row['points'])
+         for row in packed]
+    packed_time = time.perf_counter() - start
+
+    print("{} shapes with {} vertices".format(num_shapes, num_points))
+    print("pickle:  {:8.3f} s, {:10d} bytes".format(pickle_time, sum(len(blob) for blob in pickled)))
+    print("float32: {:8.3f} s, {:10d} bytes".format(packed_time, sum(len(row['points']) for row in packed)))
+
+
+def benchmark_open_project(database: SQLiteDatabase, legacy_sample: int = 200):
+    """compares the time it takes to collect the file list with annotation status"""
+    start = time.perf_counter()
+    files = database.get_files()
+    single_query = time.perf_counter() - start
+
+    # the former approach looked up every file and queried and decoded its annotations separately; it runs as raw
+    # sql, as the database methods now answer from caches. it is only timed on a sample and extrapolated
+    # since it scales with files * annotations
+    sample = files[:legacy_sample]
+    cursor = database.connection.cursor()
+    start = time.perf_counter()
+    for _, filename, moda, _, _ in sample:
+        file_uid = cursor.execute("SELECT uid FROM files WHERE filename = ? AND modality = ?",
+                                  (filename, int(moda))).fetchone()[0]
+        labels = [decode_shape(*row) for row in cursor.execute(SELECT_FILE_ANNOTATIONS, (file_uid,)).fetchall()]
+        _ = (database.get_filepath(filename, moda), bool(labels))
+    per_file = (time.perf_counter() - start) / max(len(sample), 1)
+
+    start = time.perf_counter()
+    database.update_gui()
+    update_gui = time.perf_counter() - start
+
+    # the file list reads its rows page by page, the last page has to skip the most rows of its modality
+    start = time.perf_counter()
+    database.get_file_page()
+    first_page = time.perf_counter() - start
+    start = time.perf_counter()
+    database.get_file_page(database.file_keys[-2])
+    last_page = time.perf_counter() - start
+
+    # ranked full-text search over the file names, as typed into the search box of the file list
+    start = time.perf_counter()
+    matches = database.search_files("image_0001")
+    search = time.perf_counter() - start
+
+    print("files: {}".format(len(files)))
+    print("single aggregated query:            {:10.3f} s".format(single_query))
+    print("update_gui (open project):          {:10.3f} s".format(update_gui))
+    print("first / last page of the file list: {:10.3f} s / {:.3f} s".format(first_page, last_page))
+    print("file search ({:4d} matches):         {:10.3f} s".format(len(matches), search))
+    print("per-file queries (extrapolated):    {:10.3f} s  ({:.2f} ms per file)".format(per_file * len(files),
+                                                                                       per_file * 1000))
+
+
+def benchmark_preview(database: SQLiteDatabase, page_size: int = 500):
+    """compares reading a whole table for the preview with fetching the first page of the sorted preview query"""
+    previews = list()
+    database.sPreviewDatabase.connect(previews.append)
+
+    start = time.perf_counter()
+    content = database.connection.execute("SELECT * FROM annotations").fetchall()
+    select_all = time.perf_counter() - start
+
+    database.preview_database("annotations")
+    preview = previews[-1]
+    start = time.perf_counter()
+    preview.query().fetchmany(page_size)
+    first_page = time.perf_counter() - start
+    start = time.perf_counter()
+    preview.query(preview.columns.index("label"), descending=True).fetchmany(page_size)
+    sorted_page = time.perf_counter() - start
+    preview.close()
+
+    print("annotations: {}".format(len(content)))
+    print("whole table with BLOBs:             {:10.3f} s".format(select_all))
+    print("first page / sorted by label:       {:10.3f} s / {:.3f} s".format(first_page, sorted_page))
+
+
+def benchmark_concurrent_reads(num_files: int = 5000, num_annotations: int = 200000, duration: float = 5.0,
+                               num_readers: int = 4, shapes_per_save: int = 500):
+    """saves annotations continuously while reader threads run file status queries on the pooled read connections;
+    compares the default rollback journal with WAL"""
+    for journal_mode in ("DELETE", "WAL"):
+        database = create_synthetic_project(num_files, num_annotations)
+        database.settings.setValue("Database/journal_mode", journal_mode)
+        database.initialize(database.database_path)
+
+        stop = threading.Event()
+        latencies = list()
+
+        def read():
+            rng = random.Random()
+            while not stop.is_set():
+                start = time.perf_counter()
+                with database.connections.reader() as connection:
+                    if rng.random() < 0.1:
+                        connection.execute(SELECT_FILES).fetchall()
+                    else:
+                        connection.execute("SELECT COUNT(*) FROM annotations WHERE file = ?",
+                                           (rng.randint(1, num_files),)).fetchone()
+                latencies.append(time.perf_counter() - start)
+
+        readers = [threading.Thread(target=read) for _ in range(num_readers)]
+        [reader.start() for reader in readers]
+
+        rng = random.Random(0)
+        filename = database.filenames[database.files[0]]
+        saves, uids = 0, list()
+        start = time.perf_counter()
+        while time.perf_counter() - start < duration:
+            shapes = [random_shape(rng, "Nucleus", 20) for _ in range(shapes_per_save)]
+            uids, _ = database.update_image_annotations(filename, shapes, [], uids)
+            saves += 1
+        stop.set()
+        [reader.join() for reader in readers]
+        database.close()
+
+        latencies.sort()
+        print("{:7s} saves: {:5d}   reads: {:7d}   median read: {:7.2f} ms   max read: {:8.2f} ms".format(
+            journal_mode, saves, len(latencies), latencies[len(latencies) // 2] * 1000, latencies[-1] * 1000))
+
+
+def benchmark_import(num_files: int = 2000, file_size: int = 1048576):
+    """compares adding files one by one with the bulk import, which hashes and copies in parallel and registers
+    in batches; importing the same files again only hashes them"""
+    source = tempfile.mkdtemp()
+    for i in range(num_files):
+        os.makedirs("{}/patient_{}".format(source, i % 50), exist_ok=True)
+        with open("{}/patient_{}/image_{:05d}.png".format(source, i % 50, i), "wb") as file:
+            file.write(os.urandom(file_size))
+    files = scan_directory(source)
+
+    database = SQLiteDatabase()
+    database.initialize(tempfile.mkdtemp() + "/project/database.db", files={})
+    start = time.perf_counter()
+    for filepath, patient in files:
+        database.add_file(filepath, patient)
+    sequential = time.perf_counter() - start
+    database.thumbnails.pool.waitForDone()
+    database.close()
+
+    for mode in ("copy", "hardlink"):
+        database = SQLiteDatabase()
+        database.initialize(tempfile.mkdtemp() + "/project/database.db", files={})
+        app = QCoreApplication.instance()
+
+        def finished(updates: list):
+            if any(update[0] == Update.IMPORT_PROGRESS and update[1] == update[2] for update in updates):
+                app.quit()
+
+        database.sUpdate.connect(finished)
+        start = time.perf_counter()
+        database.import_files(files, mode)
+        app.exec()
+        bulk = time.perf_counter() - start
+        # the same files again, they are hashed but neither stored nor registered a second time
+        start = time.perf_counter()
+        database.import_files(files, mode)
+        app.exec()
+        duplicates = time.perf_counter() - start
+        database.thumbnails.pool.waitForDone()
+        database.close()
+        print("bulk import ({:8s}):              {:10.3f} s  (again: {:.3f} s)".format(mode, bulk, duplicates))
+    print("add_file one by one:                {:10.3f} s  ({} files of {} KiB)".format(sequential, num_files,
+                                                                                        file_size // 1024))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=50000)
+    parser.add_argument("--annotations", type=int, default=1000000)
+    parser.add_argument("--legacy-sample", type=int, default=200)
+    args = parser.parse_args()
+
+    app = QCoreApplication()
+    benchmark_import()
+    benchmark_concurrent_reads()
+    benchmark_shape_encoding()
+    print("creating synthetic project ...")
+    db = create_synthetic_project(args.files, args.annotations)
+    benchmark_open_project(db, args.legacy_sample)
+    benchmark_preview(db)
@@ -0,0 +1,209 @@
+"""Benchmarks for dense annotation layers: the time it takes to create shapes and add them to an AnnotationGroup
+and the memory they take, compared with shapes which are QObjects with their own signals like before,
+the time it takes to draw them in batches compared with drawing every shape as an item,
+hit tests through the spatial index compared with looking at every shape
+and editing the vertices of a long trace compared with reading every point out of its QPolygonF.
+Run from the repository root, e.g. 'python -m test.benchmark_shapes --shapes 50000'"""
+import argparse
+import math
+import os
+import random
+import subprocess
+import sys
+import time
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+import numpy as np
+from PySide6.QtCore import QObject, QPointF, QRectF, QSize, Signal
+from PySide6.QtGui import QBrush, QImage, QPainter, QPen
+from PySide6.QtWidgets import QApplication, QGraphicsScene, QGraphicsSceneMouseEvent
+
+from taplt.ui.annotation_group import AnnotationGroup
+from taplt.ui.shape import Shape
+
+VARIANTS = ('item', 'object')
+
+
+class ShapeSignals(QObject):
+    """the QObject part and the signals every shape had as QGraphicsObject"""
+    hover_enter = Signal()
+    hover_exit = Signal()
+    clicked = Signal(QGraphicsSceneMouseEvent)
+    selected = Signal()
+    deselected = Signal()
+    mode_changed = Signal(int)
+    deleted = Signal()
+    drawingDone = Signal()
+    sChange = Signal(int)
+
+
+def connect_legacy(group: AnnotationGroup, shape: Shape):
+    """gives a shape a QObject with signals and makes the connections the group made for each shape"""
+    shape.signals = ShapeSignals()
+    shape.signals.selected.connect(lambda: group.shape_selected(shape))
+    shape.signals.deleted.connect(lambda: group.remove_shapes(shape))
+    shape.signals.mode_changed.connect(lambda mode: group.shape_mode_changed(shape, mode))
+    shape.signals.drawingDone.connect(group.set_label)
+    shape.signals.sChange.connect(group.sChange.emit)
+
+
+def legacy_closest_vertex(shape: Shape, point: QPointF) -> int:
+    """the nearest vertex found from an array built out of the QPolygonF on every call"""
+    points = np.asarray([[_pt.x(), _pt.y()] for _pt in shape.vertices.vertices])
+    return int(np.argmin(np.sum((points - np.asarray([point.x(), point.y()])) ** 2, axis=1)))
+
+
+def legacy_paint_vertices(shape: Shape, painter: QPainter):
+    """draws the squares of the vertices one by one"""
+    size = shape.vertex_size / 2
+    for _vertex in shape.vertices.vertices:
+        painter.setPen(QPen(shape.line_color, 0.5))
+        painter.setBrush(QBrush(shape.brush_color))
+        painter.drawRect(QRectF(_vertex - QPointF(size, size), _vertex + QPointF(size, size)))
+
+
+def random_polygon(rng: random.Random, image_size: QSize, num_points: int) -> Shape:
+    x, y = rng.uniform(50, image_size.width() - 50), rng.uniform(50, image_size.height() - 50)
+    radius = rng.uniform(5, 40)
+    points = [QPointF(x + radius * math.cos(2 * math.pi * i / num_points),
+                      y + radius * math.sin(2 * math.pi * i / num_points)) for i in range(num_points)]
+    return Shape(image_size, "Nucleus", points, shape_type='polygon', group_id=0)
+
+
+def resident_memory() -> int:
+    """the resident memory of the process in bytes, 0 where /proc is not available"""
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return 0
+
+
+def benchmark_variant(variant: str, num_shapes: int, num_points: int):
+    """creates the shapes of a dense annotation layer and adds them to a group in a scene"""
+    image_size = QSize(100000, 100000)
+    scene = QGraphicsScene()
+    group = AnnotationGroup()
+    scene.addItem(group)
+    rng = random.Random(0)
+    memory = resident_memory()
+
+    start = time.perf_counter()
+    shapes = [random_polygon(rng, image_size, num_points) for _ in range(num_shapes)]
+    if variant == 'object':
+        for shape in shapes:
+            connect_legacy(group, shape)
+    created = time.perf_counter() - start
+    start = time.perf_counter()
+    group.add_shapes(shapes)
+    added = time.perf_counter() - start
+    memory = resident_memory() - memory
+
+    print("shapes as {:6s}: create {:8.3f} s, add {:8.3f} s, {:8.1f} MiB ({:.0f} bytes per shape)".format(
+        variant, created, added, memory / 1048576, memory / num_shapes))
+
+
+def benchmark_rendering(num_shapes: int, num_points: int, frames: int = 5):
+    """draws the whole image and a zoomed in part, from the AnnotationLayer and with all shapes shown as items"""
+    image_size = QSize(100000, 100000)
+    scene = QGraphicsScene()
+    group = AnnotationGroup()
+    scene.addItem(group)
+    rng = random.Random(0)
+    shapes = [random_polygon(rng, image_size, num_points) for _ in range(num_shapes)]
+    group.add_shapes(shapes)
+    target = QImage(1920, 1080, QImage.Format.Format_ARGB32_Premultiplied)
+    views = {'whole image': QRectF(0, 0, image_size.width(), image_size.height()),
+             'zoomed in': QRectF(50000, 50000, 1920, 1080)}
+
+    def render(source: QRectF) -> float:
+        start = time.perf_counter()
+        for _ in range(frames):
+            painter = QPainter(target)
+            scene.render(painter, QRectF(target.rect()), source)
+            painter.end()
+        return (time.perf_counter() - start) / frames
+
+    batched = {name: render(source) for name, source in views.items()}
+    for shape in shapes:
+        group.shape_activated(shape)
+    for name, source in views.items():
+        print("draw {:12s}: batched {:8.4f} s, as items {:8.4f} s per frame".format(name, batched[name],
+                                                                                   render(source)))
+
+
+def benchmark_hit_testing(num_shapes: int, num_points: int, num_queries: int = 1000):
+    """finds the shapes at random positions of an AnnotationGroup, like the mouse does when it is moved"""
+    image_size = QSize(100000, 100000)
+    group = AnnotationGroup()
+    rng = random.Random(0)
+    shapes = [random_polygon(rng, image_size, num_points) for _ in range(num_shapes)]
+    group.add_shapes(shapes)
+    positions = [QPointF(rng.uniform(0, image_size.width()), rng.uniform(0, image_size.height()))
+                 for _ in range(num_queries)]
+
+    start = time.perf_counter()
+    for position in positions:
+        group.shape_at(position)
+    indexed = (time.perf_counter() - start) / num_queries
+    start = time.perf_counter()
+    for position in positions[:num_queries // 10]:
+        [shape for shape in shapes if shape.boundingRect().contains(position) and shape.contains(position)]
+    linear = (time.perf_counter() - start) / (num_queries // 10)
+    print("hit test: indexed {:8.6f} s, linear {:8.6f} s per point".format(indexed, linear))
+
+
+def benchmark_vertex_editing(num_points: int = 10000, num_moves: int = 100):
+    """drags the vertices of a long trace around, finding the nearest vertex and drawing them on every move,
+    and serializes the trace"""
+    image_size = QSize(100000, 100000)
+    rng = random.Random(0)
+    points = [QPointF(rng.uniform(0, 1000), rng.uniform(0, 1000)) for _ in range(num_points)]
+    shape = Shape(image_size, "Nucleus", points, shape_type='trace', group_id=0)
+    positions = [QPointF(rng.uniform(0, 1000), rng.uniform(0, 1000)) for _ in range(num_moves)]
+    target = QImage(1000, 1000, QImage.Format.Format_ARGB32_Premultiplied)
+
+    def edit(closest_vertex, paint_vertices) -> float:
+        start = time.perf_counter()
+        for position in positions:
+            shape.move_vertex(closest_vertex(shape, position), position)
+            painter = QPainter(target)
+            paint_vertices(shape, painter)
+            painter.end()
+        return (time.perf_counter() - start) / num_moves
+
+    def serialize(points_of) -> float:
+        start = time.perf_counter()
+        for _ in range(10):
+            points_of(shape)
+        return (time.perf_counter() - start) / 10
+
+    arrays = edit(lambda _shape, point: _shape.vertices.closest_vertex(np.asarray([point.x(), point.y()])),
+                  lambda _shape, painter: _shape.vertices.paint(painter))
+    legacy = edit(legacy_closest_vertex, legacy_paint_vertices)
+    print("edit {} vertices: arrays {:8.4f} s, QPolygonF {:8.4f} s per move".format(num_points, arrays, legacy))
+    arrays = serialize(lambda _shape: _shape.to_dict())
+    legacy = serialize(lambda _shape: [[_pt.x(), _pt.y()] for _pt in _shape.vertices.vertices])
+    print("serialize {} vertices: arrays {:8.4f} s, QPolygonF {:8.4f} s".format(num_points, arrays, legacy))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--shapes", type=int, default=50000)
+    parser.add_argument("--points", type=int, default=12)
+    parser.add_argument("--variant", choices=VARIANTS, help="benchmark one variant, otherwise each in a new process")
+    args = parser.parse_args()
+
+    if args.variant is None:
+        # separate processes, so memory freed by one variant does not hide the allocations of the other
+        for variant in VARIANTS:
+            subprocess.run([sys.executable, "-m", "test.benchmark_shapes", "--shapes", str(args.shapes),
+                            "--points", str(args.points), "--variant", variant], check=True)
+        app = QApplication()
+        benchmark_rendering(args.shapes, args.points)
+        benchmark_hit_testing(args.shapes, args.points)
+        benchmark_vertex_editing()
+    else:
+        app = QApplication()
+        benchmark_variant(args.variant, args.shapes, args.points)
@@ -0,0 +1,32 @@
+"""Tests of the GridIndex, run from the repository root, e.g. 'python -m pytest test/test_spatial_index.py'"""
+from PySide6.QtCore import QPointF, QRectF
+
+from taplt.utils.spatial_index import GridIndex
+
+
+def test_remove_leaves_no_keys_in_cells():
+    # the width is not representable, so the right edge computed from the stored bounds rounds into another cell
+    index = GridIndex(cell_size=256)
+    index.insert(1, QRectF(-508.4160354761944, 0, 1020.4160354761945, 10))
+    index.remove(1)
+    assert len(index) == 0
+    assert not index.cells
+
+
+def test_insert_replaces_previous_rect():
+    index = GridIndex(cell_size=256)
+    index.insert(1, QRectF(-508.4160354761944, 0, 1020.4160354761945, 10))
+    index.insert(1, QRectF(1000, 1000, 10, 10))
+    assert index.query_point(QPointF(511.9, 5)) == []
+    assert index.query_point(QPointF(1005, 1005)) == [1]
+    assert set(key for cell in index.cells.values() for key in cell) == {1}
+
+
+def test_large_rects_are_found_everywhere():
+    index = GridIndex(cell_size=10)
+    index.insert("large", QRectF(0, 0, 1000, 1000))
+    index.insert("small", QRectF(5, 5, 2, 2))
+    assert sorted(index.query_point(QPointF(6, 6))) == ["large", "small"]
+    assert index.query_point(QPointF(900, 900)) == ["large"]
+    index.remove("large")
+    assert index.query_point(QPointF(900, 900)) == []